@@ -1,82 +1,184 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
 from langchain_core.runnables import (
+    Runnable,
     RunnableLambda,
     RunnablePassthrough,
 )
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
 
 from llm_reviewer.git import Git
+from llm_reviewer.diff import split_hunks, get_file_path, format_file_change
+from llm_reviewer.budget import (
+    ChangeFilter,
+    get_token_counter,
+    pack_changes,
+    pack_documents,
+)
 from llm_reviewer.llm import (
     LLM,
     AcceptableLLMModels,
     PromptTemplate,
     AcceptableLLMProviders,
 )
-from llm_reviewer.vector_store import VectorStore
-from llm_reviewer.embeddings import Embedding, AcceptableEmbeddings
+from llm_reviewer.vector_store import (
+    IVectorStore,
+    get_vector_store,
+    get_vector_store_backend,
+)
+from llm_reviewer.embeddings import Embedding, get_embedding_backend
+from llm_reviewer.resources import resource_pool, ResourceKind
+from llm_reviewer.stages import StageGraph
+from llm_reviewer.tracing import tracer, summarize, Span
+from llm_reviewer.progress import log, get_streamlit, attach_to_thread
+from llm_reviewer.ingestion import IngestionManifest, sync_documents, remove_document
 from llm_reviewer.documents import (
-    convert_to_markdown,
     format_docs,
-    format_and_save_json_response,
+    FindingsParser,
+    get_response_path,
+    save_json_response,
+    merge_findings,
+    render_review_markdown,
 )
 
-from typing import Optional, List
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    List,
+    Set,
+    Tuple,
+)
 import os
-import importlib.resources
+import sys
+import time
+import hashlib
+import threading
+
+
+class ReviewMode:
+    SINGLE = "single"
+    MAP_REDUCE = "map_reduce"
+
 
-import streamlit as st
+class ReviewFormat:
+    LLM = "llm"
+    LOCAL = "local"
 
 
 def load_embeddings():
-    generic_embedding = Embedding(embedding=AcceptableEmbeddings.OPEN_AI)
-    return generic_embedding.embedding
+    backend = get_embedding_backend()
+    return resource_pool.get(
+        (ResourceKind.EMBEDDING, backend),
+        lambda: Embedding(
+            embedding=backend,
+            cache_path=os.environ.get("EMBEDDING_CACHE_PATH"),
+        ).embedding,
+    )
+
+
+def vector_store_key():
+    return (
+        ResourceKind.VECTOR_STORE,
+        get_vector_store_backend(),
+        os.path.abspath(os.environ["DB_PATH"]),
+        os.environ["COLLECTION_NAME"],
+    )
 
 
-def load_store(documents: Optional[List[Document]] = None) -> VectorStore:
-    st.write("🪣 Loading vector store")
-    print("🪣 Loading vector store")
+def load_store(documents: Optional[List[Document]] = None) -> IVectorStore:
+    log("🪣 Loading vector store")
 
     embedding = load_embeddings()
-    return VectorStore().load(
-        path=os.environ["DB_PATH"],
-        collection_name=os.environ["COLLECTION_NAME"],
-        embedding=embedding,
-        documents=documents,
+
+    def create_store():
+        return get_vector_store().load(
+            path=os.environ["DB_PATH"],
+            collection_name=os.environ["COLLECTION_NAME"],
+            embedding=embedding,
+            documents=documents,
+        )
+
+    with tracer.span("load_store"):
+        if documents:
+            return resource_pool.put(vector_store_key(), create_store())
+
+        return resource_pool.get(vector_store_key(), create_store)
+
+
+def invalidate_knowledge_base():
+    """
+    Drops the pooled vector store so the next review reopens it from disk.
+    """
+    if resource_pool.invalidate(ResourceKind.VECTOR_STORE):
+        get_vector_store().clear_cache()
+
+
+def load_manifest() -> IngestionManifest:
+    return IngestionManifest(
+        os.path.join(
+            os.environ["DB_PATH"], f"{os.environ['COLLECTION_NAME']}.manifest.json"
+        )
     )
 
 
-def create_vector_loader() -> VectorStore:
-    st.write("🪣 Creating vector loader")
-    print("🪣 Creating vector loader")
-    documents = convert_to_markdown()
-    docs = [Document(page_content=doc) for doc in documents]
+def sync_knowledge_base(file_name: Optional[str] = None) -> IVectorStore:
+    """
+    Converts, embeds and upserts only the docs that are new or changed since
+    the last sync, deleting the vectors of removed docs.
+    """
+    log("🔄 Syncing knowledge base")
+
+    st = get_streamlit()
+    progress_bar = st.progress(0.0) if st else None
+
+    def report_progress(done: int, total: int, current_file: str):
+        if progress_bar:
+            progress_bar.progress(
+                done / total, text=f"📄 {current_file} ({done}/{total})"
+            )
+        print(f"📄 Ingested {current_file} ({done}/{total})")
+
+    vector_store = load_store()
+    workers = os.environ.get("INGESTION_WORKERS")
+    sync_documents(
+        vector_store,
+        load_manifest(),
+        file_names=[file_name] if file_name else None,
+        max_workers=int(workers) if workers else None,
+        batch_size=int(os.environ.get("INGESTION_BATCH_SIZE", "64")),
+        on_progress=report_progress,
+    )
+    return vector_store
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    split_docs = text_splitter.split_documents(docs)
 
-    return load_store(split_docs)
+def create_vector_loader() -> IVectorStore:
+    log("🪣 Creating vector loader")
+    invalidate_knowledge_base()
+    return sync_knowledge_base()
 
 
 def save_vector_store_documents(file_name: Optional[str] = None):
-    st.write("🪣 Saving vector store")
-    print("🪣 Saving vector store")
+    log("🪣 Saving vector store")
+    sync_knowledge_base(file_name)
 
-    embedding = load_embeddings()
-    vector_store = VectorStore().load(
+
+def remove_vector_store_documents(file_name: str):
+    log(f"🗑️ Removing {file_name} from vector store")
+    # Deleting by id embeds nothing, so the embedding model is not loaded
+    # unless a review already did
+    vector_store = resource_pool.peek(vector_store_key()) or get_vector_store().load(
         path=os.environ["DB_PATH"],
         collection_name=os.environ["COLLECTION_NAME"],
-        embedding=embedding,
+        embedding=None,
     )
-
-    documents = convert_to_markdown(file_name=file_name)
-    docs = [Document(page_content=doc) for doc in documents]
-
-    vector_store.save_documents(docs)
+    remove_document(vector_store, load_manifest(), file_name)
 
 
-def load_knowledge_base() -> VectorStore:
+def load_knowledge_base() -> IVectorStore:
     if os.path.exists(os.environ["DB_PATH"]):
         db = load_store()
         return db
@@ -85,71 +187,490 @@ def load_knowledge_base() -> VectorStore:
         return new_db
 
 
+def load_llm_model(model: AcceptableLLMModels, provider: AcceptableLLMProviders):
+    api_key = os.environ.get("API_KEY", "")
+    key = (
+        ResourceKind.LLM,
+        provider.value,
+        model.model_name,
+        os.environ.get("API_URL"),
+        hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+    )
+    return resource_pool.get(key, lambda: LLM(model=model, provider=provider).model)
+
+
 def load_conversation_model():
-    st.write("🤖 Loading conversation llm model")
-    print("🤖 Loading conversation llm model")
-    llm = LLM(
+    log("🤖 Loading conversation llm model")
+    return load_llm_model(
         model=AcceptableLLMModels.CONVERSATION_MODEL,
         provider=AcceptableLLMProviders.OPENAI,
     )
-    return llm.model
 
 
 def load_code_model():
-    st.write("🧑‍💻 Loading coder llm model")
-    print("🧑‍💻 Loading coder llm model")
-    llm = LLM(
+    log("🧑‍💻 Loading coder llm model")
+    return load_llm_model(
         model=AcceptableLLMModels.CODE_MODEL, provider=AcceptableLLMProviders.OPENAI
     )
-    return llm.model
 
 
 def map_review_to_format(chain_output):
-    st.write(f"🔍 Mapping review to format")
-    print(f"🔍 Mapping review to format")
+    log(f"🔍 Mapping review to format")
     return {"reviewed_code": chain_output}
 
 
-def get_pull_request_diff():
-    git = Git(token=os.environ["GIT_TOKEN"])
-    return git.get_diff(
-        project_id=os.environ["GIT_PROJECT_ID"],
-        merge_request_iid=os.environ["GIT_MERGE_REQUEST_IID"],
+def load_git() -> Git:
+    return Git.get_client(token=os.environ["GIT_TOKEN"])
+
+
+def get_merge_request_ref(
+    project_id: Optional[str] = None, merge_request_iid: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Returns the merge request to review, defaulting to the one configured in
+    `GIT_PROJECT_ID` and `GIT_MERGE_REQUEST_IID`.
+    """
+    return (
+        project_id or os.environ["GIT_PROJECT_ID"],
+        merge_request_iid or os.environ["GIT_MERGE_REQUEST_IID"],
     )
 
 
-def write_merge_request_comment(comment: str):
-    git = Git(token=os.environ["GIT_TOKEN"])
-    git.write_comment(
-        project_id=os.environ["GIT_PROJECT_ID"],
-        merge_request_iid=os.environ["GIT_MERGE_REQUEST_IID"],
-        comment=comment,
+def get_pull_request_changes(
+    project_id: Optional[str] = None,
+    merge_request_iid: Optional[str] = None,
+    git: Optional[Git] = None,
+) -> Iterator[str]:
+    """
+    Yields the changes of the merge request, one per file, as the pages of
+    its diff are fetched.
+    """
+    git = git or load_git()
+    project_id, merge_request_iid = get_merge_request_ref(project_id, merge_request_iid)
+    return (
+        format_file_change(change)
+        for change in git.iter_changes(
+            project_id=project_id, merge_request_iid=merge_request_iid
+        )
     )
 
 
-def run_review():
-    knowledgeBase = load_knowledge_base()
-    llm_code_model = load_code_model()
-    context_prompt = LLM.load_prompt(prompt=PromptTemplate.CONTEXT)
-    llm_conversation_model = load_conversation_model()
-    response_prompt = LLM.load_prompt(prompt=PromptTemplate.RESPONSE)
+def get_pull_request_diff_refs(
+    project_id: Optional[str] = None,
+    merge_request_iid: Optional[str] = None,
+    git: Optional[Git] = None,
+) -> Dict[str, str]:
+    git = git or load_git()
+    project_id, merge_request_iid = get_merge_request_ref(project_id, merge_request_iid)
+    return git.get_diff_refs(project_id=project_id, merge_request_iid=merge_request_iid)
+
+
+def get_pull_request_compare_changes(
+    from_sha: str,
+    to_sha: str,
+    project_id: Optional[str] = None,
+    git: Optional[Git] = None,
+):
+    git = git or load_git()
+    return git.get_compare_changes(
+        project_id=project_id or os.environ["GIT_PROJECT_ID"],
+        from_sha=from_sha,
+        to_sha=to_sha,
+    )
 
-    pull_request = get_pull_request_diff()
 
-    embedding = load_embeddings()
+def is_pull_request_ancestor(
+    ancestor_sha: str,
+    sha: str,
+    project_id: Optional[str] = None,
+    git: Optional[Git] = None,
+) -> bool:
+    git = git or load_git()
+    return git.is_ancestor(
+        project_id=project_id or os.environ["GIT_PROJECT_ID"],
+        ancestor_sha=ancestor_sha,
+        sha=sha,
+    )
+
 
-    retriever = knowledgeBase.get_retriever_from_similar(
-        query=pull_request, embeddings=embedding
+def load_cache(feature: str):
+    """
+    Returns the Redis cache module when the `feature` env flag is enabled.
+    """
+    if os.environ.get(feature) != "true":
+        return None
+
+    # Imported here so the CLI keeps working without Redis configured
+    from llm_reviewer.streamlit import cache
+
+    return cache
+
+
+def merge_previous_findings(
+    findings: Optional[List[dict]],
+    previous_findings: List[dict],
+    changed_files: Set[str],
+) -> List[dict]:
+    """
+    Merges the findings of an incremental review with those of the previous
+    review, dropping previous findings of files changed since then.
+    """
+    kept = [
+        finding
+        for finding in previous_findings
+        if str(finding.get("file", "")) not in changed_files
+    ]
+    return merge_findings((findings or []) + kept)
+
+
+def review_changes(
+    code_review_chain,
+    changes: List[str],
+    context: str,
+    unparsed: Optional[List[str]] = None,
+    on_finding: Optional[Callable[[dict], None]] = None,
+):
+    """
+    Reviews each change as an independent unit, running at most
+    `REVIEW_MAX_CONCURRENCY` reviews at the same time, then merges the
+    findings into a single list.
+
+    The code model output is streamed and parsed as it is generated, so
+    `on_finding` is called with each finding as soon as it is complete,
+    while the other changes are still being reviewed. It only reports
+    progress: the findings are returned once every change is reviewed.
+
+    When `FINDINGS_CACHE` is enabled, findings are cached in Redis by (code
+    model, prompt, retrieved context, change content) and only the changes
+    missing from the cache are sent to the LLM.
+
+    Outputs that look like findings but can't be parsed are appended to
+    `unparsed` when it is given.
+    """
+    max_concurrency = int(os.environ.get("REVIEW_MAX_CONCURRENCY", "4"))
+    log(f"🧩 Reviewing {len(changes)} changes (concurrency: {max_concurrency})")
+
+    cache = load_cache("FINDINGS_CACHE")
+    keys: List[str] = []
+    cached: List[Optional[dict]] = [None] * len(changes)
+    if cache:
+        prompt_hash = LLM.prompt_hash(PromptTemplate.CONTEXT)
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        keys = [
+            cache.findings_key(
+                AcceptableLLMModels.CODE_MODEL.model_name,
+                prompt_hash,
+                context_hash,
+                hashlib.sha256(change.encode("utf-8")).hexdigest(),
+            )
+            for change in changes
+        ]
+        try:
+            cached = cache.get_findings(keys)
+        except Exception as e:
+            print("❌ Failed to read findings cache:", e)
+
+    started = time.perf_counter()
+    first_finding = threading.Lock()
+
+    def stream_change(change: str) -> Tuple[Dict[str, int], str, List[dict], bool]:
+        parser = FindingsParser()
+        usage: Dict[str, int] = {}
+        text: List[str] = []
+        findings: List[dict] = []
+        for chunk in code_review_chain.stream(change):
+            # Providers report the usage of a streamed call in its last chunk
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            text.append(chunk.content if isinstance(chunk, BaseMessage) else chunk)
+            for finding in parser.feed(text[-1]):
+                # Only the first finding of the whole review is timed
+                if not findings and first_finding.acquire(blocking=False):
+                    tracer.record("first_finding", time.perf_counter() - started)
+                findings.append(finding)
+                if on_finding:
+                    on_finding(finding)
+        parser.close()
+
+        if parser.malformed:
+            print(f"⚠️ Skipped {parser.malformed} malformed finding(s)")
+        return usage, "".join(text), findings, parser.complete
+
+    missing = [index for index, entry in enumerate(cached) if entry is None]
+    with tracer.span("code_review", changes=len(changes), reviewed=len(missing)):
+        outputs = RunnableLambda(stream_change).batch(
+            [changes[index] for index in missing],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+
+    findings = []
+    for index, entry in enumerate(cached):
+        if entry is not None:
+            findings.extend(entry["findings"])
+
+    for index, result in zip(missing, outputs):
+        if isinstance(result, Exception):
+            print("❌ Failed to review change:", result)
+            continue
+
+        usage, text, array_obj, complete = result
+        if not array_obj and not complete:
+            # An output without any object can't hold findings
+            if unparsed is not None and "{" in text:
+                unparsed.append(text)
+            continue
+
+        findings.extend(array_obj)
+        # Clean changes are cached too, outputs with a parse error are not
+        if cache and complete:
+            try:
+                cache.set_findings(
+                    {"findings": array_obj, "tokens": usage.get("total_tokens", 0)},
+                    keys[index],
+                    ttl=int(os.environ.get("FINDINGS_CACHE_TTL", "604800")),
+                    max_bytes=int(
+                        os.environ.get("FINDINGS_CACHE_MAX_BYTES", "67108864")
+                    ),
+                )
+            except Exception as e:
+                print("❌ Failed to write findings cache:", e)
+
+    if cache:
+        hits = [entry for entry in cached if entry is not None]
+        tokens_saved = sum(entry.get("tokens", 0) for entry in hits)
+        log(f"💾 Findings cache: {len(hits)} LLM calls and {tokens_saved} tokens saved")
+
+    return merge_findings(findings)
+
+
+def get_prompt_budget(context_prompt) -> Tuple[int, int]:
+    """
+    Splits the code model context window (`MODEL_CONTEXT_TOKENS`), without
+    the prompt and the `RESPONSE_TOKENS` kept free for the answer, between
+    the changes and the retrieved guidelines, which get at most
+    `CONTEXT_TOKENS`. Returns the budget of the changes and of the context.
+    """
+    count = get_token_counter(AcceptableLLMModels.CODE_MODEL.model_name)
+    available = (
+        int(os.environ.get("MODEL_CONTEXT_TOKENS", "8192"))
+        - int(os.environ.get("RESPONSE_TOKENS", "2048"))
+        - count(context_prompt.format(context="", input=""))
+    )
+    context_budget = min(int(os.environ.get("CONTEXT_TOKENS", "2000")), available // 2)
+    return available - context_budget, context_budget
+
+
+def pack_prompt(
+    changes: Iterable[str], budget: int, group: bool
+) -> Tuple[List[str], List[str], int, int]:
+    """
+    Drops lock files, generated code, assets, binary and rename-only changes,
+    summarizes large deletions and packs the other changes in units of at
+    most `budget` tokens. Each change is also split in the hunks used to
+    retrieve the guidelines.
+
+    All of this happens in a single pass, one change at a time, so a stream
+    of changes is never held in memory as a whole: only the units and the
+    hunks are kept.
+
+    Returns the units, the hunks and the tokens saved by the pre-filter and
+    by packing.
+    """
+    count = get_token_counter(AcceptableLLMModels.CODE_MODEL.model_name)
+    change_filter = ChangeFilter(
+        max_deleted_lines=int(os.environ.get("DIFF_MAX_DELETED_LINES", "200")),
+        count=count,
+    )
+    hunks: List[str] = []
+
+    def split(changes: Iterable[str]) -> Iterator[str]:
+        for change in changes:
+            hunks.extend(split_hunks(change))
+            yield change
+
+    with tracer.span("packing") as span:
+        units, cut = pack_changes(
+            split(change_filter.filter(changes)), budget, count, group=group
+        )
+        span.attributes.update(
+            files=change_filter.files,
+            units=len(units),
+            tokens_saved=change_filter.saved + cut,
+        )
+
+    for kind, paths in change_filter.skipped.items():
+        log(f"✂️ Skipped {len(paths)} {kind} file(s): {', '.join(paths[:5])}")
+    return units, hunks, change_filter.saved, cut
+
+
+def pack_context(documents: List[Document], budget: int) -> Tuple[str, int]:
+    """
+    Formats the best ranked guidelines that fit in `budget` tokens. Returns
+    the context and the number of tokens left out.
+    """
+    count = get_token_counter(AcceptableLLMModels.CODE_MODEL.model_name)
+    documents, cut = pack_documents(documents, budget, count)
+    return format_docs(documents), cut
+
+
+def write_merge_request_comment(
+    comment: str,
+    project_id: Optional[str] = None,
+    merge_request_iid: Optional[str] = None,
+    git: Optional[Git] = None,
+):
+    git = git or load_git()
+    project_id, merge_request_iid = get_merge_request_ref(project_id, merge_request_iid)
+
+    note_cache = load_cache("NOTE_ID_CACHE")
+    note_id = None
+    if note_cache:
+        note_id = note_cache.get_review_note_id(project_id, merge_request_iid)
+
+    with tracer.span("comment"):
+        written_note_id = git.write_comment(
+            project_id=project_id,
+            merge_request_iid=merge_request_iid,
+            comment=comment,
+            note_id=note_id,
+        )
+
+    if note_cache and written_note_id != note_id:
+        note_cache.set_review_note_id(project_id, merge_request_iid, written_note_id)
+
+
+def prepare_review(
+    project_id: Optional[str] = None,
+    merge_request_iid: Optional[str] = None,
+    head_sha: Optional[str] = None,
+) -> Optional[Tuple[Runnable, List[str], Callable[[str], Any]]]:
+    """
+    Loads everything a review needs and builds its chain. Reviews the merge
+    request configured in the environment unless one is given. A
+    `head_sha` (e.g. sent by the webhook) that the last incremental review
+    already covered is skipped without calling GitLab.
+
+    Returns the chain, the units to invoke it with and a callback that
+    saves and posts the generated review, or None when there is nothing new
+    to review.
+    """
+    project_id, merge_request_iid = get_merge_request_ref(project_id, merge_request_iid)
+    review_state_cache = load_cache("INCREMENTAL_REVIEW")
+    review_mode = os.environ.get("REVIEW_MODE", ReviewMode.SINGLE)
+    # The context budget is reserved up front, so the changes can be packed
+    # while they are fetched, before the guidelines are retrieved
+    context_prompt = LLM.load_prompt(prompt=PromptTemplate.CONTEXT)
+    changes_budget, context_budget = get_prompt_budget(context_prompt)
+    # Merge requests are cached for this review only, so it sees their
+    # current state without evicting the ones of concurrent reviews
+    git = load_git().for_review()
+
+    def open_knowledge_base():
+        with tracer.span("knowledge_base"):
+            return load_knowledge_base()
+
+    def load_models():
+        with tracer.span("load_models"):
+            return (
+                load_code_model(),
+                load_conversation_model(),
+                LLM.load_prompt(prompt=PromptTemplate.RESPONSE),
+            )
+
+    def fetch_changes():
+        review_state = None
+        current_sha = None
+        if review_state_cache:
+            review_state = review_state_cache.get_review_state(
+                project_id, merge_request_iid
+            )
+            if review_state and review_state["head_sha"] == head_sha:
+                log("✅ Commit already reviewed")
+                return None
+
+            diff_refs = get_pull_request_diff_refs(project_id, merge_request_iid, git)
+            current_sha = diff_refs["head_sha"]
+            if review_state and review_state["head_sha"] == current_sha:
+                log("✅ No new commits since the last review")
+                return None
+
+            # After a force-push or a rebase the compare would bring in the
+            # target branch commits, so the whole merge request is reviewed
+            if review_state and not is_pull_request_ancestor(
+                review_state["head_sha"], current_sha, project_id, git
+            ):
+                log(
+                    f"⚠️ {review_state['head_sha'][:8]} is no longer in the "
+                    "history, reviewing the whole merge request"
+                )
+                review_state = None
+
+        changed_files: Set[str] = set()
+        with tracer.span("diff_fetch"):
+            if review_state:
+                log(f"🔁 Reviewing commits since {review_state['head_sha'][:8]}")
+                # The compare endpoint returns every change in one response
+                changes = get_pull_request_compare_changes(
+                    review_state["head_sha"], current_sha, project_id, git
+                )
+                changed_files = {get_file_path(change) for change in changes}
+            elif review_state_cache:
+                # Pinned to the recorded head: the merge request diff would
+                # already include a push landing after it was read
+                changes = get_pull_request_compare_changes(
+                    diff_refs["base_sha"], current_sha, project_id, git
+                )
+            else:
+                changes = get_pull_request_changes(project_id, merge_request_iid, git)
+            # The pages are filtered and packed as they arrive, so only the
+            # units and their hunks are kept
+            packed = pack_prompt(
+                changes, changes_budget, group=review_mode != ReviewMode.MAP_REDUCE
+            )
+        return packed, review_state, current_sha, changed_files
+
+    def retrieve(knowledge_base: IVectorStore, fetched):
+        if fetched is None:
+            return None
+
+        _, hunks, _, _ = fetched[0]
+        with tracer.span("retrieval"):
+            retriever = knowledge_base.get_retriever_from_hunks(
+                hunks=hunks,
+                max_chars=int(os.environ.get("RETRIEVAL_CONTEXT_CHARS", "4000")),
+            )
+        return retriever
+
+    # The diff is fetched while the knowledge base and the models load
+    graph = StageGraph()
+    graph.add("knowledge_base", open_knowledge_base)
+    graph.add("load_models", load_models)
+    graph.add("diff_fetch", fetch_changes)
+    graph.add("retrieval", retrieve, "knowledge_base", "diff_fetch")
+    stages = graph.run()
+    report_critical_path("prepare", graph)
+
+    if stages["diff_fetch"] is None:
+        return None
+
+    llm_code_model, llm_conversation_model, response_prompt = stages["load_models"]
+    packed, review_state, reviewed_sha, changed_files = stages["diff_fetch"]
+    units, _, prefilter_saved, changes_cut = packed
+    retriever = stages["retrieval"]
+
+    context, context_cut = pack_context(retriever.documents, context_budget)
+    packing_saved = changes_cut + context_cut
+    log(
+        f"✂️ Saved {prefilter_saved + packing_saved} tokens "
+        f"(pre-filter: {prefilter_saved}, packing: {packing_saved})"
     )
 
     mapping_step = RunnableLambda(map_review_to_format)
-    format_json_step = RunnableLambda(format_and_save_json_response)
 
     code_review_chain = (
-        {"context": retriever | format_docs, "input": RunnablePassthrough()}
+        {"context": RunnableLambda(lambda _: context), "input": RunnablePassthrough()}
         | context_prompt
         | llm_code_model
-        | StrOutputParser()
     )
 
     output_format_chain = (
@@ -159,31 +680,195 @@ def run_review():
         | StrOutputParser()
     )
 
-    final_chain = (
-        code_review_chain | format_json_step | mapping_step | output_format_chain
-    )
-
-    response = final_chain.invoke(pull_request)
+    review_format = os.environ.get("REVIEW_FORMAT", ReviewFormat.LLM)
+    reviewed_findings: List[dict] = []
+    unparsed_outputs: List[str] = []
+
+    def review(units: List[str]):
+        attach = attach_to_thread()
+
+        # Findings are logged as they are parsed. Formatting and posting
+        # still wait for all of them, since the review summarizes every one
+        def report_finding(finding: dict):
+            attach()
+            log(f"🔎 {finding.get('file', 'unknown')}:{finding.get('line', '-')}")
+
+        findings = review_changes(
+            code_review_chain, units, context, unparsed_outputs, report_finding
+        )
+        if review_state:
+            findings = merge_previous_findings(
+                findings, review_state["findings"], changed_files
+            )
+
+        reviewed_findings.extend(findings)
+        if not findings:
+            return None
+        return save_json_response(findings, project_id, merge_request_iid)
+
+    def format_review(reviewed_code: Optional[List[dict]]):
+        if review_format != ReviewFormat.LOCAL:
+            return mapping_step | output_format_chain
+
+        if unparsed_outputs:
+            log("⚠️ Some findings could not be parsed, formatting with the LLM")
+            return (
+                RunnableLambda(lambda findings: (findings or []) + unparsed_outputs)
+                | mapping_step
+                | output_format_chain
+            )
+
+        log("📝 Rendering review locally")
+        with tracer.span("render"):
+            return render_review_markdown(reviewed_code) if reviewed_code else ""
+
+    review_step = RunnableLambda(review)
+    final_chain = review_step | RunnableLambda(format_review)
+
+    def finish_review(response: str):
+        # Recorded even without findings, so the next run only reviews the
+        # commits pushed after this one
+        if review_state_cache and reviewed_sha:
+            review_state_cache.set_review_state(
+                project_id, merge_request_iid, reviewed_sha, reviewed_findings
+            )
+
+        if not response:
+            log("❌ No response generated")
+            return None
 
-    if response:
         response_str = str(response)
+        response_path = get_response_path(
+            project_id, merge_request_iid, "code_review.md"
+        )
 
-        with importlib.resources.path(
-            "llm_reviewer.response", "code_review.md"
-        ) as path:
-            with path.open("w", encoding="utf-8") as file:
+        def save_response():
+            with open(response_path, "w", encoding="utf-8") as file:
                 file.write(response_str)
-                if os.environ.get("POST_PULL_REQUEST_COMMENT"):
-                    write_merge_request_comment(comment=response_str)
 
-        st.write(f"🔥 Created code_review.md file")
-        print(f"🔥 Created code_review.md file")
+        # The comment is posted while the markdown file is written
+        graph = StageGraph()
+        graph.add("save", save_response)
+        if os.environ.get("POST_PULL_REQUEST_COMMENT"):
+            graph.add(
+                "comment",
+                lambda: write_merge_request_comment(
+                    comment=response_str,
+                    project_id=project_id,
+                    merge_request_iid=merge_request_iid,
+                    git=git,
+                ),
+            )
+        graph.run()
+
+        log(f"🔥 Created {response_path}")
         return response_str
-    else:
-        st.write("❌ No response generated")
-        print("❌ No response generated")
-        return None
+
+    return final_chain, units, finish_review
+
+
+def report_critical_path(name: str, graph: StageGraph) -> Span:
+    """
+    Prints the chain of stages that bounded the time of `graph` and records
+    it as a span named `name`.
+    """
+    path, seconds = graph.critical_path()
+    print(
+        f"🧭 Critical path of {name}: {' → '.join(path)} "
+        f"({seconds:.2f}s of {graph.elapsed:.2f}s)"
+    )
+    return tracer.record(
+        name,
+        graph.elapsed,
+        critical_path=" → ".join(path),
+        critical_path_seconds=seconds,
+    )
+
+
+def report_trace(spans: List[Span]) -> Dict[str, Dict[str, float]]:
+    """
+    Prints the time spent in each stage of a review and exports its spans.
+    """
+    summary = summarize(spans)
+    for stage, values in summary.items():
+        print(f"⏱️ {stage}: {values['seconds']:.2f}s ({int(values['count'])}x)")
+
+    try:
+        tracer.export(spans)
+    except Exception as e:
+        print("❌ Failed to export trace:", e)
+    return summary
+
+
+def run_review(
+    project_id: Optional[str] = None,
+    merge_request_iid: Optional[str] = None,
+    head_sha: Optional[str] = None,
+):
+    with tracer.collect() as spans:
+        with tracer.span("review"):
+            review = prepare_review(project_id, merge_request_iid, head_sha)
+            if review is None:
+                return None
+
+            final_chain, units, finish_review = review
+            response = final_chain.invoke(
+                units, config={"callbacks": [tracer.callback]}
+            )
+            result = finish_review(response)
+
+        report_trace(spans)
+        return result
+
+
+def stream_review(metrics: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    Runs a review yielding the markdown tokens as the conversation model
+    generates them. The time to first token, counted from the start of the
+    review, is stored in `metrics["time_to_first_token"]` and the time spent
+    in each stage in `metrics["stages"]` and the critical path of the stages
+    run before the review in `metrics["critical_path"]`.
+    """
+    with tracer.collect() as spans:
+        with tracer.span("review"):
+            started = time.perf_counter()
+            review = prepare_review()
+            if review is None:
+                return
+
+            final_chain, units, finish_review = review
+            chunks = []
+            for chunk in final_chain.stream(
+                units, config={"callbacks": [tracer.callback]}
+            ):
+                if not chunks:
+                    time_to_first_token = time.perf_counter() - started
+                    print(f"⏱️ Time to first token: {time_to_first_token:.2f}s")
+                    if metrics is not None:
+                        metrics["time_to_first_token"] = time_to_first_token
+
+                chunks.append(chunk)
+                yield chunk
+
+            finish_review("".join(chunks))
+
+        summary = report_trace(spans)
+        if metrics is not None:
+            metrics["stages"] = summary
+            for span in spans:
+                if span.name == "prepare":
+                    metrics["critical_path"] = span.attributes
+
+
+def main():
+    """
+    CLI entry point: streams the review to stdout as it is generated.
+    """
+    for chunk in stream_review():
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+    sys.stdout.write("\n")
 
 
 if __name__ == "__main__":
-    run_review()
+    main()
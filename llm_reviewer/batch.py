@@ -0,0 +1,326 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NotRequired,
+    Optional,
+    TypedDict,
+)
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+
+
+class ReviewJob(TypedDict):
+    project_id: str
+    mr_iid: str
+    head_sha: NotRequired[str]
+
+
+class JobStatus(TypedDict):
+    project_id: str
+    mr_iid: str
+    status: str
+    attempts: int
+    duration: float
+    error: Optional[str]
+    finished_at: float
+
+
+class JobState:
+    DONE = "done"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+# Called with the project id, the merge request iid and the head SHA the job
+# was enqueued for, if any
+ReviewFunction = Callable[[str, str, Optional[str]], Any]
+
+
+def job_id(job: ReviewJob) -> str:
+    return f"{job['project_id']}:{job['mr_iid']}"
+
+
+def parse_job(data: Dict) -> ReviewJob:
+    job: ReviewJob = {
+        "project_id": str(data["project_id"]),
+        "mr_iid": str(data["mr_iid"]),
+    }
+    if data.get("head_sha"):
+        job["head_sha"] = str(data["head_sha"])
+    return job
+
+
+class IJobQueue(ABC):
+    @abstractmethod
+    def next_job(self) -> Optional[ReviewJob]:
+        """
+        Returns the next job to review, or None when the queue is drained.
+        """
+        pass
+
+    @abstractmethod
+    def report(self, status: JobStatus):
+        pass
+
+
+class JsonlJobQueue(IJobQueue):
+    """
+    Reads one {"project_id", "mr_iid"} job per line of a JSONL file and
+    appends the status of each job to `status_path`. Jobs already marked as
+    done in the status file are skipped, so an interrupted batch can be run
+    again.
+    """
+
+    def __init__(self, path: str, status_path: Optional[str] = None):
+        self.path = path
+        self.status_path = status_path or f"{os.path.splitext(path)[0]}.status.jsonl"
+        self.__lock = threading.Lock()
+        self.__jobs = self.__read_jobs()
+
+    def __read_done(self) -> set:
+        done = set()
+        if not os.path.exists(self.status_path):
+            return done
+
+        with open(self.status_path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    status = json.loads(line)
+                    if status["status"] == JobState.DONE:
+                        done.add(job_id(status))
+        return done
+
+    def __read_jobs(self) -> Iterator[ReviewJob]:
+        done = self.__read_done()
+        with open(self.path, encoding="utf-8") as file:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    job = parse_job(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"❌ Invalid job on line {number} of {self.path}:", e)
+                    continue
+
+                if job_id(job) in done:
+                    print(f"⏭️ Skipping {job_id(job)}, already reviewed")
+                    continue
+                yield job
+
+    def next_job(self) -> Optional[ReviewJob]:
+        with self.__lock:
+            return next(self.__jobs, None)
+
+    def report(self, status: JobStatus):
+        with self.__lock:
+            with open(self.status_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(status) + "\n")
+
+
+class RedisJobQueue(IJobQueue):
+    """
+    Takes jobs from the Redis list `key` and stores the status of each job in
+    the hash `{key}:status`, keyed by "{project_id}:{mr_iid}".
+
+    Each job is moved to the list `{key}:processing:{consumer}` while it is
+    reviewed and only removed from it once its status is stored, so the jobs
+    of a batch that crashed are put back in the queue when a batch with the
+    same consumer name starts again. Batches draining the same list at the
+    same time need distinct consumer names.
+    """
+
+    def __init__(self, key: str, consumer: Optional[str] = None):
+        # Imported here so file based batches don't need Redis configured
+        from llm_reviewer.streamlit.cache import get_redis_client
+
+        self.key = key
+        self.status_key = f"{key}:status"
+        self.consumer = consumer or socket.gethostname()
+        self.processing_key = f"{key}:processing:{self.consumer}"
+        self.client = get_redis_client()
+        self.__lock = threading.Lock()
+        self.__claimed: Dict[str, List[bytes]] = {}
+        self.__requeue_unfinished()
+
+    def __requeue_unfinished(self):
+        requeued = 0
+        # Moved back from the newest, so the jobs keep their order
+        while self.client.lmove(self.processing_key, self.key, "RIGHT", "LEFT"):
+            requeued += 1
+        if requeued:
+            print(f"♻️ Requeued {requeued} unfinished job(s) of {self.consumer}")
+
+    def next_job(self) -> Optional[ReviewJob]:
+        while True:
+            value = self.client.lmove(self.key, self.processing_key, "LEFT", "RIGHT")
+            if value is None:
+                return None
+            try:
+                job = parse_job(json.loads(value.decode("utf-8")))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"❌ Invalid job in {self.key}:", e)
+                self.client.lrem(self.processing_key, 1, value)
+                continue
+
+            with self.__lock:
+                self.__claimed.setdefault(job_id(job), []).append(value)
+            return job
+
+    def report(self, status: JobStatus):
+        with self.__lock:
+            claimed = self.__claimed.pop(job_id(status), [])
+            value = claimed.pop(0) if claimed else None
+            if claimed:
+                self.__claimed[job_id(status)] = claimed
+
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.status_key, job_id(status), json.dumps(status))
+        if value is not None:
+            pipeline.lrem(self.processing_key, 1, value)
+        pipeline.execute()
+
+
+def review_job(
+    review: ReviewFunction, job: ReviewJob, max_retries: int, backoff: float
+) -> JobStatus:
+    """
+    Reviews a job, retrying failures up to `max_retries` times with an
+    exponential backoff starting at `backoff` seconds.
+    """
+    started = time.perf_counter()
+    error = None
+    attempts = 0
+    state = JobState.FAILED
+
+    while attempts <= max_retries:
+        if attempts:
+            time.sleep(backoff * 2 ** (attempts - 1))
+        attempts += 1
+
+        try:
+            response = review(job["project_id"], job["mr_iid"], job.get("head_sha"))
+            state = JobState.DONE if response else JobState.SKIPPED
+            error = None
+            break
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"❌ Review of {job_id(job)} failed (attempt {attempts}):", e)
+
+    return {
+        "project_id": job["project_id"],
+        "mr_iid": job["mr_iid"],
+        "status": state,
+        "attempts": attempts,
+        "duration": time.perf_counter() - started,
+        "error": error,
+        "finished_at": time.time(),
+    }
+
+
+def run_batch(
+    queue: IJobQueue,
+    review: ReviewFunction,
+    workers: int = 4,
+    max_retries: int = 2,
+    backoff: float = 1.0,
+) -> List[JobStatus]:
+    """
+    Drains `queue` reviewing up to `workers` merge requests at the same time.
+
+    A job is only taken from the queue when a worker is free, so a Redis
+    list can be shared by several batch processes. The status of each job
+    is reported to the queue as soon as it finishes.
+    """
+    statuses: List[JobStatus] = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight: Dict[Future, ReviewJob] = {}
+
+        def submit_next():
+            job = queue.next_job()
+            if job is not None:
+                print(f"🚚 Reviewing {job_id(job)}")
+                future = executor.submit(review_job, review, job, max_retries, backoff)
+                in_flight[future] = job
+
+        for _ in range(workers):
+            submit_next()
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.pop(future)
+                status = future.result()
+                queue.report(status)
+                statuses.append(status)
+                print(
+                    f"📋 {job_id(status)} {status['status']} after "
+                    f"{status['attempts']} attempt(s) in {status['duration']:.2f}s"
+                )
+                submit_next()
+
+    summary = {
+        state: sum(1 for status in statuses if status["status"] == state)
+        for state in (JobState.DONE, JobState.SKIPPED, JobState.FAILED)
+    }
+    print(
+        f"✅ Batch finished: {summary[JobState.DONE]} reviewed, "
+        f"{summary[JobState.SKIPPED]} skipped, {summary[JobState.FAILED]} failed"
+    )
+    return statuses
+
+
+def main():
+    """
+    CLI entry point: reviews every merge request of a JSONL file or a Redis
+    list.
+    """
+    parser = argparse.ArgumentParser(description="Review a queue of merge requests")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="JSONL file with one job per line")
+    source.add_argument("--redis", help="Redis list to take jobs from")
+    parser.add_argument(
+        "--consumer",
+        default=os.environ.get("BATCH_CONSUMER") or None,
+        help="Name of this batch among those draining the Redis list",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("BATCH_WORKERS", "4"))
+    )
+    parser.add_argument(
+        "--retries", type=int, default=int(os.environ.get("BATCH_MAX_RETRIES", "2"))
+    )
+    parser.add_argument(
+        "--backoff", type=float, default=float(os.environ.get("BATCH_BACKOFF", "5"))
+    )
+    args = parser.parse_args()
+
+    from llm_reviewer.app import run_review
+
+    queue = (
+        JsonlJobQueue(args.file)
+        if args.file
+        else RedisJobQueue(args.redis, args.consumer)
+    )
+    statuses = run_batch(
+        queue,
+        run_review,
+        workers=args.workers,
+        max_retries=args.retries,
+        backoff=args.backoff,
+    )
+    if any(status["status"] == JobState.FAILED for status in statuses):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
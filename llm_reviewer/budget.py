@@ -0,0 +1,237 @@
+from langchain_core.documents import Document
+from fnmatch import fnmatch
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import math
+import os
+
+from llm_reviewer.diff import FILE_PREFIX, get_file_path
+
+TokenCounter = Callable[[str], int]
+
+# Files that are never worth reviewing: lock files, generated code and assets
+DEFAULT_EXCLUDE = [
+    "*.lock",
+    "package-lock.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*.pb.go",
+    "*.generated.*",
+    "dist/*",
+    "build/*",
+    "vendor/*",
+    "node_modules/*",
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.ico",
+    "*.pdf",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.zip",
+]
+
+# Marker appended to a change cut to fit the context window
+TRUNCATED_MARKER = "[... {lines} lines omitted to fit the context window]"
+
+
+class ChangeKind:
+    REVIEW = "review"
+    EXCLUDED = "excluded"
+    BINARY = "binary"
+    EMPTY = "empty"
+    DELETION = "deletion"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: str) -> TokenCounter:
+    """
+    Counts tokens with the model's tiktoken encoding, or estimates them from
+    the text length when tiktoken (or the encoding) isn't available.
+    """
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return estimate_tokens
+
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def get_exclude_rules() -> List[str]:
+    extra = os.environ.get("DIFF_EXCLUDE", "")
+    return DEFAULT_EXCLUDE + [rule.strip() for rule in extra.split(",") if rule.strip()]
+
+
+def is_excluded(path: str, rules: List[str]) -> bool:
+    name = os.path.basename(path)
+    return any(
+        fnmatch(path, rule) or fnmatch(name, rule) or fnmatch(path, f"*/{rule}")
+        for rule in rules
+    )
+
+
+def classify_change(change: str, rules: List[str], max_deleted_lines: int) -> str:
+    path = get_file_path(change)
+    if is_excluded(path, rules):
+        return ChangeKind.EXCLUDED
+
+    body = change.split("\n", 1)[1] if "\n" in change else ""
+    if not body.strip():
+        # Renames and mode changes come without a diff
+        return ChangeKind.EMPTY
+    if body.startswith("Binary files") or "\nBinary files" in body:
+        return ChangeKind.BINARY
+
+    lines = body.splitlines()
+    added = sum(1 for line in lines if line.startswith("+"))
+    deleted = sum(1 for line in lines if line.startswith("-"))
+    if added == 0 and deleted > max_deleted_lines:
+        return ChangeKind.DELETION
+
+    return ChangeKind.REVIEW
+
+
+class ChangeFilter:
+    """
+    Drops the changes not worth sending to the model and replaces large
+    deletions by a one line summary.
+
+    Changes are filtered one at a time as they are consumed, so a stream of
+    changes is never held in memory. The skipped file paths by `ChangeKind`
+    and the number of tokens saved are accumulated in `skipped` and `saved`.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[List[str]] = None,
+        max_deleted_lines: int = 200,
+        count: TokenCounter = estimate_tokens,
+    ):
+        self.rules = get_exclude_rules() if rules is None else rules
+        self.max_deleted_lines = max_deleted_lines
+        self.count = count
+        self.files = 0
+        self.skipped: Dict[str, List[str]] = {}
+        self.saved = 0
+
+    def filter(self, changes: Iterable[str]) -> Iterator[str]:
+        for change in changes:
+            self.files += 1
+            kind = classify_change(change, self.rules, self.max_deleted_lines)
+            if kind == ChangeKind.REVIEW:
+                yield change
+                continue
+
+            path = get_file_path(change)
+            self.skipped.setdefault(kind, []).append(path)
+            if kind == ChangeKind.DELETION:
+                deleted = sum(1 for line in change.splitlines() if line.startswith("-"))
+                summary = f"{FILE_PREFIX}{path}\n[{deleted} lines deleted]"
+                self.saved += self.count(change) - self.count(summary)
+                yield summary
+            else:
+                self.saved += self.count(change)
+
+
+def fit_change(
+    change: str, budget: int, count: TokenCounter
+) -> Tuple[Optional[str], int]:
+    """
+    Cuts a change on line boundaries so it fits in `budget` tokens, always
+    keeping its `File:` header. Returns the change, or None when not even
+    the header fits, and the number of tokens cut.
+    """
+    tokens = count(change)
+    if tokens <= budget:
+        return change, 0
+
+    header, *lines = change.splitlines()
+    marker_tokens = count(TRUNCATED_MARKER.format(lines=len(lines)))
+    size = count(header) + 1
+    if size + marker_tokens > budget:
+        return None, tokens
+
+    kept: List[str] = []
+    for line in lines:
+        line_tokens = count(line) + 1
+        if size + line_tokens > budget - marker_tokens:
+            break
+        kept.append(line)
+        size += line_tokens
+
+    kept.append(TRUNCATED_MARKER.format(lines=len(lines) - len(kept)))
+    fitted = "\n".join([header] + kept)
+    return fitted, tokens - count(fitted)
+
+
+def pack_changes(
+    changes: Iterable[str], budget: int, count: TokenCounter, group: bool = True
+) -> Tuple[List[str], int]:
+    """
+    Builds the units sent to the model, each fitting in `budget` tokens.
+
+    With `group` the changes are packed together in as few units as
+    possible, otherwise each change is its own unit. Changes are consumed
+    one at a time, so only the units are held in memory. Returns the units and
+    the number of tokens cut from changes too large for a unit.
+    """
+    units: List[str] = []
+    current: List[str] = []
+    size = 0
+    cut = 0
+
+    for change in changes:
+        change, change_cut = fit_change(change, budget, count)
+        cut += change_cut
+        if change is None:
+            continue
+        if not group:
+            units.append(change)
+            continue
+
+        # Two newlines join the changes of a unit
+        tokens = count(change) + 1
+        if current and size + tokens > budget:
+            units.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(change)
+        size += tokens
+
+    if current:
+        units.append("\n\n".join(current))
+    return units, cut
+
+
+def pack_documents(
+    documents: List[Document], budget: int, count: TokenCounter
+) -> Tuple[List[Document], int]:
+    """
+    Keeps the best ranked documents that fit in `budget` tokens. Returns the
+    documents and the number of tokens left out.
+    """
+    kept: List[Document] = []
+    size = 0
+    dropped = 0
+    for document in documents:
+        tokens = count(document.page_content) + 1
+        if size + tokens > budget:
+            dropped += tokens
+            continue
+        kept.append(document)
+        size += tokens
+    return kept, dropped
@@ -0,0 +1,99 @@
+from typing import List, TypedDict
+import difflib
+
+FILE_PREFIX = "File: "
+HUNK_PREFIX = "@@"
+
+
+class FileChange(TypedDict):
+    """
+    A changed file of a merge request. Joining `hunks` gives back its diff.
+    """
+
+    path: str
+    old_path: str
+    hunks: List[str]
+    new_file: bool
+    renamed_file: bool
+    deleted_file: bool
+    binary: bool
+    too_large: bool
+
+
+def split_diff(diff: str) -> List[str]:
+    """
+    Splits the diff of a file into its hunks, keeping line endings. Lines
+    before the first hunk header (like "Binary files ... differ") are a hunk
+    of their own.
+    """
+    hunks: List[str] = []
+    for line in diff.splitlines(keepends=True):
+        if line.startswith(HUNK_PREFIX) or not hunks:
+            hunks.append(line)
+        else:
+            hunks[-1] += line
+    return hunks
+
+
+def diff_blobs(old: str, new: str) -> str:
+    """
+    Builds the unified diff of two versions of a file, without the file
+    header lines, like the diffs returned by GitLab.
+    """
+    lines = difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=3)
+    return "".join(f"{line}\n" for index, line in enumerate(lines) if index >= 2)
+
+
+def format_file_change(change: FileChange) -> str:
+    """
+    Formats a change as the text sent to the model: a line naming its file
+    followed by its diff.
+    """
+    return f"{FILE_PREFIX}{change['path']}\n" + "".join(change["hunks"])
+
+
+def get_file_path(change: str) -> str:
+    """
+    Returns the file path of a change built by `format_file_change`.
+    """
+    first_line = change.split("\n", 1)[0]
+    return first_line[len(FILE_PREFIX) :] if first_line.startswith(FILE_PREFIX) else ""
+
+
+def split_hunks(diff: str, max_chars: int = 1500) -> List[str]:
+    """
+    Splits changes built by `format_file_change` into hunks, each prefixed
+    with the line naming its file.
+
+    Hunks longer than `max_chars` are cut into windows on line boundaries,
+    since the embedding model truncates long inputs.
+    """
+    hunks: List[str] = []
+    file_line = ""
+    lines: List[str] = []
+
+    def flush():
+        window: List[str] = []
+        size = len(file_line)
+        for line in lines:
+            if window and size + len(line) + 1 > max_chars:
+                hunks.append("\n".join([file_line, *window]).strip())
+                window, size = [], len(file_line)
+            window.append(line)
+            size += len(line) + 1
+        if any(line.strip() for line in window):
+            hunks.append("\n".join([file_line, *window]).strip())
+        lines.clear()
+
+    for line in diff.splitlines():
+        if line.startswith(FILE_PREFIX):
+            flush()
+            file_line = line
+        elif line.startswith(HUNK_PREFIX):
+            flush()
+            lines.append(line)
+        else:
+            lines.append(line)
+    flush()
+
+    return hunks
@@ -1,51 +1,298 @@
-from langchain_docling import DoclingLoader
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Optional, List
 import os
 import json
 import re
 import importlib.resources
+from urllib.parse import quote
 
+if TYPE_CHECKING:
+    from docling.document_converter import DocumentConverter
+
+
+def get_docs_dir() -> str:
+    return os.path.normpath(os.path.join(os.path.dirname(__file__), "docs"))
+
+
+_converter: Optional["DocumentConverter"] = None
 
-def convert_to_markdown(file_name: Optional[str] = None):
-    docs_dir = os.path.join(os.path.dirname(__file__), "../llm_reviewer/docs")
-    file_paths = [
-        os.path.join(docs_dir, f)
-        for f in os.listdir(docs_dir)
-        if os.path.isfile(os.path.join(docs_dir, f))
-    ]
 
-    files = [f"{docs_dir}/{file_name}"] if file_name else file_paths
-    loader = DoclingLoader(files)
-    documents = loader.load()
-    markdown_docs = [doc.page_content for doc in documents]
-    return markdown_docs
+def convert_file_to_markdown(path: str) -> List[str]:
+    """
+    Converts a single file, reusing one Docling converter per process so
+    its models are loaded only once by each ingestion worker.
+    """
+    # Docling is imported on first use, it loads its models on import
+    from docling.document_converter import DocumentConverter
+    from langchain_docling import DoclingLoader
+
+    global _converter
+    if _converter is None:
+        _converter = DocumentConverter()
+
+    loader = DoclingLoader(path, converter=_converter)
+    return [doc.page_content for doc in loader.lazy_load()]
 
 
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
 
-def format_and_save_json_response(chain_output):
-    match = re.search(r"\[\s*\{.*\}\s*\]", chain_output, re.DOTALL)
-    if match:
-        json_str = match.group(0).strip()
-        try:
-            array_obj = json.loads(json_str)
-            print("✅ JSON processed with success!")
+# Characters that change the state of `FindingsParser`
+STRING_TOKEN = re.compile(r'["\\]')
+OBJECT_TOKEN = re.compile(r'[{}\[\]"]')
+ARRAY_TOKEN = re.compile(r"[{\]]")
+ARRAY_START = re.compile(r"\[\s*")
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+class FindingsParser:
+    """
+    Incremental parser for the JSON array of findings written by the code
+    model. Text is fed as it is generated and each finding is returned as
+    soon as its object closes, in a single pass over the output.
+
+    Objects that don't parse are skipped and counted in `malformed`, so one
+    syntax slip of the model only loses that finding. Text around the
+    array, like markdown fences, is ignored. `arrays` counts the arrays
+    read up to their closing bracket, empty ones included.
+    """
+
+    def __init__(self):
+        self.malformed = 0
+        self.arrays = 0
+        self.__buffer = ""
+        self.__position = 0
+        self.__in_array = False
+        self.__in_string = False
+        self.__start: Optional[int] = None
+        self.__depth = 0
+
+    def __load(self, text: str) -> Optional[dict]:
+        for candidate in (text, TRAILING_COMMA.sub(r"\1", text)):
+            try:
+                finding = json.loads(candidate, strict=False)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(finding, dict):
+                return finding
+        self.malformed += 1
+        return None
+
+    def feed(self, text: str) -> List[dict]:
+        """
+        Consumes the next piece of the output and returns the findings
+        closed by it.
+        """
+        findings: List[dict] = []
+        buffer = self.__buffer + text
+        position = self.__position
+        while position < len(buffer):
+            if self.__in_string:
+                match = STRING_TOKEN.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                elif match.group() == "\\":
+                    # Skips the escaped character, once it has arrived
+                    if match.end() == len(buffer):
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                else:
+                    self.__in_string = False
+                    position = match.end()
+
+            elif self.__start is not None:
+                match = OBJECT_TOKEN.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                    continue
+
+                position = match.end()
+                if match.group() == '"':
+                    self.__in_string = True
+                elif match.group() in "{[":
+                    self.__depth += 1
+                else:
+                    self.__depth -= 1
+                    if self.__depth == 0:
+                        finding = self.__load(buffer[self.__start : position])
+                        if finding is not None:
+                            findings.append(finding)
+                        self.__start = None
+
+            elif self.__in_array:
+                match = ARRAY_TOKEN.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                elif match.group() == "{":
+                    self.__start = match.start()
+                    self.__depth = 1
+                    position = match.end()
+                else:
+                    self.__in_array = False
+                    self.arrays += 1
+                    position = match.end()
+
+            else:
+                # An array of findings starts with "[" followed by "{" or "]"
+                match = ARRAY_START.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                elif match.end() == len(buffer):
+                    position = match.start()
+                    break
+                elif buffer[match.end()] == "{":
+                    self.__in_array = True
+                    position = match.end()
+                elif buffer[match.end()] == "]":
+                    self.arrays += 1
+                    position = match.end() + 1
+                else:
+                    position = match.start() + 1
 
-            with importlib.resources.path(
-                "llm_reviewer.response", "code_review.json"
-            ) as path:
-                with path.open("w", encoding="utf-8") as file:
-                    json.dump(array_obj, file, indent=4, ensure_ascii=False)
+        # Only the object being read is kept
+        keep = self.__start if self.__start is not None else position
+        self.__buffer = buffer[keep:]
+        self.__position = position - keep
+        if self.__start is not None:
+            self.__start = 0
+        return findings
 
-            print("📂 JSON response saved in 'llm_reviewer.response.code_review.json'")
-            return array_obj
+    @property
+    def complete(self) -> bool:
+        """
+        Whether an array was read whole and every finding in it parsed, so
+        an empty result means the model found nothing.
+        """
+        return self.arrays > 0 and not self.malformed
 
-        except json.JSONDecodeError as e:
-            print("❌ JSON Decode error:", e)
+    def close(self):
+        """
+        Ends the output, counting an object left open as malformed.
+        """
+        if self.__start is not None:
+            self.malformed += 1
+        self.__buffer = ""
+        self.__position = 0
+        self.__in_array = False
+        self.__in_string = False
+        self.__start = None
+
+
+def get_response_path(project_id: str, merge_request_iid: str, file_name: str) -> str:
+    """
+    Returns the path of `file_name` in the folder of a merge request's
+    review, `<REVIEW_OUTPUT_DIR>/<project_id>/<merge_request_iid>`, creating
+    it. Defaults to the `llm_reviewer.response` package.
+    """
+    output_dir = os.environ.get("REVIEW_OUTPUT_DIR") or str(
+        importlib.resources.files("llm_reviewer.response")
+    )
+    directory = os.path.join(
+        output_dir, quote(str(project_id), safe=""), str(merge_request_iid)
+    )
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, file_name)
+
+
+def save_json_response(
+    array_obj: List[dict], project_id: str, merge_request_iid: str
+) -> List[dict]:
+    path = get_response_path(project_id, merge_request_iid, "code_review.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(array_obj, file, indent=4, ensure_ascii=False)
+
+    print(f"📂 JSON response saved in '{path}'")
+    return array_obj
+
+
+def merge_findings(findings: List[dict]) -> List[dict]:
+    """
+    Merges the findings of several partial reviews, keeping the first
+    occurrence of each (file, line, problem).
+    """
+    merged = []
+    seen = set()
+    for finding in findings:
+        if not isinstance(finding, dict):
+            continue
+
+        key = (
+            str(finding.get("file", "")).strip(),
+            str(finding.get("line", "")).strip(),
+            " ".join(str(finding.get("problem", "")).lower().split()),
+        )
+        if key in seen:
+            continue
+
+        seen.add(key)
+        merged.append(finding)
+
+    return merged
+
+
+def code_block(code: str) -> str:
+    code = str(code).strip()
+    if code.startswith("```"):
+        return code
+    return f"```\n{code}\n```"
+
+
+def render_review_markdown(findings: List[dict]) -> str:
+    """
+    Renders the findings with the layout of `prompts/response.md` without
+    calling the conversation model. Sections that need prose the findings
+    don't have are summarized from the findings themselves.
+    """
+    findings = merge_findings(findings)
+    files: Dict[str, int] = {}
+    for finding in findings:
+        file = str(finding.get("file", "unknown"))
+        files[file] = files.get(file, 0) + 1
+
+    lines = [
+        "# Code Review Documentation",
+        "",
+        "## Overview",
+        f"This review covers the changes of {len(files)} file(s) in the pull "
+        f"request and lists {len(findings)} issue(s) that do not follow the "
+        "project guidelines.",
+        "",
+        "## Code Issues and Modifications",
+        "",
+    ]
 
-    else:
-        print("❌ No JSON found")
+    for number, finding in enumerate(findings, start=1):
+        problem = str(finding.get("problem", "")).strip()
+        lines.append(f"{number}. {problem.splitlines()[0] if problem else 'Issue'}")
+        lines.append(f"- **File:** {finding.get('file', 'unknown')}")
+        lines.append(f"- **Line:** {finding.get('line', '-')}")
+        lines.append(f"- **Problem:** {problem}")
+        if finding.get("impact"):
+            lines.append(f"- **Impact:** {finding['impact']}")
+        if finding.get("suggestion"):
+            lines.append(f"- **Suggestion:** {finding['suggestion']}")
+        for key, label in (("before", "Before"), ("after", "After")):
+            if finding.get(key):
+                lines.append(f"- **{label}:**")
+                lines.append(code_block(finding[key]))
+        lines.append("")
 
-    return None
+    lines.append("## Summary of Findings")
+    lines.extend(
+        f"- `{file}`: {count} issue(s)"
+        for file, count in sorted(files.items(), key=lambda item: -item[1])
+    )
+    lines.extend(
+        [
+            "",
+            "## Impact of Changes",
+            f"Applying the {len(findings)} suggestion(s) above aligns the changed "
+            "code with the guidelines used in this review.",
+            "",
+            "## Conclusion",
+            f"The review found {len(findings)} issue(s) in {len(files)} file(s). "
+            "Address them before merging the pull request.",
+        ]
+    )
+    return "\n".join(lines) + "\n"
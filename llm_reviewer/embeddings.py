@@ -1,24 +1,253 @@
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from collections import OrderedDict
+from array import array
+from typing import Callable, Dict, List, Optional
+import hashlib
+import os
+import sqlite3
+import threading
+import time
 
 
 class AcceptableEmbeddings:
-    OPEN_AI = "OPEN_AI"
+    HUGGING_FACE = "huggingface"
+    ONNX = "onnx"
+    # Former name of the Hugging Face backend, it never used OpenAI
+    OPEN_AI = HUGGING_FACE
+
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+EmbeddingLoader = Callable[[], Embeddings]
+
+embedding_backends: Dict[str, EmbeddingLoader] = {}
+
+
+def register_embedding(name: str):
+    """
+    Registers the function loading the embedding model of a backend.
+    """
+
+    def decorator(loader: EmbeddingLoader) -> EmbeddingLoader:
+        embedding_backends[name] = loader
+        return loader
+
+    return decorator
+
+
+def get_embedding_backend() -> str:
+    return os.environ.get("EMBEDDING_BACKEND") or AcceptableEmbeddings.HUGGING_FACE
+
+
+def get_embedding_model() -> str:
+    return os.environ.get("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL
+
+
+@register_embedding(AcceptableEmbeddings.HUGGING_FACE)
+def load_hugging_face() -> Embeddings:
+    # Imported on first use, it pulls in torch and transformers
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=get_embedding_model(),
+        encode_kwargs={
+            "batch_size": int(os.environ.get("EMBEDDING_BATCH_SIZE") or "32")
+        },
+    )
+
+
+@register_embedding(AcceptableEmbeddings.ONNX)
+def load_onnx() -> Embeddings:
+    from llm_reviewer.onnx_embeddings import DEFAULT_ONNX_FILE, OnnxEmbeddings
+
+    return OnnxEmbeddings.from_pretrained(
+        get_embedding_model(),
+        file=os.environ.get("EMBEDDING_ONNX_FILE") or DEFAULT_ONNX_FILE,
+        batch_size=int(os.environ.get("EMBEDDING_BATCH_SIZE") or "32"),
+        threads=int(os.environ.get("EMBEDDING_THREADS") or "0"),
+        max_length=int(os.environ.get("EMBEDDING_MAX_LENGTH") or "384"),
+    )
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of another embedding model.
+
+    Vectors are keyed by (model name, SHA-256 of the text), kept in an
+    in-memory LRU and persisted as float32 blobs in SQLite. The disk cache is
+    capped at `max_entries` rows, evicting the least recently used ones.
+    """
+
+    QUERY = "query"
+    DOCUMENT = "document"
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        model_name: str,
+        path: str,
+        max_entries: int = 100_000,
+        memory_entries: int = 2_048,
+    ):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.__lock = threading.Lock()
+        self.__memory: OrderedDict[str, List[float]] = OrderedDict()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        self.__db.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used "
+            "ON embeddings (model, last_used)"
+        )
+        self.__db.commit()
+
+    @staticmethod
+    def __hash(kind: str, text: str) -> str:
+        return hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def __remember(self, key: str, vector: List[float]):
+        self.__memory[key] = vector
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        on_disk = []
+        for key in keys:
+            if key in self.__memory:
+                self.__memory.move_to_end(key)
+                found[key] = self.__memory[key]
+            else:
+                on_disk.append(key)
+
+        for start in range(0, len(on_disk), 500):
+            batch = on_disk[start : start + 500]
+            rows = self.__db.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? "
+                f"AND hash IN ({','.join('?' * len(batch))})",
+                [self.model_name, *batch],
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f", blob).tolist()
+                self.__remember(key, vector)
+                found[key] = vector
+
+        if found:
+            now = time.time()
+            self.__db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                [(now, self.model_name, key) for key in found],
+            )
+            self.__db.commit()
+
+        return found
+
+    def __store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        self.__db.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (self.model_name, key, array("f", vector).tobytes(), now)
+                for key, vector in vectors.items()
+            ],
+        )
+        for key, vector in vectors.items():
+            self.__remember(key, vector)
+
+        (count,) = self.__db.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+        ).fetchone()
+        if count > self.max_entries:
+            self.__db.execute(
+                "DELETE FROM embeddings WHERE model = ? AND hash IN ("
+                "SELECT hash FROM embeddings WHERE model = ? "
+                "ORDER BY last_used LIMIT ?)",
+                (self.model_name, self.model_name, count - self.max_entries),
+            )
+        self.__db.commit()
+
+    def __embed(self, kind: str, texts: List[str]) -> List[List[float]]:
+        keys = [self.__hash(kind, text) for text in texts]
+
+        with self.__lock:
+            found = self.__lookup(list(dict.fromkeys(keys)))
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+
+        if missing:
+            if kind == self.QUERY:
+                embedded = [
+                    self.embedding.embed_query(text) for text in missing.values()
+                ]
+            else:
+                embedded = self.embedding.embed_documents(list(missing.values()))
+
+            new_vectors = dict(zip(missing.keys(), embedded))
+            with self.__lock:
+                self.__store(new_vectors)
+            found.update(new_vectors)
+
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.__embed(self.DOCUMENT, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.__embed(self.QUERY, [text])[0]
+
+    def stats(self) -> Dict[str, float]:
+        with self.__lock:
+            (disk_entries,) = self.__db.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()
+            memory_entries = len(self.__memory)
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries,
+        }
 
 
 class Embedding:
     embedding = None
 
-    def __init__(self, embedding: AcceptableEmbeddings):
+    def __init__(self, embedding: str, cache_path: Optional[str] = None):
         self.__load(embedding)
+        if cache_path and self.embedding is not None:
+            self.embedding = CachedEmbeddings(
+                embedding=self.embedding,
+                model_name=getattr(self.embedding, "model_name", embedding),
+                path=cache_path,
+                max_entries=int(
+                    os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "100000")
+                ),
+            )
 
-    def __load_open_ai(self):
-        self.embedding = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-mpnet-base-v2"
-        )
-
-    def __load(self, embedding: AcceptableEmbeddings):
-        if embedding == AcceptableEmbeddings.OPEN_AI:
-            self.__load_open_ai()
-        else:
+    def __load(self, embedding: str):
+        loader = embedding_backends.get(embedding)
+        if loader is None:
             print("No embedding loaded")
             return None
+        self.embedding = loader()
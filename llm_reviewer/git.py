@@ -1,55 +1,330 @@
 import gitlab
-from gitlab.exceptions import GitlabAuthenticationError
-import os
-from typing import Any, Dict
+from gitlab.exceptions import (
+    GitlabAuthenticationError,
+    GitlabGetError,
+    GitlabHttpError,
+    GitlabUpdateError,
+)
+import requests
+from requests.adapters import HTTPAdapter
+import copy
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-git_base_url = os.environ["GIT_BASE_URL"]
+from llm_reviewer.diff import FileChange, diff_blobs, format_file_change, split_diff
+from llm_reviewer.resources import resource_pool, ResourceKind
+from llm_reviewer.tracing import tracer
+from llm_reviewer.settings import settings
+
+# Keep-alive connections kept open per host
+POOL_SIZE = 10
+
+# Heading that identifies the note written by the reviewer
+REVIEW_NOTE_MARKER = "Code Review Documentation"
+
+# Changed files fetched per page of the merge request diffs (GitLab's maximum)
+DIFF_PAGE_SIZE = 100
+
+# Files larger than this are not fetched to rebuild a diff GitLab left out
+MAX_BLOB_BYTES = 1_000_000
 
 
 class Git:
-    def __init__(self, token: str, url=git_base_url):
-        self.gl = gitlab.Gitlab(url=url, private_token=token)
+    def __init__(self, token: str, url: Optional[str] = None):
+        url = url or settings.git_base_url
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        self.gl = gitlab.Gitlab(url=url, private_token=token, session=session)
+        self.__lock = threading.Lock()
+        self.__merge_requests: Dict[Tuple[str, str], Any] = {}
+
+    @staticmethod
+    def get_client(token: str, url: Optional[str] = None) -> "Git":
+        """
+        Returns the process-wide client for (url, token), so its HTTP session
+        and authentication are reused by every review.
+        """
+        url = url or settings.git_base_url
+        key = (
+            ResourceKind.GIT,
+            url,
+            hashlib.sha256(token.encode("utf-8")).hexdigest(),
+        )
+        return resource_pool.get(key, lambda: Git(token=token, url=url))
 
     def auth(self):
+        # `gl.user` is set once authenticated, and shared by `for_review` copies
+        if self.gl.user is not None:
+            return
+
+        with self.__lock:
+            if self.gl.user is not None:
+                return
+
+            try:
+                self.gl.auth()
+            except GitlabAuthenticationError as e:
+                raise RuntimeError(
+                    "Falha na autenticação: verifique se o token é válido "
+                    "e se tem scope `api` ou `read_api`"
+                ) from e
+
+    def for_review(self) -> "Git":
+        """
+        Returns a client sharing this one's HTTP session and authentication
+        with a merge request cache of its own, so each review sees fresh
+        merge request state without evicting the one of concurrent reviews.
+        """
+        review = copy.copy(self)
+        review.__merge_requests = {}
+        return review
+
+    def __get_project(self, project_id: int | str):
+        # Lazy objects only build API paths, they don't fetch anything
+        return self.gl.projects.get(project_id, lazy=True)
+
+    def __get_merge_request(
+        self, project_id: int | str, merge_request_iid: int | str, lazy: bool = True
+    ):
+        if lazy:
+            return self.__get_project(project_id).mergerequests.get(
+                merge_request_iid, lazy=True
+            )
+
+        key = (str(project_id), str(merge_request_iid))
+        with self.__lock:
+            mr_obj = self.__merge_requests.get(key)
+        if mr_obj is None:
+            mr_obj = self.__get_project(project_id).mergerequests.get(merge_request_iid)
+            with self.__lock:
+                self.__merge_requests[key] = mr_obj
+        return mr_obj
+
+    def __read_blob(
+        self, project_id: int | str, path: str, ref: str
+    ) -> Optional[bytes]:
+        """
+        Reads a file at `ref`, or returns None when it has more than
+        `MAX_BLOB_BYTES`.
+        """
+        content = bytearray()
+        for chunk in self.__get_project(project_id).files.raw(
+            file_path=path, ref=ref, iterator=True
+        ):
+            content.extend(chunk)
+            if len(content) > MAX_BLOB_BYTES:
+                return None
+        return bytes(content)
+
+    def __diff_from_blobs(
+        self, project_id: int | str, change: Dict[str, Any], refs: Dict[str, str]
+    ) -> Optional[Tuple[str, bool]]:
+        """
+        Rebuilds the diff of a file from its versions before and after the
+        change. Returns the diff and whether the file is binary, or None
+        when a version is too large.
+        """
+        old = (
+            b""
+            if change.get("new_file")
+            else self.__read_blob(project_id, change["old_path"], refs["base_sha"])
+        )
+        new = self.__read_blob(project_id, change["new_path"], refs["head_sha"])
+        if old is None or new is None:
+            return None
+        if b"\0" in old or b"\0" in new:
+            return (
+                f"Binary files a/{change['old_path']} and b/{change['new_path']} "
+                "differ\n",
+                True,
+            )
+        return (
+            diff_blobs(
+                old.decode("utf-8", errors="replace"),
+                new.decode("utf-8", errors="replace"),
+            ),
+            False,
+        )
+
+    def __to_file_change(
+        self,
+        project_id: int | str,
+        change: Dict[str, Any],
+        get_refs: Callable[[], Dict[str, str]],
+    ) -> FileChange:
+        diff = change.get("diff") or ""
+        binary = diff.startswith("Binary files")
+        # GitLab leaves out the diff of the files it flags as too large
+        too_large = bool(change.get("too_large") or change.get("collapsed"))
+        if too_large and not change.get("deleted_file"):
+            rebuilt = self.__diff_from_blobs(project_id, change, get_refs())
+            if rebuilt is not None:
+                (diff, binary), too_large = rebuilt, False
+
+        old_path = change.get("old_path") or change.get("new_path") or "unknown"
+        return {
+            "path": change.get("new_path") or old_path,
+            "old_path": old_path,
+            "hunks": split_diff(diff),
+            "new_file": bool(change.get("new_file")),
+            "renamed_file": bool(change.get("renamed_file")),
+            "deleted_file": bool(change.get("deleted_file")),
+            "binary": binary,
+            "too_large": too_large,
+        }
+
+    def iter_changes(
+        self,
+        project_id: int | str,
+        merge_request_iid: int | str,
+        page_size: int = DIFF_PAGE_SIZE,
+    ) -> Iterator[FileChange]:
+        """
+        Yields the changed files of a merge request as the pages of its diffs
+        are fetched, so a single page is kept in memory.
+
+        Files GitLab marked as too large are diffed from their raw versions.
+        Falls back to the changes endpoint on GitLab versions without the
+        paginated diffs endpoint (before 15.7).
+
+        The time spent fetching, without the time the caller spends on each
+        file, is recorded as the `git.get_changes` span once the stream ends.
+        """
+        self.auth()
+        mr_obj = self.__get_merge_request(project_id, merge_request_iid)
+
+        refs: Dict[str, str] = {}
+
+        def get_refs() -> Dict[str, str]:
+            if not refs:
+                refs.update(
+                    self.__get_merge_request(
+                        project_id, merge_request_iid, lazy=False
+                    ).diff_refs
+                )
+            return refs
+
+        elapsed = 0.0
+        files = 0
+        started = time.perf_counter()
         try:
-            self.gl.auth()
-        except GitlabAuthenticationError as e:
-            raise RuntimeError(
-                "Falha na autenticação: verifique se o token é válido "
-                "e se tem scope `api` ou `read_api`"
-            ) from e
-
-    def get_diff(self, project_id: int | str, merge_request_iid: int):
+            try:
+                diffs = self.gl.http_list(
+                    f"{mr_obj.manager.path}/{mr_obj.encoded_id}/diffs",
+                    iterator=True,
+                    per_page=page_size,
+                )
+            except GitlabHttpError as e:
+                if e.response_code != 404:
+                    raise
+                diffs = iter(mr_obj.changes()["changes"])
+
+            for change in diffs:
+                file_change = self.__to_file_change(project_id, change, get_refs)
+                elapsed += time.perf_counter() - started
+                files += 1
+                yield file_change
+                started = time.perf_counter()
+            elapsed += time.perf_counter() - started
+        finally:
+            tracer.record("git.get_changes", elapsed, files=files)
+
+    @tracer.traced("git.get_diff_refs")
+    def get_diff_refs(
+        self, project_id: int | str, merge_request_iid: int
+    ) -> Dict[str, str]:
+        """
+        Returns the base and head SHAs of the merge request diff.
+        """
         self.auth()
-        project_obj = self.gl.projects.get(project_id)
-        mr_obj = project_obj.mergerequests.get(merge_request_iid)
-        diffs = mr_obj.changes()
-        all_diffs = []
-        for change in diffs["changes"]:
-            file_info = (
-                f"File: {change.get('new_path', change.get('old_path', 'unknown'))}\n"
-            )
-            all_diffs.append(file_info + change["diff"])
-        return "\n\n".join(all_diffs)
+        mr_obj = self.__get_merge_request(project_id, merge_request_iid, lazy=False)
+        return dict(mr_obj.diff_refs)
 
-    def write_comment(
-        self, project_id: int | str, merge_request_iid: int | str, comment: str
-    ):
+    @tracer.traced("git.get_compare_changes")
+    def get_compare_changes(
+        self, project_id: int | str, from_sha: str, to_sha: str
+    ) -> List[str]:
+        """
+        Returns the diff between two commits as one entry per changed file.
+        """
+        self.auth()
+        project_obj = self.__get_project(project_id)
+        compare = project_obj.repository_compare(from_sha, to_sha)
+        refs = {"base_sha": from_sha, "head_sha": to_sha}
+        return [
+            format_file_change(self.__to_file_change(project_id, change, lambda: refs))
+            for change in compare["diffs"]
+        ]
+
+    @tracer.traced("git.is_ancestor")
+    def is_ancestor(self, project_id: int | str, ancestor_sha: str, sha: str) -> bool:
+        """
+        Tells whether `ancestor_sha` is still in the history of `sha`, which
+        stops being true when that history is rewritten (force-push, rebase).
+        """
         self.auth()
-        project_obj = self.gl.projects.get(project_id)
-        mr_obj = project_obj.mergerequests.get(merge_request_iid)
-        discussion_id = None
-        discussions = mr_obj.discussions.list()
+        project_obj = self.__get_project(project_id)
+        try:
+            merge_base = project_obj.repository_merge_base([ancestor_sha, sha])
+        except GitlabGetError:
+            # A rewritten commit may no longer exist in the repository
+            return False
+        return merge_base["id"] == ancestor_sha
+
+    @tracer.traced("git.find_review_note")
+    def find_review_note(
+        self, project_id: int | str, merge_request_iid: int | str
+    ) -> Optional[int]:
+        """
+        Scans the merge request discussions page by page, stopping at the
+        first note written by the reviewer.
+        """
+        self.auth()
+        mr_obj = self.__get_merge_request(project_id, merge_request_iid)
 
-        for discussion in discussions:
+        for discussion in mr_obj.discussions.list(iterator=True):
             discussion_notes = discussion.attributes.get("notes")
             if discussion_notes is not None:
                 for note in discussion_notes:
-                    if note.get("body").find("Code Review Documentation") != -1:
-                        discussion_id = note.get("id")
+                    if (note.get("body") or "").find(REVIEW_NOTE_MARKER) != -1:
+                        return note.get("id")
+
+        return None
+
+    @tracer.traced("git.write_comment")
+    def write_comment(
+        self,
+        project_id: int | str,
+        merge_request_iid: int | str,
+        comment: str,
+        note_id: Optional[int] = None,
+    ) -> int:
+        """
+        Creates or updates the reviewer note and returns its id.
+
+        When `note_id` is given the note is updated directly; the discussions
+        are only scanned when it is missing or no longer exists.
+        """
+        self.auth()
+        mr_obj = self.__get_merge_request(project_id, merge_request_iid)
+
+        if note_id is not None:
+            try:
+                mr_obj.notes.update(id=note_id, new_data={"body": comment})
+                return note_id
+            except GitlabUpdateError:
+                print(f"⚠️ Note {note_id} not found, searching the discussions")
+
+        discussion_id = self.find_review_note(project_id, merge_request_iid)
 
         if discussion_id is None:
-            mr_obj.notes.create({"body": comment})
-            return
+            note = mr_obj.notes.create({"body": comment})
+            return note.id
 
         mr_obj.notes.update(id=discussion_id, new_data={"body": comment})
+        return discussion_id
@@ -0,0 +1,262 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from llm_reviewer.documents import convert_file_to_markdown, get_docs_dir
+from llm_reviewer.vector_store import IVectorStore
+from llm_reviewer.tracing import tracer
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import os
+import time
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+ProgressCallback = Callable[[int, int, str], None]
+
+# Converts the file at a path to markdown, run in the ingestion workers
+Converter = Callable[[str], List[str]]
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(file_hash: str, offset: int) -> str:
+    return f"{file_hash}:{offset}"
+
+
+class IngestionManifest:
+    """
+    Tracks which files were ingested into the vector store, mapping each
+    file name to its content hash and the ids of its chunks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.files = json.load(file).get("files", {})
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def get(self, file_name: str) -> Optional[Dict]:
+        return self.files.get(file_name)
+
+    def set(self, file_name: str, file_hash: str, chunk_ids: List[str]):
+        self.files[file_name] = {"hash": file_hash, "chunk_ids": chunk_ids}
+
+    def remove(self, file_name: str) -> List[str]:
+        entry = self.files.pop(file_name, None)
+        return entry["chunk_ids"] if entry else []
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"files": self.files}, file, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def split_markdown(
+    file_name: str, file_hash: str, markdown: List[str]
+) -> Tuple[List[Document], List[str]]:
+    """
+    Splits a converted file into chunks whose ids are derived from the file
+    hash and the chunk offset.
+    """
+    document = Document(
+        page_content="\n\n".join(markdown), metadata={"source": file_name}
+    )
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    chunks = {
+        chunk_id(file_hash, chunk.metadata["start_index"]): chunk
+        for chunk in text_splitter.split_documents([document])
+    }
+    return list(chunks.values()), list(chunks.keys())
+
+
+def timed_convert_file(convert: Converter, path: str) -> Tuple[List[str], float]:
+    # Timed in the worker so the duration excludes the time spent queued
+    started = time.perf_counter()
+    markdown = convert(path)
+    return markdown, time.perf_counter() - started
+
+
+def convert_files(
+    paths: List[str],
+    max_workers: int,
+    convert: Converter = convert_file_to_markdown,
+) -> Iterator[Tuple[str, Optional[List[str]]]]:
+    """
+    Converts files to markdown in a process pool and yields each one as soon
+    as it is ready. At most `2 * max_workers` conversions are in flight, so
+    converted files never pile up in memory. Files that fail to convert are
+    yielded with `None`.
+
+    `convert` is sent to the worker processes, so it must be a module level
+    function.
+    """
+    if max_workers <= 1:
+        for path in paths:
+            try:
+                markdown, duration = timed_convert_file(convert, path)
+            except Exception as e:
+                print(f"❌ Failed to convert {path}:", e)
+                yield path, None
+                continue
+
+            tracer.record("convert_to_markdown", duration, file=os.path.basename(path))
+            yield path, markdown
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        remaining = iter(paths)
+        in_flight: Dict[Future, str] = {}
+
+        def submit_next():
+            path = next(remaining, None)
+            if path is not None:
+                in_flight[executor.submit(timed_convert_file, convert, path)] = path
+
+        for _ in range(2 * max_workers):
+            submit_next()
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                submit_next()
+                try:
+                    markdown, duration = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to convert {path}:", e)
+                    yield path, None
+                    continue
+
+                tracer.record(
+                    "convert_to_markdown", duration, file=os.path.basename(path)
+                )
+                yield path, markdown
+
+
+def sync_documents(
+    vector_store: IVectorStore,
+    manifest: IngestionManifest,
+    file_names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    batch_size: int = 64,
+    on_progress: Optional[ProgressCallback] = None,
+    convert: Converter = convert_file_to_markdown,
+) -> Dict[str, List[str]]:
+    """
+    Brings the vector store in line with the docs directory.
+
+    Only new or changed files are converted and embedded. Conversion runs in
+    `max_workers` processes and each converted file is split and written to
+    the store in batches of `batch_size` chunks as soon as it is ready.
+    `on_progress(done, total, file_name)` is called after each file.
+
+    When `file_names` is not given the whole directory is synced and the
+    vectors of files that no longer exist are deleted.
+    """
+    docs_dir = get_docs_dir()
+    existing = sorted(
+        f for f in os.listdir(docs_dir) if os.path.isfile(os.path.join(docs_dir, f))
+    )
+
+    if not manifest.exists() and vector_store.count() > 0:
+        print("⚠️ No ingestion manifest found, rebuilding the vector store")
+        vector_store.reset()
+        file_names = None
+
+    result: Dict[str, List[str]] = {
+        "added": [],
+        "updated": [],
+        "removed": [],
+        "unchanged": [],
+        "failed": [],
+    }
+
+    pending: Dict[str, Tuple[str, str]] = {}
+    for file_name in file_names if file_names is not None else existing:
+        if file_name not in existing:
+            continue
+
+        path = os.path.join(docs_dir, file_name)
+        file_hash = hash_file(path)
+        entry = manifest.get(file_name)
+        if entry and entry["hash"] == file_hash:
+            result["unchanged"].append(file_name)
+            continue
+
+        pending[path] = (file_name, file_hash)
+
+    workers = max_workers or os.cpu_count() or 1
+    for done, (path, markdown) in enumerate(
+        convert_files(list(pending), min(workers, len(pending)), convert), start=1
+    ):
+        file_name, file_hash = pending[path]
+        entry = manifest.get(file_name)
+
+        if markdown is None:
+            result["failed"].append(file_name)
+        else:
+            print(f"📄 Ingesting {file_name}")
+            chunks, ids = split_markdown(file_name, file_hash, markdown)
+            if entry:
+                new_ids = set(ids)
+                stale_ids = [id for id in entry["chunk_ids"] if id not in new_ids]
+                vector_store.delete_documents(stale_ids)
+            for start in range(0, len(chunks), batch_size):
+                vector_store.save_documents(
+                    chunks[start : start + batch_size],
+                    ids=ids[start : start + batch_size],
+                )
+
+            manifest.set(file_name, file_hash, ids)
+            manifest.save()
+            result["updated" if entry else "added"].append(file_name)
+
+        if on_progress:
+            on_progress(done, len(pending), file_name)
+
+    if file_names is None:
+        for file_name in [f for f in manifest.files if f not in existing]:
+            vector_store.delete_documents(manifest.remove(file_name))
+            result["removed"].append(file_name)
+        manifest.save()
+
+    print(
+        f"✅ Synced documents: {len(result['added'])} added, "
+        f"{len(result['updated'])} updated, {len(result['removed'])} removed, "
+        f"{len(result['failed'])} failed"
+    )
+    return result
+
+
+def remove_document(
+    vector_store: IVectorStore, manifest: IngestionManifest, file_name: str
+) -> List[str]:
+    """
+    Deletes the vectors of a single file and drops it from the manifest.
+    """
+    ids = manifest.remove(file_name)
+    vector_store.delete_documents(ids)
+    manifest.save()
+    return ids
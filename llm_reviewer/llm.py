@@ -1,16 +1,27 @@
-from langchain_ollama import ChatOllama
 from enum import Enum
 from langchain_core.prompts import ChatPromptTemplate
-import os
+import hashlib
 import importlib.resources as importlib
-from langchain_openai import ChatOpenAI
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Optional, Union
 from pydantic import SecretStr
 
+from llm_reviewer.settings import settings
+
+if TYPE_CHECKING:
+    from langchain_ollama import ChatOllama
+    from langchain_openai import ChatOpenAI
+
 
 class AcceptableLLMModels(Enum):
-    CODE_MODEL = os.environ["CODE_MODEL"]
-    CONVERSATION_MODEL = os.environ["CONVERSATION_MODEL"]
+    CODE_MODEL = "CODE_MODEL"
+    CONVERSATION_MODEL = "CONVERSATION_MODEL"
+
+    @property
+    def model_name(self) -> str:
+        """
+        The model configured in the environment variable named by the member.
+        """
+        return settings.require(self.value)
 
 
 class AcceptableLLMProviders(Enum):
@@ -33,24 +44,31 @@ class LLM:
         provider: AcceptableLLMProviders = AcceptableLLMProviders.OLLAMA,
     ):
         self.__llm_model = model
-        self.model: Optional[Union[ChatOllama, ChatOpenAI]] = None
+        self.model: Optional[Union["ChatOllama", "ChatOpenAI"]] = None
         self.__load(provider)
 
     def __load(self, provider: AcceptableLLMProviders):
-        base_url = os.environ.get("API_URL")
+        base_url = settings.api_url
 
+        # Provider clients are imported on first use, they are slow to import
         if provider == AcceptableLLMProviders.OLLAMA:
+            from langchain_ollama import ChatOllama
+
             self.model = ChatOllama(
-                model=self.__llm_model.value,
+                model=self.__llm_model.model_name,
                 base_url=base_url,
                 temperature=0.3,
             )
         elif provider == AcceptableLLMProviders.OPENAI:
+            from langchain_openai import ChatOpenAI
+
             self.model = ChatOpenAI(
-                model=self.__llm_model.value,
+                model=self.__llm_model.model_name,
                 base_url=base_url,
                 timeout=None,
-                api_key=SecretStr(os.environ["API_KEY"]),
+                api_key=SecretStr(settings.api_key),
+                # Reviews are streamed, usage is only reported when asked
+                stream_usage=True,
             )
 
     @staticmethod
@@ -59,3 +77,10 @@ class LLM:
             file = prompt_template.read()
 
         return ChatPromptTemplate.from_template(file)
+
+    @staticmethod
+    def prompt_hash(prompt: PromptTemplate) -> str:
+        with importlib.open_text(PROMPT_PATH, prompt.value) as prompt_template:
+            file = prompt_template.read()
+
+        return hashlib.sha256(file.encode("utf-8")).hexdigest()
@@ -0,0 +1,382 @@
+from uuid import uuid4
+from typing import Any, Dict, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import json
+import os
+import threading
+
+import numpy as np
+
+from llm_reviewer.vector_store import (
+    Hit,
+    IVectorStore,
+    ScoredDocumentsRetriever,
+    fuse_hits,
+)
+
+# Above this many live vectors the search goes through an HNSW index
+HNSW_THRESHOLD = 20_000
+
+# Deleted rows are compacted once they outnumber the live ones
+COMPACT_MIN_ROWS = 1_000
+
+
+class MmapVectorStore(IVectorStore):
+    """
+    In-process vector store for small knowledge bases.
+
+    Vectors are appended to a float32 matrix that is memory-mapped on load,
+    and documents are kept in a JSON sidecar, one row per vector. Deleted
+    or overwritten documents leave an empty row until the files are
+    compacted. Queries are answered by an exact batched search with NumPy,
+    or by an HNSW index once there are more than `hnsw_threshold` vectors.
+    Distances are squared L2, like Chroma's default.
+    """
+
+    def __init__(self, hnsw_threshold: Optional[int] = None):
+        self.path: Optional[str] = None
+        self.embedding: Optional[Embeddings] = None
+        self.hnsw_threshold = (
+            hnsw_threshold
+            if hnsw_threshold is not None
+            else int(os.environ.get("VECTOR_STORE_HNSW_THRESHOLD", HNSW_THRESHOLD))
+        )
+
+        self.__lock = threading.Lock()
+        self.__dimension = 0
+        self.__rows: List[Optional[Dict[str, Any]]] = []
+        self.__positions: Dict[str, int] = {}
+        self.__matrix = np.zeros((0, 0), dtype=np.float32)
+        self.__norms = np.zeros(0, dtype=np.float32)
+        self.__live = np.zeros(0, dtype=bool)
+        self.__index: Any = None
+
+    def __file(self, extension: str) -> str:
+        return f"{self.path}.{extension}"
+
+    def load(
+        self,
+        path: str,
+        collection_name: str,
+        embedding: Embeddings,
+        documents: Optional[List[Document]] = None,
+    ):
+        """
+        Opens the collection stored in `path`, creating it if needed, and
+        adds `documents` to it.
+        """
+        store = MmapVectorStore(hnsw_threshold=self.hnsw_threshold)
+        os.makedirs(path, exist_ok=True)
+        store.path = os.path.join(path, collection_name)
+        store.embedding = embedding
+        store.__open()
+
+        if documents:
+            store.save_documents(documents)
+            print("🪣 Created vector store")
+        return store
+
+    def __open(self):
+        sidecar = self.__file("documents.json")
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding="utf-8") as file:
+                data = json.load(file)
+            self.__dimension = data["dimension"]
+            self.__rows = data["rows"]
+        else:
+            self.__dimension = 0
+            self.__rows = []
+
+        self.__positions = {
+            row["id"]: position
+            for position, row in enumerate(self.__rows)
+            if row is not None
+        }
+        self.__live = np.array([row is not None for row in self.__rows], dtype=bool)
+        self.__map()
+        self.__index = None
+        if self.count() > self.hnsw_threshold:
+            self.__load_index()
+
+    def __map(self):
+        """
+        Maps the vectors of the rows in the sidecar. Vectors are written
+        before the sidecar, so extra vectors in the file are ignored.
+        """
+        rows = len(self.__rows)
+        if not rows:
+            self.__matrix = np.zeros((0, self.__dimension), dtype=np.float32)
+            self.__norms = np.zeros(0, dtype=np.float32)
+            return
+
+        matrix = np.memmap(self.__file("vectors.f32"), dtype=np.float32, mode="r")
+        self.__matrix = matrix[: rows * self.__dimension].reshape(
+            rows, self.__dimension
+        )
+        self.__norms = np.einsum("ij,ij->i", self.__matrix, self.__matrix)
+
+    def __load_index(self):
+        import hnswlib
+
+        index = hnswlib.Index(space="l2", dim=self.__dimension)
+        path = self.__file("hnsw")
+        if os.path.exists(path):
+            index.load_index(path, max_elements=len(self.__rows))
+            if index.get_current_count() != len(self.__rows):
+                index = None
+        else:
+            index = None
+
+        if index is None:
+            index = hnswlib.Index(space="l2", dim=self.__dimension)
+            index.init_index(
+                max_elements=max(len(self.__rows), 1), ef_construction=200, M=16
+            )
+            index.add_items(self.__matrix, np.arange(len(self.__rows)))
+            for position in np.flatnonzero(~self.__live):
+                index.mark_deleted(int(position))
+            index.save_index(path)
+
+        self.__index = index
+
+    def __write_rows(self):
+        sidecar = self.__file("documents.json")
+        with open(f"{sidecar}.tmp", "w", encoding="utf-8") as file:
+            json.dump({"dimension": self.__dimension, "rows": self.__rows}, file)
+        os.replace(f"{sidecar}.tmp", sidecar)
+
+    def __compact(self):
+        """
+        Rewrites the files without the empty rows.
+        """
+        live = np.flatnonzero(self.__live)
+        vectors = np.array(self.__matrix[live])
+        rows = [self.__rows[position] for position in live]
+
+        path = self.__file("vectors.f32")
+        vectors.tofile(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        self.__rows = rows
+        self.__write_rows()
+        if os.path.exists(self.__file("hnsw")):
+            os.remove(self.__file("hnsw"))
+        self.__open()
+
+    def __commit(self):
+        if self.__index is not None:
+            self.__index.save_index(self.__file("hnsw"))
+        self.__write_rows()
+
+        deleted = len(self.__rows) - self.count()
+        if deleted > COMPACT_MIN_ROWS and deleted > self.count():
+            self.__compact()
+        elif self.__index is None and self.count() > self.hnsw_threshold:
+            self.__load_index()
+
+    def __delete_rows(self, ids: List[str]) -> int:
+        deleted = 0
+        for id in ids:
+            position = self.__positions.pop(id, None)
+            if position is None:
+                continue
+            self.__rows[position] = None
+            self.__live[position] = False
+            if self.__index is not None:
+                self.__index.mark_deleted(position)
+            deleted += 1
+        return deleted
+
+    def save_documents(
+        self, documents: List[Document], ids: Optional[List[str]] = None
+    ):
+        """
+        Embeds and appends documents to the store.
+
+        Documents whose id already exists are overwritten, so passing
+        deterministic ids makes saving idempotent.
+        """
+        if not self.path:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        uuids = ids if ids is not None else [str(uuid4()) for _ in documents]
+        # The last document of an id repeated in the same call wins
+        latest = sorted({id: index for index, id in enumerate(uuids)}.values())
+        documents = [documents[index] for index in latest]
+        uuids = [uuids[index] for index in latest]
+        if not documents:
+            return
+
+        vectors = np.asarray(
+            self.embedding.embed_documents(
+                [document.page_content for document in documents]
+            ),
+            dtype=np.float32,
+        )
+
+        with self.__lock:
+            if not self.__dimension:
+                self.__dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.__dimension:
+                raise ValueError(
+                    f"Dimensão {vectors.shape[1]} diferente da coleção "
+                    f"({self.__dimension})."
+                )
+
+            self.__delete_rows(uuids)
+            start = len(self.__rows)
+            with open(self.__file("vectors.f32"), "r+b" if start else "wb") as file:
+                file.seek(start * self.__dimension * 4)
+                vectors.tofile(file)
+                file.truncate()
+
+            for position, (id, document) in enumerate(zip(uuids, documents), start):
+                self.__rows.append(
+                    {
+                        "id": id,
+                        "page_content": document.page_content,
+                        "metadata": document.metadata,
+                    }
+                )
+                self.__positions[id] = position
+            self.__live = np.concatenate(
+                [self.__live, np.ones(len(documents), dtype=bool)]
+            )
+            self.__map()
+
+            if self.__index is not None:
+                self.__index.resize_index(len(self.__rows))
+                self.__index.add_items(vectors, np.arange(start, len(self.__rows)))
+            self.__commit()
+        print("✅ Saved documents")
+
+    def delete_documents(self, ids: List[str]):
+        """
+        Removes the documents with the given ids from the store.
+        """
+        if not self.path:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        with self.__lock:
+            deleted = self.__delete_rows(ids)
+            if deleted:
+                self.__commit()
+        if deleted:
+            print(f"🗑️ Deleted {deleted} documents")
+
+    def reset(self):
+        """
+        Removes every document from the collection.
+        """
+        if not self.path:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        with self.__lock:
+            for extension in ("documents.json", "vectors.f32", "hnsw"):
+                if os.path.exists(self.__file(extension)):
+                    os.remove(self.__file(extension))
+            self.__open()
+
+    def count(self) -> int:
+        return len(self.__positions)
+
+    def __search(self, queries: np.ndarray, k: int) -> List[List[Hit]]:
+        """
+        Returns the (document, distance, stored vector) of the `k` nearest
+        neighbours of each query.
+        """
+        with self.__lock:
+            k = min(k, self.count())
+            if k == 0:
+                return [[] for _ in queries]
+
+            if self.__index is not None:
+                self.__index.set_ef(max(2 * k, 50))
+                positions, distances = self.__index.knn_query(queries, k=k)
+            else:
+                # |q - x|^2 = |q|^2 + |x|^2 - 2 q.x, for every query at once
+                distances = (
+                    np.einsum("ij,ij->i", queries, queries)[:, None]
+                    + self.__norms[None, :]
+                    - 2 * queries @ self.__matrix.T
+                )
+                distances[:, ~self.__live] = np.inf
+                rows = np.arange(len(queries))[:, None]
+                positions = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                positions = positions[
+                    rows, np.argsort(distances[rows, positions], axis=1)
+                ]
+                distances = distances[rows, positions]
+
+            return [
+                [
+                    (
+                        Document(
+                            id=self.__rows[position]["id"],
+                            page_content=self.__rows[position]["page_content"],
+                            metadata=self.__rows[position]["metadata"] or {},
+                        ),
+                        max(float(distance), 0.0),
+                        self.__matrix[position].tolist(),
+                    )
+                    for position, distance in zip(query_positions, query_distances)
+                ]
+                for query_positions, query_distances in zip(positions, distances)
+            ]
+
+    def __embed_queries(self, queries: List[str]) -> np.ndarray:
+        if len(queries) == 1:
+            vectors = [self.embedding.embed_query(queries[0])]
+        else:
+            vectors = self.embedding.embed_documents(queries)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def get_query(self, query: str, k: int = 4):
+        """
+        Performs a similarity search in the vector bank.
+        """
+        if not self.path:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        print("⚡️ getting query")
+        hits = self.__search(self.__embed_queries([query]), k)[0]
+        return [hit[0] for hit in hits]
+
+    def get_retriever_from_similar(
+        self, query: str, embeddings: Optional[Embeddings] = None, k: int = 4
+    ):
+        """
+        Searches for documents similar to the query and returns them, with
+        their scores and stored vectors, as a retriever.
+        """
+        if not self.path:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        hits = self.__search(self.__embed_queries([query]), k)[0]
+
+        print("⚡️ getting similar retriever")
+        return ScoredDocumentsRetriever(
+            documents=[hit[0] for hit in hits],
+            scores=[hit[1] for hit in hits],
+            embeddings=[hit[2] for hit in hits],
+        )
+
+    def get_retriever_from_hunks(
+        self, hunks: List[str], k: int = 4, max_chars: int = 4000
+    ):
+        """
+        Retrieves documents for several queries (usually the hunks of a diff)
+        with one batched search, then merges them with `fuse_hits`.
+        """
+        if not self.path:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        if not hunks:
+            return ScoredDocumentsRetriever()
+
+        results = self.__search(
+            np.asarray(self.embedding.embed_documents(hunks), dtype=np.float32), k
+        )
+
+        print(f"⚡️ getting retriever from {len(hunks)} hunks")
+        return fuse_hits(results, max_chars)
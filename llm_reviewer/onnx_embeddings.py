@@ -0,0 +1,137 @@
+from langchain_core.embeddings import Embeddings
+from typing import Any, Iterator, List, Optional
+import os
+
+import numpy as np
+
+# Prequantized weights shipped with the sentence-transformers models, the
+# unsigned int8 variant runs on any x86-64 CPU with AVX2
+DEFAULT_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime on the CPU.
+
+    Texts are sorted by token count before being split in batches, so each
+    batch is padded to texts of similar length. Token vectors are mean
+    pooled and normalized, like sentence-transformers does.
+    """
+
+    def __init__(
+        self,
+        session: Any,
+        tokenizer: Any,
+        model_name: str,
+        batch_size: int = 32,
+        max_length: int = 384,
+        normalize: bool = True,
+    ):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.padding = 0
+
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.no_padding()
+        self.__inputs = {model_input.name for model_input in session.get_inputs()}
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model: str,
+        file: str = DEFAULT_ONNX_FILE,
+        batch_size: int = 32,
+        threads: Optional[int] = None,
+        max_length: int = 384,
+    ) -> "OnnxEmbeddings":
+        """
+        Loads `file` and `tokenizer.json` from a local directory or from the
+        Hugging Face Hub repository named `model`.
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        if os.path.isdir(model):
+            model_path = os.path.join(model, file)
+            tokenizer_path = os.path.join(model, "tokenizer.json")
+        else:
+            from huggingface_hub import hf_hub_download
+
+            model_path = hf_hub_download(model, file)
+            tokenizer_path = hf_hub_download(model, "tokenizer.json")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        return cls(
+            session=session,
+            tokenizer=Tokenizer.from_file(tokenizer_path),
+            # Quantized vectors differ slightly, they're cached apart
+            model_name=f"{model}:{file}",
+            batch_size=batch_size,
+            max_length=max_length,
+        )
+
+    def __batches(self, encodings: List[Any]) -> Iterator[List[int]]:
+        order = sorted(range(len(encodings)), key=lambda i: len(encodings[i].ids))
+        for start in range(0, len(order), self.batch_size):
+            yield order[start : start + self.batch_size]
+
+    def __embed_batch(self, encodings: List[Any]) -> np.ndarray:
+        length = max(len(encoding.ids) for encoding in encodings)
+        ids = np.zeros((len(encodings), length), dtype=np.int64)
+        mask = np.zeros((len(encodings), length), dtype=np.int64)
+        type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            size = len(encoding.ids)
+            ids[row, :size] = encoding.ids
+            mask[row, :size] = encoding.attention_mask
+            type_ids[row, :size] = encoding.type_ids
+        self.padding += int(mask.size - mask.sum())
+
+        feeds = {
+            name: value
+            for name, value in (
+                ("input_ids", ids),
+                ("attention_mask", mask),
+                ("token_type_ids", type_ids),
+            )
+            if name in self.__inputs
+        }
+        output = self.session.run(None, feeds)[0]
+
+        if output.ndim == 3:
+            weights = mask[..., None].astype(output.dtype)
+            output = (output * weights).sum(axis=1) / np.clip(
+                weights.sum(axis=1), 1e-9, None
+            )
+        if self.normalize:
+            norms = np.linalg.norm(output, axis=1, keepdims=True)
+            output = output / np.clip(norms, 1e-12, None)
+        return output
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        encodings = self.tokenizer.encode_batch(texts)
+        vectors: List[List[float]] = [[] for _ in texts]
+        for batch in self.__batches(encodings):
+            embedded = self.__embed_batch([encodings[index] for index in batch])
+            for index, vector in zip(batch, embedded):
+                vectors[index] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
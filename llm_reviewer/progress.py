@@ -0,0 +1,42 @@
+from typing import Callable
+import sys
+import threading
+
+
+def get_streamlit():
+    """
+    Returns the streamlit module when running inside the UI. It is never
+    imported here, so the CLI doesn't pay for it.
+    """
+    return sys.modules.get("streamlit")
+
+
+def log(message: str):
+    """
+    Prints a progress message, also writing it to the page in the UI.
+    """
+    print(message)
+    st = get_streamlit()
+    if st is not None:
+        st.write(message)
+
+
+def attach_to_thread() -> Callable[[], None]:
+    """
+    Returns a function that lets the thread calling it write to the page of
+    the current Streamlit session. Does nothing outside the UI.
+    """
+    st = get_streamlit()
+    if st is None:
+        return lambda: None
+
+    try:
+        from streamlit.runtime.scriptrunner import (
+            add_script_run_ctx,
+            get_script_run_ctx,
+        )
+    except ImportError:
+        return lambda: None
+
+    context = get_script_run_ctx()
+    return lambda: add_script_run_ctx(threading.current_thread(), context)
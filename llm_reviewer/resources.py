@@ -0,0 +1,81 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+ResourceKey = Tuple[Hashable, ...]
+
+
+class ResourceKind:
+    EMBEDDING = "embedding"
+    LLM = "llm"
+    VECTOR_STORE = "vector_store"
+    GIT = "git"
+
+
+class ResourcePool:
+    """
+    Process-wide registry for heavy objects (embedding models, LLM clients
+    and vector stores).
+
+    Each resource is loaded once per key, where the first item of the key is
+    its `ResourceKind` and the rest is the configuration it was built from.
+    Since the pool lives at module level it survives Streamlit reruns.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__resources: Dict[ResourceKey, Any] = {}
+        self.__key_locks: Dict[ResourceKey, threading.Lock] = {}
+
+    def get(self, key: ResourceKey, factory: Callable[[], T]) -> T:
+        """
+        Returns the resource stored under `key`, building it with `factory`
+        on the first call. Concurrent callers of the same key wait for a
+        single build instead of loading the resource twice.
+        """
+        with self.__lock:
+            if key in self.__resources:
+                return self.__resources[key]
+            key_lock = self.__key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.__lock:
+                if key in self.__resources:
+                    return self.__resources[key]
+
+            resource = factory()
+
+            with self.__lock:
+                self.__resources[key] = resource
+            return resource
+
+    def peek(self, key: ResourceKey) -> Optional[Any]:
+        """
+        Returns the resource stored under `key`, or None without building it.
+        """
+        with self.__lock:
+            return self.__resources.get(key)
+
+    def put(self, key: ResourceKey, resource: T) -> T:
+        with self.__lock:
+            self.__resources[key] = resource
+        return resource
+
+    def invalidate(self, kind: Optional[str] = None) -> int:
+        """
+        Drops every resource of `kind` (or all of them) so the next `get`
+        loads it again. Returns how many resources were dropped.
+        """
+        with self.__lock:
+            keys = [key for key in self.__resources if kind is None or key[0] == kind]
+            for key in keys:
+                del self.__resources[key]
+                self.__key_locks.pop(key, None)
+
+        if keys:
+            print(f"♻️ Invalidated {len(keys)} cached resource(s)")
+        return len(keys)
+
+
+resource_pool = ResourcePool()
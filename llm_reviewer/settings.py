@@ -0,0 +1,41 @@
+import os
+
+
+class Settings:
+    """
+    Configuration read from the environment when it is first used, so
+    importing a module never requires the environment to be set up.
+    """
+
+    def require(self, name: str) -> str:
+        value = os.environ.get(name)
+        if not value:
+            raise RuntimeError(f"Variável de ambiente `{name}` não configurada.")
+        return value
+
+    @property
+    def git_base_url(self) -> str:
+        return self.require("GIT_BASE_URL")
+
+    @property
+    def api_key(self) -> str:
+        return self.require("API_KEY")
+
+    @property
+    def api_url(self) -> str | None:
+        return os.environ.get("API_URL")
+
+    @property
+    def redis_host(self) -> str:
+        return self.require("REDIS_HOST")
+
+    @property
+    def redis_port(self) -> int:
+        return int(self.require("REDIS_PORT"))
+
+    @property
+    def redis_db(self) -> int:
+        return int(os.environ.get("REDIS_DB") or "0")
+
+
+settings = Settings()
@@ -0,0 +1,113 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import contextvars
+import time
+
+from llm_reviewer.progress import attach_to_thread
+
+
+class StageGraph:
+    """
+    Runs the stages of a task concurrently, each one as soon as the stages it
+    depends on are done, and measures when each of them started and ended.
+
+    A stage is called with the results of its dependencies, in the order
+    they were given. Stages run in a copy of the caller's context, so their
+    trace spans are nested in the caller's span.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self.elapsed = 0.0
+        self.__started = 0.0
+
+    def add(self, name: str, function: Callable[..., Any], *depends: str):
+        """
+        Adds a stage. Dependencies must be added first, which keeps the
+        graph acyclic and the stages in topological order.
+        """
+        unknown = [stage for stage in depends if stage not in self.stages]
+        if unknown:
+            raise ValueError(f"Etapas desconhecidas: {', '.join(unknown)}")
+        self.stages[name] = (function, depends)
+
+    def __run_stage(
+        self,
+        attach: Callable[[], None],
+        name: str,
+        function: Callable[..., Any],
+        arguments: List[Any],
+    ) -> Any:
+        attach()
+        started = time.perf_counter()
+        try:
+            return function(*arguments)
+        finally:
+            self.timings[name] = (
+                started - self.__started,
+                time.perf_counter() - self.__started,
+            )
+
+    def run(self, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Runs every stage and returns their results by name. The first stage
+        to fail stops the stages not started yet and its error is raised.
+        """
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running: Dict[Future, str] = {}
+        attach = attach_to_thread()
+        self.timings = {}
+        self.__started = time.perf_counter()
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or max(len(self.stages), 1)
+        ) as executor:
+            try:
+                while pending or running:
+                    for name, (function, depends) in list(pending.items()):
+                        if all(stage in results for stage in depends):
+                            del pending[name]
+                            running[
+                                executor.submit(
+                                    contextvars.copy_context().run,
+                                    self.__run_stage,
+                                    attach,
+                                    name,
+                                    function,
+                                    [results[stage] for stage in depends],
+                                )
+                            ] = name
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future)] = future.result()
+            finally:
+                self.elapsed = time.perf_counter() - self.__started
+
+        return results
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        Returns the chain of dependent stages that took the longest to run
+        and its duration, the time the task would take with unlimited
+        concurrency.
+        """
+        longest: Dict[str, Tuple[float, List[str]]] = {}
+        for name, (_, depends) in self.stages.items():
+            if name not in self.timings:
+                continue
+
+            started, ended = self.timings[name]
+            before = max(
+                (longest[stage] for stage in depends if stage in longest),
+                key=lambda item: item[0],
+                default=(0.0, []),
+            )
+            longest[name] = (before[0] + ended - started, before[1] + [name])
+
+        if not longest:
+            return [], 0.0
+        seconds, path = max(longest.values(), key=lambda item: item[0])
+        return path, seconds
@@ -1,16 +1,29 @@
 import streamlit as st
 import sys
 import os
-import torch
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from llm_reviewer.streamlit.cache import get_all, set, get
-from llm_reviewer.app import run_review, save_vector_store_documents
+from llm_reviewer.streamlit.cache import git_projects, get
+from llm_reviewer.app import (
+    stream_review,
+    save_vector_store_documents,
+    remove_vector_store_documents,
+)
+
+
+def patch_torch_classes():
+    """
+    To remove error: RuntimeError: no running event loop, raised when the
+    file watcher inspects torch.classes. torch is only loaded with the
+    embedding model, so this runs again after every action that loads it.
+    """
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.classes.__path__ = []
+
 
-# To remove error: RuntimeError: no running event loop
-torch.classes.__path__ = [os.path.join(torch.__path__[0], torch.classes.__file__)]
-torch.classes.__path__ = []
+patch_torch_classes()
 
 st.set_page_config(
     page_title="Revisor de código com IA", page_icon="🤖", layout="centered"
@@ -18,9 +31,8 @@ st.set_page_config(
 
 
 def add_git_project(name, api_key, project_id):
-    set(
-        {"name": name, "api_key": api_key, "project_id": project_id},
-        f"git_projects:{project_id}",
+    git_projects.set(
+        project_id, {"name": name, "api_key": api_key, "project_id": project_id}
     )
     st.rerun()
 
@@ -54,6 +66,7 @@ def handle_documentations():
             with col2:
                 if st.button("🗑️", key=f"del_{f}"):
                     os.remove(os.path.join(target, f))
+                    remove_vector_store_documents(f)
                     col1.success(f"Arquivo `{f}` deletado com sucesso.")
 
     else:
@@ -64,12 +77,10 @@ def handle_documentations():
     uploaded = st.file_uploader(
         "Fazer upload de documentações", accept_multiple_files=True
     )
-    file_name = ""
     if uploaded:
         for file in uploaded:
             path = os.path.join(target, file.name)
             with open(path, "wb") as out:
-                file_name = file.name
                 out.write(file.getbuffer())
         st.success(f"{len(uploaded)} arquivo(s) enviado(s) para `{target}`!")
 
@@ -80,10 +91,12 @@ def handle_documentations():
                     "O contexto da LLM está sendo atualizado, por favor aguarde..."
                 )
 
-                save_vector_store_documents(file_name)
+                save_vector_store_documents()
                 st.success("Contexto atualizado com sucesso!")
             except Exception as e:
                 st.error(f"Erro ao atualizar o contexto: {e}")
+            finally:
+                patch_torch_classes()
 
 
 with st.sidebar:
@@ -98,7 +111,7 @@ with st.sidebar:
         value=openai_key_value,
     )
 
-    repos = get_all("git_projects")
+    repos = git_projects.all()
     if repos:
         options = map(lambda x: x["name"], repos)
 
@@ -166,11 +179,38 @@ with st.container():
             os.environ["GIT_PROJECT_ID"] = selected_repo["project_id"]
             os.environ["GIT_MERGE_REQUEST_IID"] = str(pull_request_id)
             try:
-                response = run_review()
+                metrics = {}
                 response_container = st.container(border=True)
-                if response:
-                    response_container.empty()
-                    with response_container.container():
-                        response_container.markdown(response)
+                with response_container:
+                    response_container.write_stream(stream_review(metrics))
+                if "time_to_first_token" in metrics:
+                    st.metric(
+                        "Tempo até o primeiro token",
+                        f"{metrics['time_to_first_token']:.2f}s",
+                    )
+                if "stages" in metrics:
+                    with st.expander("Tempo por etapa"):
+                        if "critical_path" in metrics:
+                            st.caption(
+                                "Caminho crítico: "
+                                f"{metrics['critical_path']['critical_path']} "
+                                f"({metrics['critical_path']['critical_path_seconds']:.2f}s)"
+                            )
+                        st.table(
+                            [
+                                {
+                                    "Etapa": stage,
+                                    "Tempo (s)": round(values["seconds"], 2),
+                                    "Chamadas": int(values["count"]),
+                                    "Tokens": int(
+                                        values.get("prompt_tokens", 0)
+                                        + values.get("completion_tokens", 0)
+                                    ),
+                                }
+                                for stage, values in metrics["stages"].items()
+                            ]
+                        )
             except Exception as e:
                 st.write("❌ Erro ao revisar o código:", e)
+            finally:
+                patch_torch_classes()
@@ -1,18 +1,114 @@
 import redis
-import os
 import json
-from typing import Dict, List
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Generic, List, Optional, TypedDict, TypeVar
 
-port = os.environ["REDIS_PORT"]
-host = os.environ["REDIS_HOST"]
-db = os.environ["REDIS_DB"]
+from llm_reviewer.settings import settings
+
+# Keys read per MGET when loading many values
+BATCH_SIZE = 1000
+
+connection_pool: Optional[redis.ConnectionPool] = None
+connection_pool_lock = threading.Lock()
+
+T = TypeVar("T")
+
+
+def get_connection_pool() -> redis.ConnectionPool:
+    global connection_pool
+    if connection_pool is None:
+        with connection_pool_lock:
+            if connection_pool is None:
+                connection_pool = redis.ConnectionPool(
+                    host=settings.redis_host,
+                    port=settings.redis_port,
+                    db=settings.redis_db,
+                )
+    return connection_pool
 
 
 def get_redis_client():
-    client = redis.Redis(host=host, port=port, db=db)
+    client = redis.Redis(connection_pool=get_connection_pool())
     return client
 
 
+def decode(value: Optional[bytes]) -> Any:
+    return json.loads(value.decode("utf-8")) if value else None
+
+
+class RedisRepository(Generic[T]):
+    """
+    JSON values of type `T` stored under `{prefix}:{id}`.
+
+    Every repository shares the module connection pool, and reads of many
+    values are done with MGET instead of one GET per key.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def key(self, id: str) -> str:
+        return f"{self.prefix}:{id}"
+
+    def get(self, id: str) -> Optional[T]:
+        return decode(get_redis_client().get(self.key(id)))
+
+    def get_many(self, ids: List[str]) -> List[Optional[T]]:
+        if not ids:
+            return []
+
+        client = get_redis_client()
+        values = []
+        for start in range(0, len(ids), BATCH_SIZE):
+            keys = [self.key(id) for id in ids[start : start + BATCH_SIZE]]
+            values.extend(decode(value) for value in client.mget(keys))
+        return values
+
+    def set(self, id: str, value: T, ttl: Optional[int] = None) -> None:
+        get_redis_client().set(self.key(id), json.dumps(value), ex=ttl)
+
+    def delete(self, id: str) -> None:
+        get_redis_client().delete(self.key(id))
+
+    def all(self) -> List[T]:
+        client = get_redis_client()
+        keys = list(client.scan_iter(f"{self.prefix}:*", count=BATCH_SIZE))
+
+        values = []
+        for start in range(0, len(keys), BATCH_SIZE):
+            values.extend(
+                value
+                for value in map(decode, client.mget(keys[start : start + BATCH_SIZE]))
+                if value is not None
+            )
+        return values
+
+
+class GitProject(TypedDict):
+    name: str
+    api_key: str
+    project_id: str
+
+
+class ReviewState(TypedDict):
+    head_sha: str
+    findings: List[Dict[str, Any]]
+
+
+class ReviewNote(TypedDict):
+    note_id: int
+
+
+class CachedFindings(TypedDict):
+    findings: List[Dict[str, Any]]
+    tokens: int
+
+
+git_projects: RedisRepository[GitProject] = RedisRepository("git_projects")
+
+
 def set(value: Dict[str, str], key: str) -> None:
     client = get_redis_client()
     if client:
@@ -38,12 +134,119 @@ def get(key: str) -> Dict[str, str] | None:
 
 
 def get_all(key: str) -> List[Dict[str, str]] | None:
+    values = RedisRepository(key).all()
+    print(f"Got all keys from Redis")
+    return values
+
+
+FINDINGS_KEY = "review_findings"
+FINDINGS_INDEX_KEY = f"{FINDINGS_KEY}_index"
+FINDINGS_SIZES_KEY = f"{FINDINGS_KEY}_sizes"
+FINDINGS_BYTES_KEY = f"{FINDINGS_KEY}_bytes"
+
+
+findings: RedisRepository[CachedFindings] = RedisRepository(FINDINGS_KEY)
+
+
+def findings_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_findings(ids: List[str]) -> List[CachedFindings | None]:
+    """
+    Returns the cached findings of each id (or None) with a single MGET.
+    """
+    return findings.get_many(ids)
+
+
+def set_findings(value: CachedFindings, id: str, ttl: int, max_bytes: int) -> None:
+    """
+    Caches findings for `ttl` seconds. The total size of cached findings is
+    kept under `max_bytes` by evicting the entries closest to expiring.
+
+    The index is sorted by expiry time, so the sizes of the entries expired
+    by their TTL are given back before counting. The bookkeeping keys are
+    watched, so concurrent writers retry instead of losing updates.
+    """
     client = get_redis_client()
-    if client:
-        keys = client.scan_iter(f"{key}*")
-        values = [json.loads(client.get(key).decode("utf-8")) for key in keys]
-        print(f"Got all keys from Redis")
-        return values
-    else:
-        print("Failed to get all values from Redis: No client available")
-        return None
+    key = findings.key(id)
+    json_value = json.dumps(value)
+    size = len(json_value.encode("utf-8"))
+    if size > max_bytes:
+        print("Findings larger than the cache, not cached")
+        return
+
+    def update(pipeline: redis.client.Pipeline):
+        now = time.time()
+        # Redis returns the index members as bytes
+        expired = pipeline.zrangebyscore(FINDINGS_INDEX_KEY, "-inf", now)
+        stale = list({key.encode("utf-8"), *expired})
+        stale_sizes = pipeline.hmget(FINDINGS_SIZES_KEY, stale)
+        total = int(pipeline.get(FINDINGS_BYTES_KEY) or 0) + size
+        total -= sum(int(stale_size or 0) for stale_size in stale_sizes)
+
+        evicted: List[bytes] = []
+        start = 0
+        while total > max_bytes:
+            oldest = pipeline.zrange(FINDINGS_INDEX_KEY, start, start + 99)
+            if not oldest:
+                break
+            start += len(oldest)
+            oldest = [old_key for old_key in oldest if old_key not in stale]
+            for old_key, old_size in zip(
+                oldest, pipeline.hmget(FINDINGS_SIZES_KEY, oldest)
+            ):
+                if total <= max_bytes:
+                    break
+                evicted.append(old_key)
+                total -= int(old_size or 0)
+
+        pipeline.multi()
+        forgotten = stale + evicted
+        pipeline.zrem(FINDINGS_INDEX_KEY, *forgotten)
+        pipeline.hdel(FINDINGS_SIZES_KEY, *forgotten)
+        if evicted:
+            pipeline.delete(*evicted)
+        pipeline.set(key, json_value, ex=ttl)
+        pipeline.zadd(FINDINGS_INDEX_KEY, {key: now + ttl})
+        pipeline.hset(FINDINGS_SIZES_KEY, key, size)
+        pipeline.set(FINDINGS_BYTES_KEY, total)
+
+    client.transaction(
+        update, FINDINGS_INDEX_KEY, FINDINGS_SIZES_KEY, FINDINGS_BYTES_KEY
+    )
+    print(f"Cached findings in Redis")
+
+
+review_states: RedisRepository[ReviewState] = RedisRepository("review_state")
+
+
+def get_review_state(project_id: str, merge_request_iid: str) -> ReviewState | None:
+    """
+    Returns the head SHA and findings of the last review of a merge request.
+    """
+    return review_states.get(f"{project_id}:{merge_request_iid}")
+
+
+def set_review_state(
+    project_id: str, merge_request_iid: str, head_sha: str, findings: List[Dict]
+) -> None:
+    review_states.set(
+        f"{project_id}:{merge_request_iid}",
+        {"head_sha": head_sha, "findings": findings},
+    )
+
+
+review_notes: RedisRepository[ReviewNote] = RedisRepository("review_note")
+
+
+def get_review_note_id(project_id: str, merge_request_iid: str) -> int | None:
+    """
+    Returns the id of the note the reviewer wrote on a merge request.
+    """
+    value = review_notes.get(f"{project_id}:{merge_request_iid}")
+    return value["note_id"] if value else None
+
+
+def set_review_note_id(project_id: str, merge_request_iid: str, note_id: int) -> None:
+    review_notes.set(f"{project_id}:{merge_request_iid}", {"note_id": note_id})
@@ -0,0 +1,346 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+import json
+import os
+import secrets
+import threading
+import time
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+SERVICE_NAME = "llm-reviewer"
+
+
+class TraceExport:
+    PROMETHEUS = "prometheus"
+    OTLP = "otlp"
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = 0.0
+
+    def to_otlp(self) -> Dict[str, Any]:
+        start = int(self.start * 1e9)
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(self.duration * 1e9)),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Process-wide stage duration histograms and LLM token counters.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.durations: Dict[str, Histogram] = {}
+        self.tokens: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, stage: str, duration: float):
+        with self.__lock:
+            self.durations.setdefault(stage, Histogram()).observe(duration)
+
+    def add_tokens(self, model: str, kind: str, tokens: int):
+        with self.__lock:
+            self.tokens[(model, kind)] = self.tokens.get((model, kind), 0) + tokens
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP llm_reviewer_stage_duration_seconds Duration of each review stage.",
+            "# TYPE llm_reviewer_stage_duration_seconds histogram",
+        ]
+        with self.__lock:
+            for stage, histogram in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'llm_reviewer_stage_duration_seconds_bucket{{stage="{stage}",'
+                        f'le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'llm_reviewer_stage_duration_seconds_sum{{stage="{stage}"}} '
+                    f"{histogram.sum}"
+                )
+                lines.append(
+                    f'llm_reviewer_stage_duration_seconds_count{{stage="{stage}"}} '
+                    f"{histogram.count}"
+                )
+
+            lines.append("# HELP llm_reviewer_llm_tokens_total Tokens used by LLMs.")
+            lines.append("# TYPE llm_reviewer_llm_tokens_total counter")
+            for (model, kind), tokens in sorted(self.tokens.items()):
+                lines.append(
+                    f'llm_reviewer_llm_tokens_total{{model="{model}",type="{kind}"}} '
+                    f"{tokens}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Records a span with the latency and prompt/completion tokens of every
+    LLM call made with this callback.
+    """
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.__lock = threading.Lock()
+        self.__runs: Dict[UUID, Tuple[str, float]] = {}
+
+    def __start(self, serialized: Dict[str, Any], run_id: UUID, **kwargs: Any):
+        metadata = kwargs.get("metadata") or {}
+        model = metadata.get("ls_model_name") or (serialized or {}).get(
+            "name", "unknown"
+        )
+        with self.__lock:
+            self.__runs[run_id] = (str(model), time.perf_counter())
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id, **kwargs
+    ):
+        self.__start(serialized, run_id, **kwargs)
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List, *, run_id, **kwargs
+    ):
+        self.__start(serialized, run_id, **kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        with self.__lock:
+            model, started = self.__runs.pop(run_id, ("unknown", time.perf_counter()))
+
+        prompt_tokens, completion_tokens = 0, 0
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        else:
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    metadata = getattr(message, "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+
+        self.tracer.record(
+            "llm",
+            time.perf_counter() - started,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        self.tracer.metrics.add_tokens(model, "prompt", prompt_tokens)
+        self.tracer.metrics.add_tokens(model, "completion", completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs):
+        with self.__lock:
+            self.__runs.pop(run_id, None)
+
+
+class Tracer:
+    """
+    Records a span per pipeline stage.
+
+    Spans are kept for the review being collected in the current context
+    (see `collect`) and every span duration is also added to the process-wide
+    histograms, exported in Prometheus text format or as OTLP JSON.
+    """
+
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+        self.callback = LLMMetricsCallback(self)
+        self.__lock = threading.Lock()
+        self.__spans: ContextVar[Optional[List[Span]]] = ContextVar(
+            "spans", default=None
+        )
+        self.__current: ContextVar[Optional[Span]] = ContextVar(
+            "current_span", default=None
+        )
+
+    def __new_span(self, name: str, attributes: Dict[str, Any]) -> Span:
+        parent = self.__current.get()
+        spans = self.__spans.get()
+        trace_id = (
+            parent.trace_id
+            if parent
+            else (spans[0].trace_id if spans else secrets.token_hex(16))
+        )
+        return Span(name, trace_id, parent.span_id if parent else None, attributes)
+
+    def __finish(self, span: Span):
+        self.metrics.observe(span.name, span.duration)
+        spans = self.__spans.get()
+        if spans is not None:
+            with self.__lock:
+                spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = self.__new_span(name, attributes)
+        token = self.__current.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - started
+            self.__current.reset(token)
+            self.__finish(span)
+
+    def record(self, name: str, duration: float, **attributes: Any) -> Span:
+        """
+        Records a span measured elsewhere (in another process, or by a
+        callback) that ended now.
+        """
+        span = self.__new_span(name, attributes)
+        span.start = time.time() - duration
+        span.duration = duration
+        self.__finish(span)
+        return span
+
+    def traced(self, name: str) -> Callable:
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @contextmanager
+    def collect(self) -> Iterator[List[Span]]:
+        """
+        Collects the spans recorded in this context (including threads
+        started by LangChain) until the block exits.
+        """
+        spans: List[Span] = []
+        token = self.__spans.set(spans)
+        try:
+            yield spans
+        finally:
+            self.__spans.reset(token)
+
+    def export(self, spans: List[Span]):
+        """
+        Writes the metrics to `TRACE_EXPORT_PATH` in the `TRACE_EXPORT`
+        format: the whole Prometheus text file, or one OTLP JSON line per
+        review.
+        """
+        export = os.environ.get("TRACE_EXPORT")
+        if not export:
+            return
+
+        path = os.environ.get(
+            "TRACE_EXPORT_PATH",
+            "metrics.prom" if export == TraceExport.PROMETHEUS else "traces.jsonl",
+        )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if export == TraceExport.PROMETHEUS:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(self.metrics.to_prometheus())
+            os.replace(tmp_path, path)
+        elif export == TraceExport.OTLP:
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(to_otlp(spans)) + "\n")
+        else:
+            print(f"❌ Unknown TRACE_EXPORT: {export}")
+
+
+def to_otlp(spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": otlp_value(SERVICE_NAME)}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "llm_reviewer"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def summarize(spans: List[Span]) -> Dict[str, Dict[str, float]]:
+    """
+    Total duration, number of spans and tokens of each stage of a review.
+    """
+    summary: Dict[str, Dict[str, float]] = {}
+    for span in spans:
+        stage = summary.setdefault(span.name, {"seconds": 0.0, "count": 0})
+        stage["seconds"] += span.duration
+        stage["count"] += 1
+        for key in ("prompt_tokens", "completion_tokens"):
+            if key in span.attributes:
+                stage[key] = stage.get(key, 0) + span.attributes[key]
+    return summary
+
+
+tracer = Tracer()
@@ -1,14 +1,84 @@
-from langchain_chroma import Chroma
-import chromadb
 from uuid import uuid4
-from typing import Optional, List, TypeVar
+from typing import TYPE_CHECKING, Dict, Optional, List, Tuple, TypeVar
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
 from abc import ABC, abstractmethod
-from langchain_huggingface import HuggingFaceEmbeddings
+import os
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
 
 Self = TypeVar("Self", bound="Base")  # type: ignore
 
-Embeddings = HuggingFaceEmbeddings
+# Rank offset used by reciprocal rank fusion
+RRF_K = 60
+
+# (document, distance, stored vector) of a nearest neighbour
+Hit = Tuple[Document, float, List[float]]
+
+
+class AcceptableVectorStores:
+    CHROMA = "chroma"
+    MMAP = "mmap"
+
+
+class ScoredDocumentsRetriever(BaseRetriever):
+    """
+    Retriever over documents already scored by a similarity search.
+
+    It returns the same documents for every query, so invoking it neither
+    embeds the query again nor touches the vector store.
+    """
+
+    documents: List[Document] = []
+    scores: List[float] = []
+    embeddings: List[List[float]] = []
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.documents
+
+
+def fuse_hits(results: List[List[Hit]], max_chars: int) -> ScoredDocumentsRetriever:
+    """
+    Merges the hits of several queries into a single retriever.
+
+    Results are deduplicated and ranked by reciprocal rank fusion, then
+    packed until `max_chars` of content is reached. The scores kept are the
+    best distance of each document to any query.
+    """
+    fused: Dict[str, dict] = {}
+    for hits in results:
+        for rank, (document, distance, vector) in enumerate(hits):
+            entry = fused.setdefault(
+                document.id,
+                {
+                    "document": document,
+                    "rrf": 0.0,
+                    "distance": distance,
+                    "vector": vector,
+                },
+            )
+            entry["rrf"] += 1.0 / (RRF_K + rank + 1)
+            entry["distance"] = min(entry["distance"], distance)
+
+    selected = []
+    used_chars = 0
+    for entry in sorted(fused.values(), key=lambda e: e["rrf"], reverse=True):
+        size = len(entry["document"].page_content)
+        if selected and used_chars + size > max_chars:
+            continue
+        selected.append(entry)
+        used_chars += size
+
+    return ScoredDocumentsRetriever(
+        documents=[entry["document"] for entry in selected],
+        scores=[entry["distance"] for entry in selected],
+        embeddings=[entry["vector"] for entry in selected],
+    )
 
 
 class IVectorStore(ABC):
@@ -22,8 +92,26 @@ class IVectorStore(ABC):
     ) -> Self:
         raise NotImplementedError
 
+    @staticmethod
+    def clear_cache() -> None:
+        """
+        Releases the state shared between the loaded stores, if any.
+        """
+
+    @abstractmethod
+    def save_documents(self: Self, documents, ids: Optional[List[str]] = None) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_documents(self: Self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def reset(self: Self) -> None:
+        raise NotImplementedError
+
     @abstractmethod
-    def save_documents(self: Self, documents) -> None:
+    def count(self: Self) -> int:
         raise NotImplementedError
 
     @abstractmethod
@@ -32,15 +120,21 @@ class IVectorStore(ABC):
 
     @abstractmethod
     def get_retriever_from_similar(
-        self: Self, query: str, embeddings: Embeddings, k: int = 2
-    ) -> Chroma:
+        self: Self, query: str, embeddings: Optional[Embeddings] = None, k: int = 2
+    ) -> ScoredDocumentsRetriever:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_retriever_from_hunks(
+        self: Self, hunks: List[str], k: int = 4, max_chars: int = 4000
+    ) -> ScoredDocumentsRetriever:
         raise NotImplementedError
 
 
 class VectorStore(IVectorStore):
-    store: Optional[Chroma] = None
+    store: Optional["Chroma"] = None
 
-    def __init__(self, store: Optional[Chroma] = None):
+    def __init__(self, store: Optional["Chroma"] = None):
         self.store = store if store else None
 
     def load(
@@ -56,6 +150,9 @@ class VectorStore(IVectorStore):
         - If documents exist, creates a new database.
         - If not, loads the existing persistence.
         """
+        # Imported on first use, Chroma takes about a second to import
+        from langchain_chroma import Chroma
+
         local_store = None
         if documents and len(documents) > 0:
             local_store = Chroma.from_documents(
@@ -74,17 +171,59 @@ class VectorStore(IVectorStore):
 
         return VectorStore(local_store)
 
-    def save_documents(self, documents: List[Document]):
+    @staticmethod
+    def clear_cache():
+        """
+        Tears down the shared Chroma clients. Only needed when the store is
+        rebuilt or dropped, since loaded stores are reused between queries.
+        """
+        # Solution https://github.com/langchain-ai/langchain/issues/26884
+        from chromadb.api.client import SharedSystemClient
+
+        SharedSystemClient.clear_system_cache()
+
+    def save_documents(
+        self, documents: List[Document], ids: Optional[List[str]] = None
+    ):
         """
-        Adds new documents to Chroma and persists the update.
+        Adds documents to Chroma and persists the update.
+
+        Documents whose id already exists are overwritten, so passing
+        deterministic ids makes saving idempotent.
         """
         if not self.store:
             raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
 
-        uuids = [str(uuid4()) for _ in documents]
+        uuids = ids if ids is not None else [str(uuid4()) for _ in documents]
         self.store.add_documents(documents=documents, ids=uuids)
         print("✅ Saved documents")
 
+    def delete_documents(self, ids: List[str]):
+        """
+        Removes the documents with the given ids from Chroma.
+        """
+        if not self.store:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        if ids:
+            self.store.delete(ids=ids)
+            print(f"🗑️ Deleted {len(ids)} documents")
+
+    def reset(self):
+        """
+        Removes every document from the collection.
+        """
+        if not self.store:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        self.store.reset_collection()
+
+    def count(self) -> int:
+        if not self.store:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        return self.store._collection.count()
+
     def get_query(self, query: str, k: int = 4):
         """
         Performs a similarity search in the vector bank.
@@ -94,27 +233,112 @@ class VectorStore(IVectorStore):
 
         print("⚡️ getting query")
         similarity_search = self.store.similarity_search(query, k=k)
-        # Solution https://github.com/langchain-ai/langchain/issues/26884
-        chromadb.api.client.SharedSystemClient.clear_system_cache()
 
         return similarity_search
 
     def get_retriever_from_similar(
-        self, query: str, embeddings: Embeddings, k: int = 4
+        self, query: str, embeddings: Optional[Embeddings] = None, k: int = 4
     ):
         """
-        Searches for documents similar to the query and creates a new retriever with them.
+        Searches for documents similar to the query and returns them, with
+        their scores and stored vectors, as a retriever.
+
+        The query is embedded once; `embeddings` is kept for compatibility
+        and is not used.
         """
         if not self.store:
             raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
 
-        similar_documents = self.store.similarity_search(query, k=k)
-        # Solution https://github.com/langchain-ai/langchain/issues/26884
-        chromadb.api.client.SharedSystemClient.clear_system_cache()
+        query_embedding = self.store.embeddings.embed_query(query)
+        results = self.__query_vectors([query_embedding], k)
+        hits = results[0]
 
-        temp_store = self.store.from_documents(
-            documents=similar_documents, embedding=embeddings
+        print("⚡️ getting similar retriever")
+        return ScoredDocumentsRetriever(
+            documents=[hit[0] for hit in hits],
+            scores=[hit[1] for hit in hits],
+            embeddings=[hit[2] for hit in hits],
         )
 
-        print("⚡️ getting similar retriever")
-        return temp_store.as_retriever()
+    def get_retriever_from_hunks(
+        self, hunks: List[str], k: int = 4, max_chars: int = 4000
+    ):
+        """
+        Retrieves documents for several queries (usually the hunks of a diff)
+        and merges them into a single retriever.
+
+        All hunks are embedded in one batch and searched in one collection
+        query, then merged with `fuse_hits`.
+        """
+        if not self.store:
+            raise ValueError("VectorStore não foi carregado. Chame `load()` primeiro.")
+
+        if not hunks:
+            return ScoredDocumentsRetriever()
+
+        hunk_embeddings = self.store.embeddings.embed_documents(hunks)
+        results = self.__query_vectors(hunk_embeddings, k)
+
+        print(f"⚡️ getting retriever from {len(hunks)} hunks")
+        return fuse_hits(results, max_chars)
+
+    def __query_vectors(self, vectors: List[List[float]], k: int) -> List[List[Hit]]:
+        """
+        Runs one collection query for all vectors and returns, per vector,
+        the (document, distance, stored vector) of its nearest neighbours.
+        """
+        results = self.store._collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+
+        embeddings = results.get("embeddings")
+        hits = []
+        for index in range(len(vectors)):
+            ids = results["ids"][index]
+            stored = (
+                embeddings[index]
+                if embeddings is not None and index < len(embeddings)
+                else None
+            )
+            # Without the stored vectors the hits are still ranked by the
+            # distances Chroma returns, with an empty vector each
+            if stored is None or len(stored) != len(ids):
+                stored = [[] for _ in ids]
+            hits.append(
+                [
+                    (
+                        Document(id=id, page_content=content, metadata=metadata or {}),
+                        float(distance),
+                        [float(value) for value in vector],
+                    )
+                    for id, content, metadata, distance, vector in zip(
+                        ids,
+                        results["documents"][index],
+                        results["metadatas"][index],
+                        results["distances"][index],
+                        stored,
+                    )
+                ]
+            )
+        return hits
+
+
+def get_vector_store_backend() -> str:
+    return os.environ.get("VECTOR_STORE") or AcceptableVectorStores.CHROMA
+
+
+def get_vector_store(backend: Optional[str] = None) -> IVectorStore:
+    """
+    Returns an unloaded store of the configured backend.
+    """
+    backend = backend or get_vector_store_backend()
+    if backend == AcceptableVectorStores.MMAP:
+        # Imported on first use, it needs numpy
+        from llm_reviewer.mmap_vector_store import MmapVectorStore
+
+        return MmapVectorStore()
+    if backend == AcceptableVectorStores.CHROMA:
+        return VectorStore()
+    raise ValueError(f"Vector store `{backend}` não suportado.")
@@ -0,0 +1,170 @@
+from aiohttp import web
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hmac
+import json
+import os
+
+from llm_reviewer.batch import ReviewJob
+
+# Merge request actions that can bring new commits
+REVIEW_ACTIONS = {"open", "reopen", "update"}
+
+Enqueue = Callable[[ReviewJob], Awaitable[None]]
+
+
+def parse_merge_request_event(payload: Dict) -> Optional[Tuple[ReviewJob, str]]:
+    """
+    Returns the job and head SHA of a GitLab merge request event, or None
+    when the event does not need a review (other event kinds, closed merge
+    requests or updates that don't push commits).
+    """
+    if payload.get("object_kind") != "merge_request":
+        return None
+
+    attributes = payload.get("object_attributes") or {}
+    action = attributes.get("action")
+    if action not in REVIEW_ACTIONS:
+        return None
+
+    # `oldrev` is only sent when the update pushed new commits
+    if action == "update" and not attributes.get("oldrev"):
+        return None
+
+    project_id = (payload.get("project") or {}).get("id") or attributes.get(
+        "target_project_id"
+    )
+    merge_request_iid = attributes.get("iid")
+    head_sha = (attributes.get("last_commit") or {}).get("id")
+    if project_id is None or merge_request_iid is None or not head_sha:
+        return None
+
+    job: ReviewJob = {"project_id": str(project_id), "mr_iid": str(merge_request_iid)}
+    return job, head_sha
+
+
+def redis_enqueue(key: str) -> Enqueue:
+    """
+    Pushes jobs to the Redis list drained by `poetry run batch --redis`.
+    """
+    # Imported here so the intake can be tested without Redis configured
+    from llm_reviewer.streamlit.cache import get_redis_client
+
+    client = get_redis_client()
+
+    async def enqueue(job: ReviewJob):
+        await asyncio.to_thread(client.rpush, key, json.dumps(job))
+
+    return enqueue
+
+
+class WebhookIntake:
+    """
+    Receives GitLab merge request webhooks and enqueues one review per burst
+    of pushes.
+
+    Each event (re)starts a `debounce` seconds timer for its merge request;
+    only when no newer push arrives before it fires is the job enqueued,
+    with the latest head SHA.
+    """
+
+    def __init__(self, secret: str, enqueue: Enqueue, debounce: float = 30.0):
+        if not secret:
+            raise ValueError("Variável de ambiente WEBHOOK_SECRET não configurada.")
+        self.secret = secret
+        self.enqueue = enqueue
+        self.debounce = debounce
+        self.received = 0
+        self.enqueued = 0
+        self.__pending: Dict[Tuple[str, str], Tuple[str, asyncio.Task]] = {}
+
+    async def __enqueue_later(self, key: Tuple[str, str], job: ReviewJob):
+        await asyncio.sleep(self.debounce)
+        await self.__enqueue(key, job)
+
+    async def __enqueue(self, key: Tuple[str, str], job: ReviewJob):
+        head_sha, _ = self.__pending.pop(key)
+        await self.enqueue({**job, "head_sha": head_sha})
+        self.enqueued += 1
+        print(f"📥 Enqueued review of {job['project_id']}:{job['mr_iid']}")
+
+    def push(self, job: ReviewJob, head_sha: str):
+        key = (job["project_id"], job["mr_iid"])
+        pending = self.__pending.get(key)
+        if pending:
+            pending[1].cancel()
+
+        task = asyncio.create_task(self.__enqueue_later(key, job))
+        self.__pending[key] = (head_sha, task)
+
+    async def flush(self):
+        """
+        Enqueues every pending job right away. Called on shutdown so no
+        push is lost.
+        """
+        for key, (head_sha, task) in list(self.__pending.items()):
+            task.cancel()
+            await self.__enqueue(
+                key, {"project_id": key[0], "mr_iid": key[1], "head_sha": head_sha}
+            )
+
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get("X-Gitlab-Token", "")
+        if not token or not hmac.compare_digest(
+            token.encode("utf-8"), self.secret.encode("utf-8")
+        ):
+            return web.json_response({"error": "invalid token"}, status=401)
+
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({"error": "invalid payload"}, status=400)
+
+        self.received += 1
+        event = parse_merge_request_event(payload)
+        if event is None:
+            return web.json_response({"status": "ignored"}, status=202)
+
+        job, head_sha = event
+        self.push(job, head_sha)
+        return web.json_response({"status": "queued", "head_sha": head_sha}, status=202)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "received": self.received,
+                "pending": self.pending(),
+                "enqueued": self.enqueued,
+            }
+        )
+
+
+def create_app(intake: WebhookIntake) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/webhook", intake.handle)
+    app.router.add_get("/health", intake.health)
+
+    async def flush_pending(app: web.Application):
+        await intake.flush()
+
+    app.on_shutdown.append(flush_pending)
+    return app
+
+
+def main():
+    """
+    Entry point of the webhook intake service.
+    """
+    intake = WebhookIntake(
+        secret=os.environ.get("WEBHOOK_SECRET", ""),
+        enqueue=redis_enqueue(os.environ.get("WEBHOOK_QUEUE", "review_jobs")),
+        debounce=float(os.environ.get("WEBHOOK_DEBOUNCE", "30")),
+    )
+    web.run_app(create_app(intake), port=int(os.environ.get("WEBHOOK_PORT", "8080")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from unittest import mock
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from llm_reviewer.git import Git
+from llm_reviewer.resources import resource_pool, ResourceKind
+from llm_reviewer.vector_store import AcceptableVectorStores, get_vector_store
+from tests.gitlab_server import FakeGitLab
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "review.json")
+
+# Relative change of a metric reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+# Metrics where a higher value is better
+HIGHER_IS_BETTER = {"files_per_second", "tokens_per_second"}
+
+Metrics = Dict[str, Any]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model answering with `respond(prompt)`. Each call
+    waits `latency` seconds before the first token and then emits
+    `tokens_per_second` tokens per second (0 means instantly).
+    """
+
+    respond: Callable[[str], str]
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    calls: int = 0
+    output_tokens: int = 0
+    busy_time: float = 0.0
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def __tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        return re.findall(r"\S+\s*", self.respond(prompt))
+
+    def __record(self, tokens: int, started: float):
+        with self._lock:
+            self.calls += 1
+            self.output_tokens += tokens
+            self.busy_time += time.perf_counter() - started
+
+    def __pause(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        started = time.perf_counter()
+        tokens = self.__tokens(messages)
+        time.sleep(self.latency + self.__pause() * len(tokens))
+        self.__record(len(tokens), started)
+
+        message = AIMessage(
+            content="".join(tokens),
+            usage_metadata={
+                "input_tokens": 0,
+                "output_tokens": len(tokens),
+                "total_tokens": len(tokens),
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        started = time.perf_counter()
+        tokens = self.__tokens(messages)
+        time.sleep(self.latency)
+        for token in tokens:
+            time.sleep(self.__pause())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        self.__record(len(tokens), started)
+
+
+def code_model_response(prompt: str) -> str:
+    """
+    Reports one finding for every third file of the reviewed diff.
+    """
+    files = re.findall(r"^File: (.+)$", prompt, re.MULTILINE)
+    findings = [
+        {
+            "file": file,
+            "line": 3,
+            "problem": f"Function in {file} does not follow the guidelines.",
+            "suggestion": "Rename it following the naming conventions.",
+        }
+        for file in files[::3]
+    ]
+    return json.dumps(findings, indent=2)
+
+
+def conversation_model_response(prompt: str) -> str:
+    rows = prompt.count('"file"')
+    lines = ["# Code Review Documentation", "", "| File | Problem |", "| --- | --- |"]
+    lines.extend(f"| file {index} | problem {index} |" for index in range(rows))
+    return "\n".join(lines)
+
+
+def synthetic_changes(files: int, hunks: int = 2, lines: int = 6) -> List[Dict]:
+    """
+    Builds GitLab change entries for a merge request touching `files`
+    files, each with `hunks` hunks of `lines` changed lines.
+    """
+    changes = []
+    for file in range(files):
+        path = f"src/package_{file % 50}/module_{file}.py"
+        diff = []
+        for hunk in range(hunks):
+            start = 1 + hunk * 40
+            diff.append(
+                f"@@ -{start},{lines} +{start},{lines} @@ def handler_{hunk}():"
+            )
+            for line in range(lines // 2):
+                diff.append(f"-    value_{line} = compute_{file}_{hunk}(value_{line})")
+                diff.append(
+                    f"+    value_{line} = compute_{file}_{hunk}_v2(value_{line})"
+                )
+        changes.append(
+            {"old_path": path, "new_path": path, "diff": "\n".join(diff) + "\n"}
+        )
+    return changes
+
+
+def synthetic_guidelines(count: int = 64) -> List[Document]:
+    return [
+        Document(
+            page_content=f"Guideline {index}: functions in package {index % 50} "
+            f"must be named after the action they perform and stay short.",
+            metadata={"source": f"guidelines_{index // 16}.pdf"},
+        )
+        for index in range(count)
+    ]
+
+
+class StageTimer:
+    """
+    Accumulates the wall time spent in wrapped functions, per stage.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self.__lock = threading.Lock()
+
+    def add(self, stage: str, duration: float):
+        with self.__lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + duration
+
+    def wrap(self, owner: Any, name: str, stage: str):
+        function = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        return mock.patch.object(owner, name, timed)
+
+
+def run_case(
+    files: int,
+    latency: float = 0.0,
+    tokens_per_second: float = 0.0,
+    review_mode: str = "single",
+    review_format: str = "llm",
+    vector_store: str = AcceptableVectorStores.CHROMA,
+    quiet: bool = True,
+) -> Metrics:
+    """
+    Runs `run_review` end to end for a synthetic merge request of `files`
+    files against the fake models and the stand-in GitLab server.
+    """
+    from llm_reviewer import app
+
+    timer = StageTimer()
+    code_model = FakeChatModel(
+        respond=code_model_response,
+        latency=latency,
+        tokens_per_second=tokens_per_second,
+    )
+    conversation_model = FakeChatModel(
+        respond=conversation_model_response,
+        latency=latency,
+        tokens_per_second=tokens_per_second,
+    )
+    embedding = DeterministicFakeEmbedding(size=64)
+
+    def load_llm_model(model, provider):
+        if model == app.AcceptableLLMModels.CODE_MODEL:
+            return code_model
+        return conversation_model
+
+    with contextlib.ExitStack() as stack:
+        workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        gitlab = stack.enter_context(FakeGitLab(per_page=100))
+        gitlab.add_merge_request("1", "1", "head", synthetic_changes(files))
+
+        stack.enter_context(
+            mock.patch.dict(
+                os.environ,
+                {
+                    "DB_PATH": os.path.join(workdir, "db"),
+                    "COLLECTION_NAME": "benchmark",
+                    "GIT_TOKEN": "benchmark-token",
+                    "GIT_PROJECT_ID": "1",
+                    "GIT_MERGE_REQUEST_IID": "1",
+                    "POST_PULL_REQUEST_COMMENT": "true",
+                    "REVIEW_MODE": review_mode,
+                    "REVIEW_FORMAT": review_format,
+                    "FINDINGS_CACHE": "false",
+                    "INCREMENTAL_REVIEW": "false",
+                    "NOTE_ID_CACHE": "false",
+                    "CODE_MODEL": "code-model",
+                    "CONVERSATION_MODEL": "conversation-model",
+                    "VECTOR_STORE": vector_store,
+                    "REVIEW_OUTPUT_DIR": os.path.join(workdir, "response"),
+                },
+            )
+        )
+
+        # The knowledge base is built up front, the review only reopens it
+        store = get_vector_store(vector_store).load(
+            path=os.environ["DB_PATH"],
+            collection_name=os.environ["COLLECTION_NAME"],
+            embedding=embedding,
+            documents=synthetic_guidelines(),
+        )
+        resource_pool.invalidate()
+        store.clear_cache()
+        resource_pool.put(
+            (ResourceKind.EMBEDDING, app.get_embedding_backend()), embedding
+        )
+
+        stack.enter_context(
+            mock.patch.object(
+                app,
+                "load_git",
+                lambda: Git.get_client(token=os.environ["GIT_TOKEN"], url=gitlab.url),
+            )
+        )
+        stack.enter_context(mock.patch.object(app, "load_llm_model", load_llm_model))
+        critical_paths: Dict[str, Any] = {}
+        report_critical_path = app.report_critical_path
+
+        def capture_critical_path(name, graph):
+            critical_paths[name] = graph.critical_path()
+            return report_critical_path(name, graph)
+
+        stack.enter_context(
+            mock.patch.object(app, "report_critical_path", capture_critical_path)
+        )
+        summaries: List[Dict[str, Dict[str, float]]] = []
+        report_trace = app.report_trace
+
+        def capture_trace(spans):
+            summaries.append(report_trace(spans))
+            return summaries[-1]
+
+        stack.enter_context(mock.patch.object(app, "report_trace", capture_trace))
+        stack.enter_context(timer.wrap(app, "pack_prompt", "diff_fetch"))
+        stack.enter_context(timer.wrap(app, "load_knowledge_base", "knowledge_base"))
+        stack.enter_context(
+            timer.wrap(type(store), "get_retriever_from_hunks", "retrieval")
+        )
+        stack.enter_context(timer.wrap(app, "review_changes", "code_review"))
+        stack.enter_context(timer.wrap(app.FindingsParser, "feed", "json_parse"))
+        stack.enter_context(timer.wrap(app, "write_merge_request_comment", "comment"))
+        if quiet:
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            response = app.run_review()
+        finally:
+            total = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resource_pool.invalidate()
+
+        notes = sum(len(notes) for notes in gitlab.notes.values())
+
+    stages = dict(timer.durations)
+    stages["response"] = conversation_model.busy_time
+    # Time from the start of the code review to the first parsed finding
+    for summary in summaries:
+        if "first_finding" in summary:
+            stages["first_finding"] = summary["first_finding"]["seconds"]
+    tokens = code_model.output_tokens + conversation_model.output_tokens
+
+    return {
+        "files": files,
+        "review_mode": review_mode,
+        "review_format": review_format,
+        "vector_store": vector_store,
+        "total": total,
+        "stages": stages,
+        "critical_path": critical_paths.get("prepare", ([], 0.0))[0],
+        "critical_path_seconds": critical_paths.get("prepare", ([], 0.0))[1],
+        "peak_memory_mb": peak / (1024 * 1024),
+        "files_per_second": files / total if total else 0.0,
+        "tokens_per_second": tokens / total if total else 0.0,
+        "llm_calls": code_model.calls + conversation_model.calls,
+        "output_tokens": tokens,
+        "comments": notes,
+        "reviewed": bool(response),
+    }
+
+
+def case_name(metrics: Metrics) -> str:
+    name = f"{metrics['review_mode']}-{metrics['files']}"
+    if metrics.get("review_format", "llm") != "llm":
+        name += f"-{metrics['review_format']}"
+    if metrics.get("vector_store", "chroma") != "chroma":
+        name += f"-{metrics['vector_store']}"
+    return name
+
+
+def flatten(metrics: Metrics) -> Dict[str, float]:
+    values = {
+        "total": metrics["total"],
+        "peak_memory_mb": metrics["peak_memory_mb"],
+        "files_per_second": metrics["files_per_second"],
+        "tokens_per_second": metrics["tokens_per_second"],
+    }
+    values.update({f"stage.{k}": v for k, v in metrics["stages"].items()})
+    return values
+
+
+def compare(
+    results: List[Metrics],
+    baseline: Dict[str, Metrics],
+    threshold: float = REGRESSION_THRESHOLD,
+) -> List[str]:
+    """
+    Returns a line per metric that got worse than the baseline by more than
+    `threshold` (relative).
+    """
+    regressions = []
+    for metrics in results:
+        name = case_name(metrics)
+        if name not in baseline:
+            continue
+
+        previous = flatten(baseline[name])
+        for metric, value in flatten(metrics).items():
+            before = previous.get(metric)
+            if not before:
+                continue
+
+            change = (value - before) / before
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append(
+                    f"{name} {metric}: {before:.4f} -> {value:.4f} "
+                    f"({change:+.0%} worse)"
+                )
+    return regressions
+
+
+def load_baseline(path: str) -> Dict[str, Metrics]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, results: List[Metrics]):
+    baseline = load_baseline(path)
+    baseline.update({case_name(metrics): metrics for metrics in results})
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def print_report(results: List[Metrics]):
+    stages = sorted({stage for metrics in results for stage in metrics["stages"]})
+    header = ["case", "total", *stages, "peak MB", "files/s", "tokens/s"]
+    print(" | ".join(header))
+    for metrics in results:
+        row = [
+            case_name(metrics),
+            f"{metrics['total']:.3f}s",
+            *(f"{metrics['stages'].get(stage, 0.0):.3f}s" for stage in stages),
+            f"{metrics['peak_memory_mb']:.1f}",
+            f"{metrics['files_per_second']:.1f}",
+            f"{metrics['tokens_per_second']:.1f}",
+        ]
+        print(" | ".join(row))
+
+    for metrics in results:
+        print(
+            f"{case_name(metrics)} critical path: "
+            f"{' → '.join(metrics.get('critical_path', []))} "
+            f"({metrics.get('critical_path_seconds', 0.0):.3f}s)"
+        )
+
+
+def main():
+    """
+    Benchmarks the review pipeline offline:
+
+        python -m tests.benchmark --files 1 10 100 1000 5000
+        python -m tests.benchmark --files 100 --save-baseline
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the review pipeline")
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--mode", choices=["single", "map_reduce"], default="single")
+    parser.add_argument("--format", choices=["llm", "local"], default="llm")
+    parser.add_argument("--store", choices=["chroma", "mmap"], default="chroma")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = [
+        run_case(
+            files,
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            review_mode=args.mode,
+            review_format=args.format,
+            vector_store=args.store,
+        )
+        for files in args.files
+    ]
+    print_report(results)
+
+    regressions = compare(results, load_baseline(args.baseline))
+    for regression in regressions:
+        print(f"⚠️ {regression}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"💾 Baseline saved in {args.baseline}")
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
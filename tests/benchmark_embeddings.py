@@ -0,0 +1,95 @@
+import argparse
+import os
+import random
+import time
+from typing import Dict, List
+from unittest import mock
+
+from llm_reviewer.embeddings import embedding_backends, get_embedding_model
+from llm_reviewer.ingestion import CHUNK_SIZE
+
+WORDS = (
+    "function class module test variable return exception query request "
+    "response cache index review guideline must should avoid prefer name"
+).split()
+
+
+def synthetic_chunks(count: int, seed: int = 0) -> List[str]:
+    """
+    Chunks between a tenth of and the full ingestion chunk size, so the
+    batches have to deal with texts of different lengths.
+    """
+    generator = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        size = generator.randint(CHUNK_SIZE // 10, CHUNK_SIZE)
+        words: List[str] = []
+        while sum(len(word) + 1 for word in words) < size:
+            words.append(generator.choice(WORDS))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def run_case(
+    backend: str, chunks: List[str], batch_size: int, threads: int
+) -> Dict[str, float]:
+    with mock.patch.dict(
+        os.environ,
+        {"EMBEDDING_BATCH_SIZE": str(batch_size), "EMBEDDING_THREADS": str(threads)},
+    ):
+        started = time.perf_counter()
+        embedding = embedding_backends[backend]()
+        load = time.perf_counter() - started
+
+    # Warm up, the first call allocates the session buffers
+    embedding.embed_documents(chunks[:batch_size])
+
+    started = time.perf_counter()
+    embedding.embed_documents(chunks)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "load": load,
+        "seconds": elapsed,
+        "chunks_per_second": len(chunks) / elapsed,
+    }
+
+
+def main():
+    """
+    Measures the embedding throughput of each backend on the CPU:
+
+        python -m tests.benchmark_embeddings --backend huggingface onnx
+        python -m tests.benchmark_embeddings --backend onnx --threads 4
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends")
+    parser.add_argument(
+        "--backend",
+        nargs="+",
+        choices=sorted(embedding_backends),
+        default=sorted(embedding_backends),
+    )
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks)
+    print(f"model: {get_embedding_model()}, chunks: {len(chunks)}")
+    print(" | ".join(["backend", "load", "embed", "chunks/s"]))
+    for backend in args.backend:
+        metrics = run_case(backend, chunks, args.batch_size, args.threads)
+        print(
+            " | ".join(
+                [
+                    backend,
+                    f"{metrics['load']:.2f}s",
+                    f"{metrics['seconds']:.2f}s",
+                    f"{metrics['chunks_per_second']:.1f}",
+                ]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import threading
+
+import pytest
+import redis
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address
+    from llm_reviewer.streamlit import cache
+
+    monkeypatch.setattr(
+        cache, "connection_pool", redis.ConnectionPool(host=host, port=port, db=0)
+    )
+    yield server
+
+    server.shutdown()
+    server.server_close()
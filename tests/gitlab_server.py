@@ -0,0 +1,265 @@
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+MERGE_REQUEST_PATH = re.compile(
+    r"^/api/v4/projects/(?P<project>[^/]+)/merge_requests/(?P<iid>\d+)"
+    r"(?P<rest>/.*)?$"
+)
+COMPARE_PATH = re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/repository/compare$")
+MERGE_BASE_PATH = re.compile(
+    r"^/api/v4/projects/(?P<project>[^/]+)/repository/merge_base$"
+)
+FILE_PATH = re.compile(
+    r"^/api/v4/projects/(?P<project>[^/]+)/repository/files/(?P<path>[^/]+)/raw$"
+)
+
+
+class FakeGitLab:
+    """
+    Local stand-in for the GitLab API endpoints used by the reviewer. It
+    counts requests per (method, endpoint) and the TCP connections opened.
+    """
+
+    def __init__(self, per_page: int = 20):
+        self.per_page = per_page
+        self.merge_requests: Dict[Tuple[str, str], Dict] = {}
+        self.notes: Dict[Tuple[str, str], List[Dict]] = {}
+        self.compare: Dict[Tuple[str, str], List[Dict]] = {}
+        # Common ancestor of two commits, the first one unless set here
+        # (i.e. the history is linear until it is rewritten)
+        self.merge_bases: Dict[Tuple[str, str], str] = {}
+        self.files: Dict[Tuple[str, str, str], bytes] = {}
+        self.diffs_endpoint = True
+        self.requests: Counter = Counter()
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.__next_note_id = 1
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_merge_request(
+        self, project_id: str, iid: str, sha: str, changes: List[Dict]
+    ):
+        self.merge_requests[(str(project_id), str(iid))] = {
+            "sha": sha,
+            "changes": changes,
+        }
+        self.notes.setdefault((str(project_id), str(iid)), [])
+
+    def add_file(self, project_id: str, ref: str, path: str, content: bytes):
+        self.files[(str(project_id), ref, path)] = content
+
+    def add_note(self, project_id: str, iid: str, body: str) -> int:
+        with self.lock:
+            note_id = self.__next_note_id
+            self.__next_note_id += 1
+            self.notes[(str(project_id), str(iid))].append(
+                {"id": note_id, "body": body}
+            )
+        return note_id
+
+    def compare_changes(self, from_sha: str, to_sha: str) -> List[Dict]:
+        """
+        Changes between two commits. Compared from the merge request base,
+        a head is its merge request diff.
+        """
+        if (from_sha, to_sha) in self.compare:
+            return self.compare[(from_sha, to_sha)]
+        if from_sha == "base":
+            for merge_request in self.merge_requests.values():
+                if merge_request["sha"] == to_sha:
+                    return merge_request["changes"]
+        return []
+
+    def count(self, method: str, endpoint: str) -> int:
+        return self.requests[(method, endpoint)]
+
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __handler(self):
+        gitlab = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with gitlab.lock:
+                    gitlab.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.__dispatch("GET")
+
+            def do_POST(self):
+                self.__dispatch("POST")
+
+            def do_PUT(self):
+                self.__dispatch("PUT")
+
+            def __reply(self, status: int, body, headers: Dict[str, str] = {}):
+                raw = isinstance(body, bytes)
+                payload = body if raw else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header(
+                    "Content-Type",
+                    "application/octet-stream" if raw else "application/json",
+                )
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def __body(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if not raw:
+                    return {}
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    return json.loads(raw)
+                return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+
+            def __paginate(self, items: List, query: Dict, path: str):
+                page = int(query.get("page", ["1"])[0])
+                per_page = int(query.get("per_page", [str(gitlab.per_page)])[0])
+                pages = max(1, -(-len(items) // per_page))
+                headers = {
+                    "X-Page": str(page),
+                    "X-Per-Page": str(per_page),
+                    "X-Total": str(len(items)),
+                    "X-Total-Pages": str(pages),
+                }
+                if page < pages:
+                    headers["X-Next-Page"] = str(page + 1)
+                    headers["Link"] = (
+                        f"<{gitlab.url}{path}?page={page + 1}&per_page={per_page}>; "
+                        'rel="next"'
+                    )
+                start = (page - 1) * per_page
+                return items[start : start + per_page], headers
+
+            def __dispatch(self, method: str):
+                parsed = urlparse(self.path)
+                path = parsed.path
+                query = parse_qs(parsed.query)
+                body = self.__body()
+
+                if path == "/api/v4/user":
+                    gitlab.requests[(method, "user")] += 1
+                    return self.__reply(200, {"id": 1, "username": "reviewer"})
+
+                match = COMPARE_PATH.match(path)
+                if match:
+                    gitlab.requests[(method, "compare")] += 1
+                    key = (query["from"][0], query["to"][0])
+                    return self.__reply(200, {"diffs": gitlab.compare_changes(*key)})
+
+                match = MERGE_BASE_PATH.match(path)
+                if match:
+                    gitlab.requests[(method, "merge_base")] += 1
+                    refs = query["refs[]"]
+                    merge_base = gitlab.merge_bases.get(tuple(refs), refs[0])
+                    return self.__reply(200, {"id": merge_base})
+
+                match = FILE_PATH.match(path)
+                if match:
+                    gitlab.requests[(method, "file")] += 1
+                    content = gitlab.files.get(
+                        (match["project"], query["ref"][0], unquote(match["path"]))
+                    )
+                    if content is None:
+                        return self.__reply(404, {"message": "404 File Not Found"})
+                    return self.__reply(200, content)
+
+                match = MERGE_REQUEST_PATH.match(path)
+                if not match:
+                    return self.__reply(404, {"message": "404 Not Found"})
+
+                key = (match["project"], match["iid"])
+                merge_request = gitlab.merge_requests.get(key)
+                if merge_request is None:
+                    return self.__reply(404, {"message": "404 Not Found"})
+
+                rest = match["rest"] or ""
+                notes = gitlab.notes[key]
+
+                if rest == "":
+                    gitlab.requests[(method, "merge_request")] += 1
+                    return self.__reply(
+                        200,
+                        {
+                            "iid": int(match["iid"]),
+                            "project_id": match["project"],
+                            "sha": merge_request["sha"],
+                            "diff_refs": {
+                                "base_sha": "base",
+                                "start_sha": "base",
+                                "head_sha": merge_request["sha"],
+                            },
+                        },
+                    )
+
+                if rest == "/changes":
+                    gitlab.requests[(method, "changes")] += 1
+                    return self.__reply(200, {"changes": merge_request["changes"]})
+
+                if rest == "/diffs" and gitlab.diffs_endpoint:
+                    gitlab.requests[(method, "diffs")] += 1
+                    page, headers = self.__paginate(
+                        merge_request["changes"], query, path
+                    )
+                    return self.__reply(200, page, headers)
+
+                if rest == "/discussions":
+                    gitlab.requests[(method, "discussions")] += 1
+                    discussions = [
+                        {"id": f"discussion-{note['id']}", "notes": [note]}
+                        for note in notes
+                    ]
+                    page, headers = self.__paginate(discussions, query, path)
+                    return self.__reply(200, page, headers)
+
+                if rest == "/notes" and method == "POST":
+                    gitlab.requests[(method, "notes")] += 1
+                    note_id = gitlab.add_note(key[0], key[1], body["body"])
+                    return self.__reply(201, {"id": note_id, "body": body["body"]})
+
+                note_match = re.match(r"^/notes/(\d+)$", rest)
+                if note_match:
+                    gitlab.requests[(method, "note")] += 1
+                    note = next(
+                        (n for n in notes if n["id"] == int(note_match[1])), None
+                    )
+                    if note is None:
+                        return self.__reply(404, {"message": "404 Not found"})
+                    if method == "PUT":
+                        note["body"] = body["body"]
+                    return self.__reply(200, note)
+
+                return self.__reply(404, {"message": "404 Not Found"})
+
+        return Handler
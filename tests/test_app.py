@@ -0,0 +1,456 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from llm_reviewer import app
+from llm_reviewer.git import Git
+from llm_reviewer.resources import ResourceKind, resource_pool
+from llm_reviewer.streamlit import cache
+from llm_reviewer.vector_store import get_vector_store
+from tests.benchmark import FakeChatModel
+from tests.gitlab_server import FakeGitLab
+
+
+@pytest.fixture(autouse=True)
+def code_model(monkeypatch):
+    monkeypatch.setenv("CODE_MODEL", "code-model")
+
+
+def code_change(path: str, lines: int = 3) -> str:
+    return f"File: {path}\n@@ -1,{lines} +1,{lines} @@\n" + "".join(
+        f"+    value_{line} = compute(value_{line})\n" for line in range(lines)
+    )
+
+
+def test_pack_prompt_filters_splits_and_packs_in_one_pass():
+    consumed = []
+
+    def stream():
+        for path in ["src/a.py", "poetry.lock", "src/b.py", "src/c.py"]:
+            consumed.append(path)
+            yield code_change(path)
+
+    units, hunks, saved, cut = app.pack_prompt(stream(), budget=70, group=True)
+
+    assert consumed == ["src/a.py", "poetry.lock", "src/b.py", "src/c.py"]
+    assert [hunk.split("\n", 1)[0] for hunk in hunks] == [
+        "File: src/a.py",
+        "File: src/b.py",
+        "File: src/c.py",
+    ]
+    assert len(units) == 2
+    assert "poetry.lock" not in "".join(units)
+    assert saved > 0
+    assert cut == 0
+
+
+def test_map_reduce_reviews_each_file_separately_and_merges_the_findings(
+    monkeypatch,
+):
+    monkeypatch.setenv("REVIEW_MAX_CONCURRENCY", "2")
+    paths = ["src/a.py", "src/b.py", "src/c.py", "src/d.py"]
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def review(prompt):
+        with lock:
+            running.append(prompt)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(prompt)
+
+        path = prompt.split("\n", 1)[0][len("File: ") :]
+        findings = [{"file": path, "line": 1, "problem": f"Bad name in {path}."}]
+        if path in ("src/a.py", "src/b.py"):
+            # Each review of a shared helper reports it again
+            findings.append({"file": "src/util.py", "line": 9, "problem": "Unused."})
+        return json.dumps(findings)
+
+    # Split: each file becomes a unit of its own
+    units, _, _, _ = app.pack_prompt(
+        (code_change(path) for path in paths), budget=10_000, group=False
+    )
+    assert [unit.split("\n", 1)[0] for unit in units] == [
+        f"File: {path}" for path in paths
+    ]
+
+    # Map over the units, at most two at a time, then reduce and merge
+    findings = app.review_changes(RunnableLambda(review), units, "context")
+
+    assert max(max_running) == 2
+    assert [(finding["file"], finding["line"]) for finding in findings] == [
+        ("src/a.py", 1),
+        ("src/util.py", 9),
+        ("src/b.py", 1),
+        ("src/c.py", 1),
+        ("src/d.py", 1),
+    ]
+
+
+def test_clean_changes_are_cached_but_parse_failures_are_not(redis_server, monkeypatch):
+    monkeypatch.setenv("FINDINGS_CACHE", "true")
+    outputs = {
+        "clean": "No issues found.\n```json\n[]\n```",
+        "issue": '[{"file": "src/issue.py", "line": 1, "problem": "Bad name."}]',
+        "broken": '[{"file": "src/broken.py", "line": 1 "problem": "Bad"}]',
+    }
+    reviewed = []
+
+    def review(prompt):
+        reviewed.append(prompt)
+        return outputs[prompt]
+
+    chain = RunnableLambda(review)
+    for _ in range(2):
+        unparsed = []
+        findings = app.review_changes(chain, list(outputs), "context", unparsed)
+
+        assert [finding["file"] for finding in findings] == ["src/issue.py"]
+        assert unparsed == [outputs["broken"]]
+
+    assert sorted(reviewed) == ["broken", "broken", "clean", "issue"]
+
+
+def test_findings_cache_reports_the_calls_and_tokens_saved(
+    redis_server, monkeypatch, capsys
+):
+    monkeypatch.setenv("FINDINGS_CACHE", "true")
+    usage = {"input_tokens": 90, "output_tokens": 10, "total_tokens": 100}
+    chain = RunnableLambda(lambda prompt: AIMessage(content="[]", usage_metadata=usage))
+
+    app.review_changes(chain, ["first", "second"], "context")
+    app.review_changes(chain, ["first", "second", "third"], "context")
+
+    reports = [line for line in capsys.readouterr().out.splitlines() if "💾" in line]
+    assert reports == [
+        "💾 Findings cache: 0 LLM calls and 0 tokens saved",
+        "💾 Findings cache: 2 LLM calls and 200 tokens saved",
+    ]
+
+
+def test_merge_previous_findings_drops_the_findings_of_changed_files():
+    previous = [
+        {"file": "src/kept.py", "line": 1, "problem": "Bad name."},
+        {"file": "src/changed.py", "line": 2, "problem": "Too long."},
+    ]
+    findings = [
+        {"file": "src/changed.py", "line": 5, "problem": "Unused import."},
+        {"file": "src/kept.py", "line": 1, "problem": "bad  name."},
+    ]
+
+    merged = app.merge_previous_findings(findings, previous, {"src/changed.py"})
+
+    assert merged == [
+        {"file": "src/changed.py", "line": 5, "problem": "Unused import."},
+        {"file": "src/kept.py", "line": 1, "problem": "bad  name."},
+    ]
+    assert app.merge_previous_findings(None, previous, set()) == previous
+
+
+def file_change(path: str, code: str) -> dict:
+    return {
+        "old_path": path,
+        "new_path": path,
+        "diff": f"@@ -1,1 +1,1 @@\n-    pass\n+    {code}\n",
+    }
+
+
+def report_bugs(prompt: str) -> str:
+    """
+    Reports a finding for every file of the prompt whose change calls bug().
+    """
+    files = re.findall(r"^File: (.+)\n((?:(?!File: ).*\n?)*)", prompt, re.MULTILINE)
+    return json.dumps(
+        [
+            {"file": path, "line": 1, "problem": "Calls bug().", "suggestion": "Fix."}
+            for path, diff in files
+            if "bug()" in diff
+        ]
+    )
+
+
+REVIEW = "# Code Review Documentation\n\nsrc/a.py calls bug(), remove the call.\n"
+
+
+@pytest.fixture
+def review_setup(monkeypatch, tmp_path):
+    """
+    Reviews merge request 1 of project 1 on a local GitLab with fake models:
+    the code model flags the files calling bug() and the conversation model
+    streams `REVIEW` a word at a time.
+    """
+    code_model = FakeChatModel(respond=report_bugs)
+    conversation_model = FakeChatModel(
+        respond=lambda prompt: REVIEW, tokens_per_second=50
+    )
+    knowledge_base = SimpleNamespace(
+        get_retriever_from_hunks=lambda hunks, max_chars: SimpleNamespace(documents=[])
+    )
+
+    def load_llm_model(model, provider):
+        if model == app.AcceptableLLMModels.CODE_MODEL:
+            return code_model
+        return conversation_model
+
+    with FakeGitLab(per_page=100) as gitlab:
+        for name, value in {
+            "GIT_TOKEN": "token",
+            "GIT_PROJECT_ID": "1",
+            "GIT_MERGE_REQUEST_IID": "1",
+            "REVIEW_OUTPUT_DIR": str(tmp_path),
+        }.items():
+            monkeypatch.setenv(name, value)
+        for name in [
+            "FINDINGS_CACHE",
+            "INCREMENTAL_REVIEW",
+            "NOTE_ID_CACHE",
+            "POST_PULL_REQUEST_COMMENT",
+            "REVIEW_FORMAT",
+            "REVIEW_MODE",
+        ]:
+            monkeypatch.delenv(name, raising=False)
+        monkeypatch.setattr(
+            app, "load_git", lambda: Git.get_client(token="token", url=gitlab.url)
+        )
+        monkeypatch.setattr(app, "load_knowledge_base", lambda: knowledge_base)
+        monkeypatch.setattr(app, "load_llm_model", load_llm_model)
+        yield SimpleNamespace(
+            gitlab=gitlab,
+            code_model=code_model,
+            conversation_model=conversation_model,
+        )
+
+
+@pytest.fixture
+def incremental_review(review_setup, redis_server, monkeypatch):
+    monkeypatch.setenv("INCREMENTAL_REVIEW", "true")
+    monkeypatch.setenv("REVIEW_FORMAT", "local")
+    return review_setup.gitlab, review_setup.code_model
+
+
+def test_incremental_review_reviews_only_the_commits_since_the_last_review(
+    incremental_review, tmp_path
+):
+    gitlab, code_model = incremental_review
+    gitlab.add_merge_request(
+        "1",
+        "1",
+        "first",
+        [
+            file_change("src/a.py", "bug()"),
+            file_change("src/b.py", "fine()"),
+            file_change("src/c.py", "bug()"),
+        ],
+    )
+
+    response = app.run_review()
+
+    assert "src/c.py" in response
+    output_dir = tmp_path / "1" / "1"
+    assert (output_dir / "code_review.md").read_text(encoding="utf-8") == response
+    assert len(json.loads((output_dir / "code_review.json").read_text())) == 2
+    state = cache.get_review_state("1", "1")
+    assert state["head_sha"] == "first"
+    assert [finding["file"] for finding in state["findings"]] == [
+        "src/a.py",
+        "src/c.py",
+    ]
+
+    gitlab.merge_requests[("1", "1")]["sha"] = "second"
+    gitlab.compare[("first", "second")] = [
+        file_change("src/c.py", "fine()"),
+        file_change("src/d.py", "bug()"),
+    ]
+
+    response = app.run_review()
+
+    assert "src/c.py" not in response
+    assert gitlab.count("GET", "compare") == 2
+    assert gitlab.count("GET", "diffs") == 0
+    state = cache.get_review_state("1", "1")
+    assert state["head_sha"] == "second"
+    assert [finding["file"] for finding in state["findings"]] == [
+        "src/d.py",
+        "src/a.py",
+    ]
+
+    calls = code_model.calls
+    assert app.run_review() is None
+    assert code_model.calls == calls
+
+    # A job for an already reviewed head SHA doesn't call GitLab
+    requests = gitlab.total_requests()
+    assert app.run_review("1", "1", head_sha="second") is None
+    assert gitlab.total_requests() == requests
+
+
+def test_a_rewritten_history_is_reviewed_again_in_full(incremental_review):
+    gitlab, code_model = incremental_review
+    gitlab.add_merge_request(
+        "1",
+        "1",
+        "first",
+        [file_change("src/a.py", "bug()"), file_change("src/b.py", "bug()")],
+    )
+    app.run_review()
+
+    # Force-pushed: src/b.py is fixed and "first" is no longer in the history
+    gitlab.add_merge_request(
+        "1",
+        "1",
+        "rebased",
+        [file_change("src/a.py", "bug()"), file_change("src/b.py", "fine()")],
+    )
+    gitlab.merge_bases[("first", "rebased")] = "base"
+    gitlab.compare[("first", "rebased")] = [file_change("src/main.py", "target()")]
+
+    response = app.run_review()
+
+    assert gitlab.count("GET", "merge_base") == 1
+    assert "src/b.py" not in response
+    assert "src/main.py" not in response
+    state = cache.get_review_state("1", "1")
+    assert state["head_sha"] == "rebased"
+    assert [finding["file"] for finding in state["findings"]] == ["src/a.py"]
+
+
+def test_the_state_records_the_head_the_diff_was_taken_from(
+    incremental_review, monkeypatch
+):
+    gitlab, code_model = incremental_review
+    gitlab.add_merge_request("1", "1", "first", [file_change("src/a.py", "bug()")])
+    gitlab.compare[("base", "first")] = [file_change("src/a.py", "bug()")]
+    get_diff_refs = app.get_pull_request_diff_refs
+
+    def push_after_reading_the_head(*args):
+        diff_refs = get_diff_refs(*args)
+        # Lands between the head being read and the diff being fetched
+        gitlab.add_merge_request(
+            "1",
+            "1",
+            "second",
+            [file_change("src/a.py", "bug()"), file_change("src/b.py", "bug()")],
+        )
+        return diff_refs
+
+    monkeypatch.setattr(app, "get_pull_request_diff_refs", push_after_reading_the_head)
+    response = app.run_review()
+
+    assert "src/b.py" not in response
+    assert cache.get_review_state("1", "1")["head_sha"] == "first"
+
+    monkeypatch.setattr(app, "get_pull_request_diff_refs", get_diff_refs)
+    gitlab.compare[("first", "second")] = [file_change("src/b.py", "bug()")]
+    response = app.run_review()
+
+    assert "src/b.py" in response
+    state = cache.get_review_state("1", "1")
+    assert state["head_sha"] == "second"
+    assert [finding["file"] for finding in state["findings"]] == [
+        "src/b.py",
+        "src/a.py",
+    ]
+
+
+def test_a_review_without_findings_still_records_its_state(incremental_review):
+    gitlab, code_model = incremental_review
+    gitlab.add_merge_request("1", "1", "first", [file_change("src/a.py", "fine()")])
+
+    assert app.run_review() is None
+    assert cache.get_review_state("1", "1") == {"head_sha": "first", "findings": []}
+
+    assert app.run_review() is None
+    assert code_model.calls == 1
+
+
+def test_stream_review_yields_the_review_as_it_is_generated(review_setup, tmp_path):
+    review_setup.gitlab.add_merge_request(
+        "1", "1", "head", [file_change("src/a.py", "bug()")]
+    )
+    metrics = {}
+
+    started = time.perf_counter()
+    chunks = []
+    for chunk in app.stream_review(metrics):
+        chunks.append((chunk, time.perf_counter() - started))
+    elapsed = time.perf_counter() - started
+
+    assert "".join(chunk for chunk, _ in chunks) == REVIEW
+    assert len(chunks) == len(REVIEW.split())
+    # The first words arrive well before the last ones are generated
+    assert chunks[-1][1] - chunks[0][1] >= 0.1
+    assert metrics["time_to_first_token"] <= chunks[0][1]
+    assert metrics["time_to_first_token"] < elapsed - 0.1
+    assert {"code_review", "diff_fetch", "retrieval"} <= set(metrics["stages"])
+    assert "diff_fetch" in metrics["critical_path"]["critical_path"]
+    assert (tmp_path / "1" / "1" / "code_review.md").read_text(
+        encoding="utf-8"
+    ) == REVIEW
+
+
+def test_stream_review_yields_nothing_without_new_commits(incremental_review):
+    gitlab, code_model = incremental_review
+    gitlab.add_merge_request("1", "1", "head", [file_change("src/a.py", "bug()")])
+    app.run_review()
+
+    assert list(app.stream_review()) == []
+    assert code_model.calls == 1
+
+
+def test_main_streams_the_review_to_stdout(review_setup, capsys):
+    review_setup.gitlab.add_merge_request(
+        "1", "1", "head", [file_change("src/a.py", "bug()")]
+    )
+
+    app.main()
+
+    out = capsys.readouterr().out
+    assert REVIEW in out
+    assert "⏱️ Time to first token:" in out
+    assert out.index("⏱️ Time to first token:") < out.index(REVIEW)
+    assert out.endswith("\n")
+
+
+@pytest.mark.parametrize("backend", ["chroma", "mmap"])
+def test_removing_a_document_does_not_load_the_embedding_model(
+    backend, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("VECTOR_STORE", backend)
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "db"))
+    monkeypatch.setenv("COLLECTION_NAME", "guidelines")
+    resource_pool.invalidate(ResourceKind.VECTOR_STORE)
+    get_vector_store().clear_cache()
+    get_vector_store().load(
+        path=str(tmp_path / "db"),
+        collection_name="guidelines",
+        embedding=DeterministicFakeEmbedding(size=8),
+    ).save_documents(
+        [Document(page_content=f"rule {index}") for index in range(3)],
+        ids=["naming:0", "naming:1", "errors:0"],
+    )
+    manifest = app.load_manifest()
+    manifest.set("naming.md", "naming", ["naming:0", "naming:1"])
+    manifest.set("errors.md", "errors", ["errors:0"])
+    manifest.save()
+
+    def load_embeddings():
+        raise AssertionError("the embedding model was loaded")
+
+    monkeypatch.setattr(app, "load_embeddings", load_embeddings)
+    app.remove_vector_store_documents("naming.md")
+
+    store = get_vector_store().load(
+        path=str(tmp_path / "db"), collection_name="guidelines", embedding=None
+    )
+    assert store.count() == 1
+    assert list(app.load_manifest().files) == ["errors.md"]
@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+from llm_reviewer.batch import (
+    JobState,
+    JsonlJobQueue,
+    RedisJobQueue,
+    run_batch,
+)
+
+
+class FakeReview:
+    """
+    Stands in for `run_review`, tracking how many reviews run at once and
+    failing the first `failures[mr_iid]` attempts of a merge request.
+    """
+
+    def __init__(self, latency: float = 0.02, failures=None):
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+        self.head_shas = []
+        self.lock = threading.Lock()
+
+    def __call__(self, project_id: str, merge_request_iid: str, head_sha=None):
+        with self.lock:
+            self.calls.append((project_id, merge_request_iid))
+            self.head_shas.append(head_sha)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            fail = self.failures.get(merge_request_iid, 0) > 0
+            if fail:
+                self.failures[merge_request_iid] -= 1
+
+        time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+
+        if fail:
+            raise RuntimeError("LLM unavailable")
+        return "review"
+
+
+def write_jobs(path, count):
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(count):
+            file.write(json.dumps({"project_id": 1, "mr_iid": i}) + "\n")
+        file.write("not json\n")
+
+
+def test_batch_bounds_concurrency_and_writes_status(tmp_path):
+    jobs_path = tmp_path / "jobs.jsonl"
+    write_jobs(jobs_path, 12)
+    review = FakeReview()
+
+    statuses = run_batch(JsonlJobQueue(str(jobs_path)), review, workers=3)
+
+    assert len(statuses) == 12
+    assert review.max_running == 3
+    assert all(status["status"] == JobState.DONE for status in statuses)
+
+    status_path = tmp_path / "jobs.status.jsonl"
+    lines = status_path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 12
+    assert all(json.loads(line)["duration"] > 0 for line in lines)
+
+
+def test_batch_retries_with_backoff(tmp_path):
+    jobs_path = tmp_path / "jobs.jsonl"
+    write_jobs(jobs_path, 2)
+    review = FakeReview(latency=0, failures={"0": 2, "1": 5})
+
+    statuses = {
+        status["mr_iid"]: status
+        for status in run_batch(
+            JsonlJobQueue(str(jobs_path)),
+            review,
+            workers=2,
+            max_retries=2,
+            backoff=0.01,
+        )
+    }
+
+    assert statuses["0"]["status"] == JobState.DONE
+    assert statuses["0"]["attempts"] == 3
+    assert statuses["0"]["duration"] >= 0.03
+    assert statuses["1"]["status"] == JobState.FAILED
+    assert statuses["1"]["error"] == "RuntimeError: LLM unavailable"
+
+
+def test_batch_resumes_jsonl_file(tmp_path):
+    jobs_path = tmp_path / "jobs.jsonl"
+    write_jobs(jobs_path, 4)
+    run_batch(
+        JsonlJobQueue(str(jobs_path)),
+        FakeReview(latency=0, failures={"2": 1}),
+        max_retries=0,
+    )
+
+    review = FakeReview(latency=0)
+    run_batch(JsonlJobQueue(str(jobs_path)), review)
+
+    assert review.calls == [("1", "2")]
+
+
+def test_batch_drains_redis_list(redis_server):
+    queue = RedisJobQueue("review_jobs")
+    for i in range(5):
+        queue.client.rpush("review_jobs", json.dumps({"project_id": 1, "mr_iid": i}))
+
+    statuses = run_batch(queue, FakeReview(latency=0), workers=2)
+
+    assert len(statuses) == 5
+    assert queue.client.llen("review_jobs") == 0
+    assert queue.client.llen(queue.processing_key) == 0
+    stored = queue.client.hgetall("review_jobs:status")
+    assert len(stored) == 5
+    assert json.loads(stored[b"1:3"])["status"] == JobState.DONE
+
+
+def test_redis_jobs_of_a_crashed_batch_are_requeued(redis_server):
+    queue = RedisJobQueue("review_jobs", consumer="worker-1")
+    for i in range(3):
+        queue.client.rpush(
+            "review_jobs",
+            json.dumps({"project_id": 1, "mr_iid": i, "head_sha": f"sha-{i}"}),
+        )
+
+    # The batch stops after taking two jobs and reporting only the first
+    first = queue.next_job()
+    queue.next_job()
+    queue.report({**first, "status": JobState.DONE})
+    assert queue.client.llen(queue.processing_key) == 1
+
+    other = RedisJobQueue("review_jobs", consumer="worker-2")
+    assert other.client.llen("review_jobs") == 1
+
+    review = FakeReview(latency=0)
+    run_batch(RedisJobQueue("review_jobs", consumer="worker-1"), review)
+
+    assert review.calls == [("1", "1"), ("1", "2")]
+    assert review.head_shas == ["sha-1", "sha-2"]
+    assert queue.client.llen(queue.processing_key) == 0
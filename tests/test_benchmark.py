@@ -0,0 +1,101 @@
+import json
+import time
+
+import pytest
+
+from tests.benchmark import (
+    FakeChatModel,
+    code_model_response,
+    compare,
+    run_case,
+    synthetic_changes,
+)
+
+
+def test_fake_chat_model_streams_at_token_rate():
+    model = FakeChatModel(
+        respond=lambda prompt: "one two three four", latency=0.02, tokens_per_second=100
+    )
+
+    started = time.perf_counter()
+    chunks = [chunk.content for chunk in model.stream("review this")]
+    elapsed = time.perf_counter() - started
+
+    assert "".join(chunks) == "one two three four"
+    assert len(chunks) == 4
+    assert elapsed >= 0.06
+    assert model.calls == 1
+    assert model.output_tokens == 4
+
+
+def test_code_model_response_is_parseable_findings():
+    diff = "\n\n".join(
+        f"File: {change['new_path']}\n{change['diff']}"
+        for change in synthetic_changes(6)
+    )
+
+    findings = json.loads(code_model_response(diff))
+
+    assert [finding["file"] for finding in findings] == [
+        "src/package_0/module_0.py",
+        "src/package_3/module_3.py",
+    ]
+
+
+def test_compare_reports_only_regressions():
+    baseline = {
+        "single-10": {
+            "files": 10,
+            "review_mode": "single",
+            "total": 1.0,
+            "peak_memory_mb": 10.0,
+            "files_per_second": 10.0,
+            "tokens_per_second": 100.0,
+            "stages": {"retrieval": 0.2, "code_review": 0.5},
+        }
+    }
+    current = {
+        **baseline["single-10"],
+        "total": 1.1,
+        "files_per_second": 5.0,
+        "stages": {"retrieval": 0.5, "code_review": 0.2},
+    }
+
+    regressions = compare([current], baseline)
+
+    assert len(regressions) == 2
+    assert any("files_per_second" in line for line in regressions)
+    assert any("stage.retrieval" in line for line in regressions)
+
+
+@pytest.mark.parametrize(
+    "review_mode, review_format, vector_store, llm_calls",
+    [
+        ("single", "llm", "chroma", 2),
+        ("single", "local", "mmap", 1),
+        ("map_reduce", "llm", "mmap", 13),
+        ("map_reduce", "local", "chroma", 12),
+    ],
+)
+def test_run_case_reviews_a_synthetic_merge_request(
+    review_mode, review_format, vector_store, llm_calls
+):
+    metrics = run_case(
+        files=12,
+        review_mode=review_mode,
+        review_format=review_format,
+        vector_store=vector_store,
+    )
+
+    assert metrics["reviewed"]
+    assert metrics["comments"] == 1
+    assert metrics["llm_calls"] == llm_calls
+    assert {
+        "diff_fetch",
+        "knowledge_base",
+        "retrieval",
+        "code_review",
+        "json_parse",
+        "comment",
+        "response",
+    } <= set(metrics["stages"])
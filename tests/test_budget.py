@@ -0,0 +1,147 @@
+from langchain_core.documents import Document
+
+from llm_reviewer.budget import (
+    ChangeFilter,
+    ChangeKind,
+    estimate_tokens,
+    fit_change,
+    get_exclude_rules,
+    pack_changes,
+    pack_documents,
+)
+
+
+def change(path: str, body: str) -> str:
+    return f"File: {path}\n{body}"
+
+
+def code_change(path: str, lines: int = 3) -> str:
+    return change(
+        path,
+        "@@ -1,3 +1,3 @@\n"
+        + "\n".join(
+            f"+    value_{line} = compute(value_{line})" for line in range(lines)
+        ),
+    )
+
+
+def test_filter_changes_drops_low_value_changes():
+    deletion = change("src/legacy.py", "\n".join(f"-line {i}" for i in range(300)))
+    changes = [
+        code_change("src/app.py"),
+        change("poetry.lock", "+" + "x" * 4000),
+        change("web/dist/app.min.js", "+" + "y" * 4000),
+        change("data/model.bin", "Binary files a/model.bin and b/model.bin differ"),
+        change("src/renamed.py", ""),
+        deletion,
+    ]
+
+    change_filter = ChangeFilter(rules=get_exclude_rules())
+    kept = list(change_filter.filter(changes))
+
+    assert kept[0] == changes[0]
+    assert kept[1] == "File: src/legacy.py\n[300 lines deleted]"
+    assert len(kept) == 2
+    assert change_filter.files == 6
+    assert change_filter.skipped == {
+        ChangeKind.EXCLUDED: ["poetry.lock", "web/dist/app.min.js"],
+        ChangeKind.BINARY: ["data/model.bin"],
+        ChangeKind.EMPTY: ["src/renamed.py"],
+        ChangeKind.DELETION: ["src/legacy.py"],
+    }
+    assert change_filter.saved > 2000
+
+
+def test_changes_are_filtered_and_packed_as_they_are_consumed():
+    consumed = []
+
+    def stream():
+        for index in range(10):
+            consumed.append(index)
+            yield code_change(f"src/module_{index}.py")
+
+    kept = ChangeFilter(rules=[]).filter(stream())
+    assert consumed == []
+    assert next(kept).startswith("File: src/module_0.py")
+    assert consumed == [0]
+
+    units, _ = pack_changes(kept, 200, estimate_tokens)
+    assert consumed == list(range(10))
+    assert len(units) > 1
+
+
+def test_exclude_rules_can_be_extended(monkeypatch):
+    monkeypatch.setenv("DIFF_EXCLUDE", "migrations/*, *.snap")
+
+    change_filter = ChangeFilter()
+    kept = list(
+        change_filter.filter(
+            [
+                code_change("app/migrations/0001_initial.py"),
+                code_change("tests/__snapshots__/view.snap"),
+                code_change("app/views.py"),
+            ]
+        )
+    )
+
+    assert [change.split("\n")[0] for change in kept] == ["File: app/views.py"]
+    assert len(change_filter.skipped[ChangeKind.EXCLUDED]) == 2
+
+
+def test_fit_change_cuts_on_line_boundaries():
+    large = code_change("src/app.py", lines=200)
+
+    fitted, cut = fit_change(large, budget=100, count=estimate_tokens)
+
+    assert estimate_tokens(fitted) <= 100
+    assert fitted.startswith("File: src/app.py\n@@")
+    assert fitted.endswith("lines omitted to fit the context window]")
+    assert cut > 0
+    assert fit_change(fitted, budget=100, count=estimate_tokens) == (fitted, 0)
+
+
+def test_fit_change_keeps_the_header_or_skips_the_change():
+    large = code_change("src/app.py", lines=200)
+    header_tokens = estimate_tokens("File: src/app.py") + 1
+
+    fitted, _ = fit_change(large, budget=header_tokens + 14, count=estimate_tokens)
+
+    assert fitted.split("\n")[0] == "File: src/app.py"
+    assert fitted.split("\n")[1].startswith("[... ")
+    assert fit_change(large, budget=4, count=estimate_tokens) == (
+        None,
+        estimate_tokens(large),
+    )
+
+    units, cut = pack_changes(
+        [large, change("a.py", "+x")], budget=4, count=estimate_tokens
+    )
+    assert units == ["File: a.py\n+x"]
+    assert cut == estimate_tokens(large)
+
+
+def test_pack_changes_groups_changes_within_the_budget():
+    changes = [code_change(f"src/module_{i}.py") for i in range(20)]
+    budget = 200
+
+    units, cut = pack_changes(changes, budget, estimate_tokens)
+    separate, _ = pack_changes(changes, budget, estimate_tokens, group=False)
+
+    assert cut == 0
+    assert 1 < len(units) < len(changes)
+    assert all(estimate_tokens(unit) <= budget for unit in units)
+    assert "\n\n".join(units) == "\n\n".join(changes)
+    assert separate == changes
+
+
+def test_pack_documents_keeps_best_ranked_documents_that_fit():
+    documents = [
+        Document(page_content="a" * 400),
+        Document(page_content="b" * 800),
+        Document(page_content="c" * 200),
+    ]
+
+    kept, dropped = pack_documents(documents, budget=160, count=estimate_tokens)
+
+    assert [document.page_content[0] for document in kept] == ["a", "c"]
+    assert dropped == 201
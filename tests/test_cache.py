@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+
+import pytest
+import redis
+
+from llm_reviewer.streamlit import cache
+
+PROJECTS = 300
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    counter = {"count": 0}
+    send_packed_command = redis.connection.Connection.send_packed_command
+
+    def counting_send_packed_command(self, *args, **kwargs):
+        counter["count"] += 1
+        return send_packed_command(self, *args, **kwargs)
+
+    monkeypatch.setattr(
+        redis.connection.Connection,
+        "send_packed_command",
+        counting_send_packed_command,
+    )
+    return counter
+
+
+def seed_projects(count):
+    for i in range(count):
+        cache.git_projects.set(
+            str(i), {"name": f"project-{i}", "api_key": "token", "project_id": str(i)}
+        )
+
+
+def get_all_one_by_one(key):
+    # How `get_all` loaded values before: one GET per scanned key
+    client = cache.get_redis_client()
+    values = []
+    for redis_key in client.scan_iter(f"{key}*"):
+        value = client.get(redis_key)
+        if value:
+            values.append(json.loads(value.decode("utf-8")))
+    return values
+
+
+def test_repository_round_trip(redis_server):
+    cache.git_projects.set("42", {"name": "a", "api_key": "b", "project_id": "42"})
+
+    assert cache.git_projects.get("42")["name"] == "a"
+    assert cache.git_projects.get_many(["42", "missing"])[1] is None
+
+    cache.git_projects.delete("42")
+    assert cache.git_projects.get("42") is None
+
+
+def test_clients_share_connection_pool(redis_server):
+    first = cache.get_redis_client()
+    second = cache.get_redis_client()
+
+    assert first.connection_pool is second.connection_pool
+
+
+def test_get_all_uses_few_round_trips(redis_server, round_trips):
+    seed_projects(PROJECTS)
+    cache.get_all("git_projects")
+
+    round_trips["count"] = 0
+    start = time.perf_counter()
+    legacy = get_all_one_by_one("git_projects")
+    legacy_time = time.perf_counter() - start
+    legacy_round_trips = round_trips["count"]
+
+    round_trips["count"] = 0
+    start = time.perf_counter()
+    projects = cache.get_all("git_projects")
+    pooled_time = time.perf_counter() - start
+    pooled_round_trips = round_trips["count"]
+
+    print(
+        f"\nget_all over {PROJECTS} projects: "
+        f"one GET per key {legacy_round_trips} round trips in {legacy_time:.4f}s, "
+        f"MGET {pooled_round_trips} round trips in {pooled_time:.4f}s"
+    )
+
+    assert sorted(p["name"] for p in projects) == sorted(p["name"] for p in legacy)
+    assert len(projects) == PROJECTS
+    assert pooled_round_trips <= 2
+    assert legacy_round_trips > PROJECTS
+
+
+def cached_findings(index: int) -> dict:
+    return {"findings": [{"file": f"src/module_{index:03d}.py"}], "tokens": 10}
+
+
+def findings_bytes():
+    """
+    Returns the byte count kept by the cache and the sum of the entry sizes.
+    """
+    client = cache.get_redis_client()
+    sizes = client.hvals(cache.FINDINGS_SIZES_KEY)
+    return (
+        int(client.get(cache.FINDINGS_BYTES_KEY) or 0),
+        sum(int(size) for size in sizes),
+    )
+
+
+def test_findings_cache_evicts_the_oldest_entries_over_the_byte_cap(redis_server):
+    size = len(json.dumps(cached_findings(0)).encode("utf-8"))
+    ids = [f"change-{index}" for index in range(5)]
+
+    for index, id in enumerate(ids):
+        cache.set_findings(cached_findings(index), id, ttl=60, max_bytes=size * 3)
+    cache.set_findings(cached_findings(4), ids[4], ttl=60, max_bytes=size * 3)
+
+    assert cache.get_findings(ids) == [
+        None,
+        None,
+        cached_findings(2),
+        cached_findings(3),
+        cached_findings(4),
+    ]
+    assert findings_bytes() == (size * 3, size * 3)
+
+
+def test_expired_findings_give_their_bytes_back(redis_server):
+    size = len(json.dumps(cached_findings(0)).encode("utf-8"))
+    cache.set_findings(cached_findings(0), "expired", ttl=1, max_bytes=size * 10)
+    time.sleep(1.1)
+
+    cache.set_findings(cached_findings(1), "fresh", ttl=60, max_bytes=size * 10)
+
+    client = cache.get_redis_client()
+    assert findings_bytes() == (size, size)
+    assert client.zrange(cache.FINDINGS_INDEX_KEY, 0, -1) == [
+        cache.findings.key("fresh").encode("utf-8")
+    ]
+
+
+def test_concurrent_writers_keep_the_byte_count_exact(redis_server):
+    size = len(json.dumps(cached_findings(0)).encode("utf-8"))
+
+    def write(worker: int):
+        for index in range(10):
+            cache.set_findings(
+                cached_findings(worker * 10 + index),
+                f"change-{worker}-{index}",
+                ttl=60,
+                max_bytes=size * 5,
+            )
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [f"change-{worker}-{index}" for worker in range(4) for index in range(10)]
+    live = [entry for entry in cache.get_findings(ids) if entry is not None]
+    assert findings_bytes() == (size * 5, size * 5)
+    assert len(live) == 5
@@ -0,0 +1,105 @@
+import json
+
+from llm_reviewer.documents import (
+    FindingsParser,
+    render_review_markdown,
+)
+
+FINDINGS = [
+    {
+        "file": "src/app.py",
+        "line": 10,
+        "problem": "Uses print for logging.",
+        "suggestion": "Use the logger.",
+        "before": "```py\nprint('x')\n```",
+        "after": "logger.info('x')",
+    },
+    {
+        "file": "src/app.py",
+        "line": 22,
+        "problem": "Catches a bare exception.",
+        "suggestion": "Catch the specific error.",
+    },
+    {
+        "file": "src/db.py",
+        "line": 3,
+        "problem": "Opens a connection per query.",
+        "suggestion": "Reuse a pooled connection.",
+    },
+]
+
+
+def test_render_review_markdown_follows_the_response_template():
+    markdown = render_review_markdown(FINDINGS)
+
+    headings = [line for line in markdown.splitlines() if line.startswith("#")]
+    assert headings == [
+        "# Code Review Documentation",
+        "## Overview",
+        "## Code Issues and Modifications",
+        "## Summary of Findings",
+        "## Impact of Changes",
+        "## Conclusion",
+    ]
+    assert "1. Uses print for logging." in markdown
+    assert "3. Opens a connection per query." in markdown
+    assert "- **Line:** 22" in markdown
+    assert "```py\nprint('x')\n```" in markdown
+    assert "```\nlogger.info('x')\n```" in markdown
+    assert "- `src/app.py`: 2 issue(s)" in markdown
+
+
+def test_render_review_markdown_is_deterministic_and_deduplicated():
+    markdown = render_review_markdown(FINDINGS + FINDINGS[:1])
+
+    assert markdown == render_review_markdown(FINDINGS)
+    parser = FindingsParser()
+    assert parser.feed(markdown) == []
+    assert not parser.complete
+
+
+def test_findings_are_yielded_as_soon_as_each_object_closes():
+    output = f"Findings:\n```json\n{json.dumps(FINDINGS, indent=2)}\n```\n"
+    parser = FindingsParser()
+
+    first = output.index("}", output.index('"after"')) + 1
+    assert parser.feed(output[: first - 1]) == []
+    assert parser.feed(output[first - 1 : first]) == FINDINGS[:1]
+
+    streamed = FindingsParser()
+    tokens = [output[index : index + 3] for index in range(0, len(output), 3)]
+    findings = [finding for token in tokens for finding in streamed.feed(token)]
+    assert findings == FINDINGS
+    assert streamed.complete
+
+
+def test_malformed_findings_are_skipped():
+    output = (
+        '[{"file": "a.py", "problem": "Says \\"hi\\" with } and ]",},\n'
+        ' {"file": "b.py" "line": 2},\n'
+        ' {"file": "c.py", "problem": "Spans\ntwo lines"},\n'
+        ' {"file": "d.py", "line": '
+    )
+    parser = FindingsParser()
+
+    findings = parser.feed(output)
+    parser.close()
+
+    assert findings == [
+        {"file": "a.py", "problem": 'Says "hi" with } and ]'},
+        {"file": "c.py", "problem": "Spans\ntwo lines"},
+    ]
+    assert parser.malformed == 2
+
+
+def test_an_empty_array_is_a_complete_review():
+    parser = FindingsParser()
+
+    assert parser.feed("No issues.\n```json\n[ ]\n```") == []
+    assert parser.complete
+
+    truncated = FindingsParser()
+    assert truncated.feed('[{"file": "a.py"') == []
+    truncated.close()
+    assert not truncated.complete
+    assert truncated.malformed == 1
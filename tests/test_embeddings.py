@@ -0,0 +1,208 @@
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from llm_reviewer import embeddings as embeddings_module
+from llm_reviewer.embeddings import (
+    AcceptableEmbeddings,
+    CachedEmbeddings,
+    DEFAULT_EMBEDDING_MODEL,
+    Embedding,
+    embedding_backends,
+)
+from llm_reviewer.onnx_embeddings import OnnxEmbeddings
+
+WORDS = "the quick brown fox jumps over lazy dog".split()
+
+TEXTS = [
+    "Functions must be named after the action they perform.",
+    "Avoid catching broad exceptions, catch the ones you can handle.",
+    "Prefer dependency injection to global state.",
+    "def add(a, b):\n    return a + b",
+    "SQL queries must use bound parameters, never string formatting.",
+    "Tests live next to the module they cover.",
+]
+
+
+class FakeSession:
+    """
+    Stands in for an ONNX Runtime session: each token vector is the one-hot
+    encoding of its id, so a mean pooled vector only depends on the tokens.
+    """
+
+    def __init__(self, inputs: List[str], size: int):
+        self.inputs = inputs
+        self.size = size
+        self.shapes = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name=name) for name in self.inputs]
+
+    def run(self, outputs, feeds):
+        assert set(feeds) == set(self.inputs)
+        self.shapes.append(feeds["input_ids"].shape)
+        return [np.eye(self.size, dtype=np.float32)[feeds["input_ids"]]]
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """
+    Fake embedding model recording the texts it embeds.
+    """
+
+    embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.embedded.append(text)
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Makes every cache access one second later than the previous one, so
+    the least recently used entries are deterministic.
+    """
+    ticks = iter(range(1, 1_000_000))
+    monkeypatch.setattr(
+        embeddings_module, "time", SimpleNamespace(time=lambda: next(ticks))
+    )
+
+
+def cached_embedding(path, model_name: str = "model", **kwargs) -> CachedEmbeddings:
+    return CachedEmbeddings(
+        embedding=CountingEmbedding(size=4, embedded=[]),
+        model_name=model_name,
+        path=str(path),
+        **kwargs,
+    )
+
+
+def word_tokenizer():
+    tokenizers = pytest.importorskip("tokenizers")
+    vocab = {"[PAD]": 0, "[UNK]": 1, **{word: i + 2 for i, word in enumerate(WORDS)}}
+    tokenizer = tokenizers.Tokenizer(
+        tokenizers.models.WordLevel(vocab, unk_token="[UNK]")
+    )
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    return tokenizer
+
+
+def test_embedding_loads_the_registered_backend(monkeypatch):
+    fake = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setitem(embedding_backends, "fake", lambda: fake)
+
+    assert Embedding("fake").embedding is fake
+    assert Embedding("unknown").embedding is None
+    assert AcceptableEmbeddings.OPEN_AI == AcceptableEmbeddings.HUGGING_FACE
+
+
+def test_onnx_embeddings_batch_texts_of_similar_length():
+    session = FakeSession(["input_ids", "attention_mask"], size=len(WORDS) + 2)
+    embeddings = OnnxEmbeddings(
+        session=session,
+        tokenizer=word_tokenizer(),
+        model_name="fake",
+        batch_size=2,
+        max_length=6,
+    )
+    texts = ["the quick brown fox jumps over lazy dog", "dog", "the fox", "lazy"]
+
+    vectors = embeddings.embed_documents(texts)
+
+    assert session.shapes == [(2, 1), (2, 6)]
+    # Batched in the given order the texts would take 6 padding tokens
+    assert embeddings.padding == 4
+    # Padding never changes the vector of a text
+    for text, vector in zip(texts, vectors):
+        assert vector == pytest.approx(embeddings.embed_query(text))
+    assert np.linalg.norm(vectors[0]) == pytest.approx(1.0)
+    assert vectors[1] != pytest.approx(vectors[3])
+
+
+def test_onnx_embeddings_match_the_sentence_transformers_model():
+    pytest.importorskip("onnxruntime")
+    huggingface = pytest.importorskip("langchain_huggingface")
+    try:
+        reference = huggingface.HuggingFaceEmbeddings(
+            model_name=DEFAULT_EMBEDDING_MODEL
+        )
+        quantized = OnnxEmbeddings.from_pretrained(DEFAULT_EMBEDDING_MODEL)
+    except Exception as error:
+        pytest.skip(f"model not available: {error}")
+
+    expected = np.array(reference.embed_documents(TEXTS))
+    actual = np.array(quantized.embed_documents(TEXTS))
+
+    similarity = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    assert similarity.min() > 0.99
+
+
+def test_cached_embeddings_only_embed_new_texts(tmp_path):
+    cached = cached_embedding(tmp_path / "cache.db")
+    model = cached.embedding
+
+    first = cached.embed_documents(["a", "b", "a"])
+    second = cached.embed_documents(["b", "c"])
+
+    assert model.embedded == ["a", "b", "c"]
+    assert second[0] == first[1]
+    assert second[1] == model.embed_documents(["c"])[0]
+    # Repeated texts of a call are embedded once but not counted as hits
+    assert cached.stats()["hits"] == 1
+    assert cached.stats()["misses"] == 4
+
+    # Queries and documents with the same text are cached separately
+    cached.embed_query("a")
+    assert model.embedded[-1] == "a"
+    assert cached.stats()["disk_entries"] == 4
+
+
+def test_cached_embeddings_are_reused_from_disk(tmp_path):
+    cached_embedding(tmp_path / "cache.db").embed_documents(["a", "b"])
+
+    reopened = cached_embedding(tmp_path / "cache.db")
+    reopened.embed_documents(["a", "b"])
+
+    assert reopened.embedding.embedded == []
+    assert reopened.stats()["hits"] == 2
+
+
+def test_cached_embeddings_evict_the_least_recently_used(tmp_path, clock):
+    cached = cached_embedding(tmp_path / "cache.db", max_entries=2, memory_entries=1)
+    cached.embed_documents(["a"])
+    cached.embed_documents(["b"])
+    cached.embed_documents(["a"])
+    cached.embed_documents(["c"])
+
+    assert cached.stats()["disk_entries"] == 2
+    assert cached.stats()["memory_entries"] == 1
+
+    reopened = cached_embedding(tmp_path / "cache.db")
+    reopened.embed_documents(["a", "b", "c"])
+
+    assert reopened.embedding.embedded == ["b"]
+
+
+def test_cached_embeddings_are_isolated_by_model(tmp_path, clock):
+    first = cached_embedding(tmp_path / "cache.db", model_name="first", max_entries=1)
+    second = cached_embedding(tmp_path / "cache.db", model_name="second")
+    first.embed_documents(["a"])
+    second.embed_documents(["a", "b"])
+
+    # Evicting the entries of one model leaves the others alone
+    first.embed_documents(["c"])
+
+    assert second.embedding.embedded == ["a", "b"]
+    assert first.stats()["disk_entries"] == 1
+    assert second.stats()["disk_entries"] == 2
+    second.embed_documents(["a", "b"])
+    assert second.stats()["hits"] == 2
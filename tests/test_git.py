@@ -0,0 +1,191 @@
+import pytest
+
+from llm_reviewer.diff import format_file_change
+from llm_reviewer.git import MAX_BLOB_BYTES, Git
+from llm_reviewer.resources import resource_pool, ResourceKind
+from llm_reviewer.tracing import tracer
+from tests.gitlab_server import FakeGitLab
+
+CHANGES = [
+    {"old_path": "app.py", "new_path": "app.py", "diff": "@@ -1 +1 @@\n-a\n+b\n"},
+    {"old_path": "lib.py", "new_path": "lib.py", "diff": "@@ -1 +1 @@\n-c\n+d\n"},
+]
+
+
+@pytest.fixture
+def gitlab():
+    resource_pool.invalidate(ResourceKind.GIT)
+    with FakeGitLab() as server:
+        server.add_merge_request("1", "2", sha="abc123", changes=CHANGES)
+        yield server
+    resource_pool.invalidate(ResourceKind.GIT)
+
+
+def test_get_client_is_shared_per_url_and_token(gitlab):
+    client = Git.get_client(token="token", url=gitlab.url)
+
+    assert Git.get_client(token="token", url=gitlab.url) is client
+    assert Git.get_client(token="other", url=gitlab.url) is not client
+
+
+def test_reviews_reuse_auth_and_connection(gitlab):
+    for _ in range(2):
+        git = Git.get_client(token="token", url=gitlab.url).for_review()
+        changes = [
+            format_file_change(change)
+            for change in git.iter_changes(project_id="1", merge_request_iid=2)
+        ]
+        git.get_diff_refs(project_id="1", merge_request_iid=2)
+        git.get_diff_refs(project_id="1", merge_request_iid=2)
+        git.write_comment(
+            project_id="1",
+            merge_request_iid=2,
+            comment="# Code Review Documentation",
+        )
+
+    assert changes == [
+        "File: app.py\n@@ -1 +1 @@\n-a\n+b\n",
+        "File: lib.py\n@@ -1 +1 @@\n-c\n+d\n",
+    ]
+    assert gitlab.count("GET", "user") == 1
+    assert gitlab.count("GET", "merge_request") == 2
+    assert gitlab.count("GET", "diffs") == 2
+    assert gitlab.count("POST", "notes") == 1
+    assert gitlab.count("PUT", "note") == 1
+    assert gitlab.total_requests() == 9
+    assert gitlab.connections == 1
+
+
+def test_write_comment_updates_stored_note_directly(gitlab):
+    for index in range(45):
+        gitlab.add_note("1", "2", f"human comment {index}")
+    review_note_id = gitlab.add_note("1", "2", "# Code Review Documentation\nold")
+    git = Git.get_client(token="token", url=gitlab.url)
+
+    note_id = git.write_comment(project_id="1", merge_request_iid=2, comment="a")
+    scanned_pages = gitlab.count("GET", "discussions")
+    git.write_comment(project_id="1", merge_request_iid=2, comment="b", note_id=note_id)
+
+    assert note_id == review_note_id
+    assert scanned_pages == 3
+    assert gitlab.count("GET", "discussions") == scanned_pages
+    assert gitlab.count("PUT", "note") == 2
+    assert gitlab.notes[("1", "2")][-1]["body"] == "b"
+
+
+def test_write_comment_scans_when_stored_note_is_stale(gitlab):
+    review_note_id = gitlab.add_note("1", "2", "# Code Review Documentation\nold")
+    git = Git.get_client(token="token", url=gitlab.url)
+
+    note_id = git.write_comment(
+        project_id="1", merge_request_iid=2, comment="new", note_id=999
+    )
+
+    assert note_id == review_note_id
+    assert gitlab.count("GET", "discussions") == 1
+    assert gitlab.notes[("1", "2")][0]["body"] == "new"
+
+
+def test_iter_changes_fetches_pages_lazily(gitlab):
+    changes = [
+        {"old_path": f"f{i}.py", "new_path": f"f{i}.py", "diff": f"@@ -1 +1 @@\n+{i}\n"}
+        for i in range(25)
+    ]
+    gitlab.add_merge_request("1", "3", sha="def456", changes=changes)
+    git = Git.get_client(token="token", url=gitlab.url)
+
+    stream = git.iter_changes(project_id="1", merge_request_iid=3, page_size=10)
+    first = next(stream)
+
+    assert first["path"] == "f0.py"
+    assert first["hunks"] == ["@@ -1 +1 @@\n+0\n"]
+    assert gitlab.count("GET", "diffs") == 1
+    assert len(list(stream)) == 24
+    assert gitlab.count("GET", "diffs") == 3
+
+
+def test_iter_changes_diffs_files_too_large_for_gitlab(gitlab):
+    changes = [
+        {"old_path": "big.py", "new_path": "big.py", "diff": "", "too_large": True},
+        {
+            "old_path": "new.py",
+            "new_path": "new.py",
+            "diff": "",
+            "new_file": True,
+            "too_large": True,
+        },
+        {"old_path": "img.bin", "new_path": "img.bin", "diff": "", "collapsed": True},
+        {"old_path": "a.py", "new_path": "b.py", "diff": "", "renamed_file": True},
+        {"old_path": "empty.py", "new_path": "empty.py", "diff": "", "new_file": True},
+        {
+            "old_path": "huge.py",
+            "new_path": "huge.py",
+            "diff": "",
+            "too_large": True,
+            "new_file": True,
+        },
+    ]
+    gitlab.add_merge_request("1", "3", sha="head", changes=changes)
+    gitlab.add_file("1", "base", "big.py", b"one\ntwo\nthree\n")
+    gitlab.add_file("1", "head", "big.py", b"one\n2\nthree\n")
+    gitlab.add_file("1", "head", "new.py", b"print('hi')\n")
+    gitlab.add_file("1", "base", "img.bin", b"\x89PNG\x00")
+    gitlab.add_file("1", "head", "img.bin", b"\x89PNG\x00\x01")
+    gitlab.add_file("1", "head", "huge.py", b"x" * (MAX_BLOB_BYTES + 1))
+    git = Git.get_client(token="token", url=gitlab.url)
+
+    big, new, image, renamed, empty, huge = git.iter_changes(
+        project_id="1", merge_request_iid=3
+    )
+
+    assert big["hunks"] == ["@@ -1,3 +1,3 @@\n one\n-two\n+2\n three\n"]
+    assert not big["too_large"]
+    assert new["hunks"] == ["@@ -0,0 +1 @@\n+print('hi')\n"]
+    assert new["new_file"]
+    assert image["binary"]
+    assert image["hunks"] == ["Binary files a/img.bin and b/img.bin differ\n"]
+    assert renamed["renamed_file"] and renamed["old_path"] == "a.py"
+    assert renamed["hunks"] == []
+    assert empty["new_file"] and empty["hunks"] == []
+    assert not empty["too_large"]
+    assert huge["too_large"] and huge["hunks"] == []
+    assert gitlab.count("GET", "file") == 6
+    assert gitlab.count("GET", "merge_request") == 1
+
+
+def test_iter_changes_falls_back_to_the_changes_endpoint(gitlab):
+    gitlab.diffs_endpoint = False
+    git = Git.get_client(token="token", url=gitlab.url)
+
+    changes = list(git.iter_changes(project_id="1", merge_request_iid=2))
+
+    assert format_file_change(changes[0]) == "File: app.py\n@@ -1 +1 @@\n-a\n+b\n"
+    assert gitlab.count("GET", "changes") == 1
+
+
+def test_iter_changes_records_the_fetch_span(gitlab):
+    git = Git.get_client(token="token", url=gitlab.url)
+
+    with tracer.collect() as spans:
+        changes = list(git.iter_changes(project_id="1", merge_request_iid=2))
+
+    (span,) = [span for span in spans if span.name == "git.get_changes"]
+    assert span.attributes == {"files": len(changes)}
+    assert span.duration > 0
+
+
+def test_each_review_caches_merge_requests_of_its_own(gitlab):
+    def head_sha(git: Git) -> str:
+        return git.get_diff_refs(project_id="1", merge_request_iid=2)["head_sha"]
+
+    client = Git.get_client(token="token", url=gitlab.url)
+    first = client.for_review()
+    assert head_sha(first) == "abc123"
+
+    gitlab.merge_requests[("1", "2")]["sha"] = "def456"
+    second = client.for_review()
+
+    assert head_sha(second) == "def456"
+    assert head_sha(first) == "abc123"
+    assert gitlab.count("GET", "merge_request") == 2
+    assert gitlab.count("GET", "user") == 1
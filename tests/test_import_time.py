@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+# Generous enough for a slow CI runner, small enough to catch a heavy import
+IMPORT_BUDGET_SECONDS = 2.0
+
+# Only loaded when the UI, the vector store or a model is actually used
+HEAVY_MODULES = [
+    "streamlit",
+    "torch",
+    "docling",
+    "langchain_docling",
+    "langchain_chroma",
+    "chromadb",
+    "langchain_openai",
+    "langchain_ollama",
+    "langchain_huggingface",
+    "redis",
+]
+
+SCRIPT = f"""
+import sys
+import llm_reviewer.app
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+def import_app():
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key
+        not in (
+            "GIT_BASE_URL",
+            "CODE_MODEL",
+            "CONVERSATION_MODEL",
+            "API_KEY",
+            "REDIS_HOST",
+            "REDIS_PORT",
+        )
+    }
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True,
+    )
+
+
+def cumulative_seconds(importtime: str, module: str) -> float:
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in importtime.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1_000_000
+    raise AssertionError(f"{module} not found in the import time report")
+
+
+def test_app_imports_without_configuration_or_heavy_modules():
+    result = import_app()
+
+    assert result.stdout.strip() == ""
+    assert cumulative_seconds(result.stderr, "llm_reviewer.app") < (
+        IMPORT_BUDGET_SECONDS
+    )
@@ -0,0 +1,191 @@
+import os
+from typing import Dict, List
+
+import pytest
+
+from llm_reviewer import ingestion
+from llm_reviewer.ingestion import (
+    IngestionManifest,
+    hash_file,
+    remove_document,
+    sync_documents,
+)
+
+
+def convert_text(path: str) -> List[str]:
+    """
+    Stands in for Docling: a file's markdown is its text. Module level so it
+    can be sent to the ingestion worker processes.
+    """
+    if os.path.basename(path).startswith("broken"):
+        raise ValueError("unsupported file")
+    with open(path, encoding="utf-8") as file:
+        return [file.read()]
+
+
+class FakeVectorStore:
+    """
+    Keeps the chunks saved to it by id.
+    """
+
+    def __init__(self):
+        self.chunks: Dict[str, str] = {}
+        self.resets = 0
+
+    def count(self) -> int:
+        return len(self.chunks)
+
+    def reset(self):
+        self.resets += 1
+        self.chunks.clear()
+
+    def save_documents(self, documents, ids: List[str]):
+        for document, id in zip(documents, ids):
+            self.chunks[id] = document.page_content
+
+    def delete_documents(self, ids: List[str]):
+        for id in ids:
+            self.chunks.pop(id, None)
+
+    def sources(self) -> List[str]:
+        return sorted({id.split(":")[0] for id in self.chunks})
+
+
+@pytest.fixture
+def docs_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "docs"
+    directory.mkdir()
+    monkeypatch.setattr(ingestion, "get_docs_dir", lambda: str(directory))
+    return directory
+
+
+def write_doc(docs_dir, name: str, text: str):
+    (docs_dir / name).write_text(text, encoding="utf-8")
+
+
+def guideline(topic: str, paragraphs: int = 4) -> str:
+    return "\n\n".join(
+        f"Rule {index} about {topic}: " + "keep the code simple and readable. " * 8
+        for index in range(paragraphs)
+    )
+
+
+def sync(store, manifest, **kwargs):
+    return sync_documents(
+        store, manifest, max_workers=1, convert=convert_text, **kwargs
+    )
+
+
+def test_sync_documents_only_ingests_what_changed(docs_dir, tmp_path):
+    store = FakeVectorStore()
+    manifest_path = str(tmp_path / "manifest.json")
+    for name in ["naming.md", "errors.md", "tests.md"]:
+        write_doc(docs_dir, name, guideline(name))
+
+    result = sync(store, IngestionManifest(manifest_path))
+
+    assert result["added"] == ["errors.md", "naming.md", "tests.md"]
+    manifest = IngestionManifest(manifest_path)
+    assert store.sources() == sorted(
+        hash_file(str(docs_dir / name)) for name in manifest.files
+    )
+    assert len(store.chunks) == sum(
+        len(entry["chunk_ids"]) for entry in manifest.files.values()
+    )
+
+    old_naming = manifest.get("naming.md")["chunk_ids"]
+    write_doc(docs_dir, "naming.md", guideline("names", paragraphs=2))
+    os.remove(docs_dir / "errors.md")
+    write_doc(docs_dir, "security.md", guideline("security"))
+
+    result = sync(store, manifest)
+
+    assert result == {
+        "added": ["security.md"],
+        "updated": ["naming.md"],
+        "removed": ["errors.md"],
+        "unchanged": ["tests.md"],
+        "failed": [],
+    }
+    reloaded = IngestionManifest(manifest_path)
+    assert sorted(reloaded.files) == ["naming.md", "security.md", "tests.md"]
+    assert not set(old_naming) & set(store.chunks)
+    assert sorted(store.chunks) == sorted(
+        id for entry in reloaded.files.values() for id in entry["chunk_ids"]
+    )
+
+
+def test_syncing_a_single_file_keeps_the_others(docs_dir, tmp_path):
+    store = FakeVectorStore()
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+    write_doc(docs_dir, "naming.md", guideline("naming"))
+    write_doc(docs_dir, "errors.md", guideline("errors"))
+    sync(store, manifest)
+
+    os.remove(docs_dir / "errors.md")
+    write_doc(docs_dir, "naming.md", guideline("names"))
+    result = sync(store, manifest, file_names=["naming.md"])
+
+    assert result["updated"] == ["naming.md"]
+    assert result["removed"] == []
+    assert "errors.md" in manifest.files
+
+
+def test_a_store_without_manifest_is_rebuilt(docs_dir, tmp_path):
+    store = FakeVectorStore()
+    store.chunks["orphan:0"] = "ingested before the manifest existed"
+    write_doc(docs_dir, "naming.md", guideline("naming"))
+
+    result = sync(
+        store, IngestionManifest(str(tmp_path / "manifest.json")), file_names=[]
+    )
+
+    assert store.resets == 1
+    assert result["added"] == ["naming.md"]
+    assert "orphan:0" not in store.chunks
+
+
+def test_remove_document_deletes_its_chunks(docs_dir, tmp_path):
+    store = FakeVectorStore()
+    manifest_path = str(tmp_path / "manifest.json")
+    manifest = IngestionManifest(manifest_path)
+    write_doc(docs_dir, "naming.md", guideline("naming"))
+    write_doc(docs_dir, "errors.md", guideline("errors"))
+    sync(store, manifest)
+    errors_ids = manifest.get("errors.md")["chunk_ids"]
+
+    removed = remove_document(store, manifest, "naming.md")
+
+    assert removed and not set(removed) & set(store.chunks)
+    assert sorted(store.chunks) == sorted(errors_ids)
+    assert list(IngestionManifest(manifest_path).files) == ["errors.md"]
+    assert remove_document(store, manifest, "naming.md") == []
+
+
+def test_files_are_converted_in_a_process_pool(docs_dir, tmp_path):
+    store = FakeVectorStore()
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+    names = [f"guide_{index}.md" for index in range(5)] + ["broken.pdf"]
+    for name in names:
+        write_doc(docs_dir, name, guideline(name))
+    progress = []
+
+    result = sync_documents(
+        store,
+        manifest,
+        max_workers=2,
+        batch_size=2,
+        on_progress=lambda done, total, name: progress.append((done, total, name)),
+        convert=convert_text,
+    )
+
+    assert sorted(result["added"]) == names[:5]
+    assert result["failed"] == ["broken.pdf"]
+    assert [(done, total) for done, total, _ in progress] == [
+        (done, 6) for done in range(1, 7)
+    ]
+    assert sorted(name for _, _, name in progress) == sorted(names)
+    assert "broken.pdf" not in manifest.files
+    assert len(store.chunks) == sum(
+        len(entry["chunk_ids"]) for entry in manifest.files.values()
+    )
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from llm_reviewer import mmap_vector_store
+from llm_reviewer.mmap_vector_store import MmapVectorStore
+from llm_reviewer.vector_store import VectorStore, get_vector_store
+
+
+def guidelines(count: int, prefix: str = "guideline") -> list:
+    return [
+        Document(
+            page_content=f"{prefix} number {index}",
+            metadata={"source": f"{prefix}_{index % 3}.pdf"},
+        )
+        for index in range(count)
+    ]
+
+
+def load(path, documents=None, hnsw_threshold=1_000):
+    return MmapVectorStore(hnsw_threshold=hnsw_threshold).load(
+        path=str(path),
+        collection_name="guidelines",
+        embedding=DeterministicFakeEmbedding(size=16),
+        documents=documents,
+    )
+
+
+def test_search_matches_chroma_on_the_same_corpus(tmp_path):
+    documents = guidelines(40)
+    ids = [f"doc-{index}" for index in range(len(documents))]
+    embedding = DeterministicFakeEmbedding(size=16)
+    chroma = VectorStore().load(
+        path=str(tmp_path / "chroma"), collection_name="guidelines", embedding=embedding
+    )
+    chroma.save_documents(documents, ids=ids)
+    mmap = load(tmp_path / "mmap")
+    mmap.save_documents(documents, ids=ids)
+
+    for query in ["guideline number 7", "def foo(): pass"]:
+        expected = chroma.get_retriever_from_similar(query, k=5)
+        actual = mmap.get_retriever_from_similar(query, k=5)
+
+        assert [doc.id for doc in actual.documents] == [
+            doc.id for doc in expected.documents
+        ]
+        assert actual.scores == pytest.approx(expected.scores, rel=1e-4, abs=1e-4)
+        assert actual.documents[0].metadata == expected.documents[0].metadata
+
+    hunks = ["guideline number 1", "guideline number 30", "unrelated"]
+    assert [doc.id for doc in mmap.get_retriever_from_hunks(hunks, k=3).documents] == [
+        doc.id for doc in chroma.get_retriever_from_hunks(hunks, k=3).documents
+    ]
+    VectorStore.clear_cache()
+
+
+def test_updates_are_persisted_and_reloaded(tmp_path):
+    store = load(tmp_path)
+    store.save_documents(guidelines(3), ids=["a", "b", "c"])
+    store.save_documents([Document(page_content="updated b")], ids=["b"])
+    store.delete_documents(["a", "missing"])
+
+    reopened = load(tmp_path)
+
+    assert reopened.count() == 2
+    documents = reopened.get_query("updated b", k=10)
+    assert sorted(doc.id for doc in documents) == ["b", "c"]
+    assert documents[0].page_content == "updated b"
+
+    reopened.reset()
+    assert load(tmp_path).count() == 0
+    assert load(tmp_path).get_query("anything", k=3) == []
+
+
+def test_hnsw_index_returns_the_exact_neighbours(tmp_path):
+    documents = guidelines(200)
+    ids = [f"doc-{index}" for index in range(len(documents))]
+    exact = load(tmp_path / "exact")
+    exact.save_documents(documents, ids=ids)
+    indexed = load(tmp_path / "hnsw", hnsw_threshold=50)
+    indexed.save_documents(documents[:100], ids=ids[:100])
+    indexed.save_documents(documents[100:], ids=ids[100:])
+    exact.delete_documents(["doc-5"])
+    indexed.delete_documents(["doc-5"])
+
+    assert os.path.exists(tmp_path / "hnsw" / "guidelines.hnsw")
+    reopened = load(tmp_path / "hnsw", hnsw_threshold=50)
+    for query in ["guideline number 5", "guideline number 150"]:
+        expected = exact.get_retriever_from_similar(query, k=4)
+        actual = reopened.get_retriever_from_similar(query, k=4)
+        assert [doc.id for doc in actual.documents] == [
+            doc.id for doc in expected.documents
+        ]
+        assert actual.scores == pytest.approx(expected.scores, rel=1e-4, abs=1e-4)
+
+
+def test_deleted_rows_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(mmap_vector_store, "COMPACT_MIN_ROWS", 2)
+    store = load(tmp_path, documents=guidelines(10))
+    vectors = tmp_path / "guidelines.vectors.f32"
+    size = os.path.getsize(vectors)
+
+    ids = [doc.id for doc in store.get_query("guideline", k=10)]
+    store.delete_documents(ids[:6])
+
+    assert os.path.getsize(vectors) == size * 4 // 10
+    assert sorted(doc.id for doc in load(tmp_path).get_query("x", k=10)) == sorted(
+        ids[6:]
+    )
+
+
+def test_vector_store_backend_is_configured(monkeypatch):
+    assert isinstance(get_vector_store(), VectorStore)
+
+    monkeypatch.setenv("VECTOR_STORE", "mmap")
+    assert isinstance(get_vector_store(), MmapVectorStore)
+
+    with pytest.raises(ValueError):
+        get_vector_store("unknown")
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from llm_reviewer.resources import ResourceKind, ResourcePool
+
+
+def test_get_builds_each_resource_once():
+    pool = ResourcePool()
+    built = []
+
+    def factory(name: str):
+        def build():
+            built.append(name)
+            return object()
+
+        return build
+
+    first = pool.get((ResourceKind.LLM, "code"), factory("code"))
+
+    assert pool.get((ResourceKind.LLM, "code"), factory("code")) is first
+    assert pool.get((ResourceKind.LLM, "chat"), factory("chat")) is not first
+    assert built == ["code", "chat"]
+
+
+def test_concurrent_gets_wait_for_a_single_build():
+    pool = ResourcePool()
+    builds = []
+    started = threading.Barrier(8)
+
+    def build():
+        builds.append(threading.get_ident())
+        time.sleep(0.05)
+        return object()
+
+    results = []
+
+    def get():
+        started.wait()
+        results.append(pool.get((ResourceKind.EMBEDDING, "model"), build))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+
+
+def test_slow_builds_do_not_block_other_keys():
+    pool = ResourcePool()
+    building = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        building.set()
+        release.wait(1)
+        return "slow"
+
+    thread = threading.Thread(target=pool.get, args=((ResourceKind.LLM, "a"), slow))
+    thread.start()
+    building.wait(1)
+
+    assert pool.get((ResourceKind.LLM, "b"), lambda: "fast") == "fast"
+    release.set()
+    thread.join()
+    assert pool.get((ResourceKind.LLM, "a"), lambda: "rebuilt") == "slow"
+
+
+def test_invalidate_drops_resources_by_kind():
+    pool = ResourcePool()
+    pool.put((ResourceKind.LLM, "code"), "code model")
+    pool.put((ResourceKind.GIT, "url"), "git client")
+
+    assert pool.peek((ResourceKind.LLM, "code")) == "code model"
+    assert pool.invalidate(ResourceKind.LLM) == 1
+    assert pool.peek((ResourceKind.LLM, "code")) is None
+    assert pool.get((ResourceKind.LLM, "code"), lambda: "reloaded") == "reloaded"
+    assert pool.get((ResourceKind.GIT, "url"), lambda: "reloaded") == "git client"
+
+    assert pool.invalidate() == 2
+    assert pool.invalidate() == 0
+    assert pool.get((ResourceKind.GIT, "url"), lambda: "reloaded") == "reloaded"
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from llm_reviewer.stages import StageGraph
+from llm_reviewer.tracing import Tracer
+
+
+def sleeping(seconds: float, value=None):
+    def stage(*arguments):
+        time.sleep(seconds)
+        return value if value is not None else arguments
+
+    return stage
+
+
+def test_independent_stages_run_concurrently():
+    graph = StageGraph()
+    graph.add("knowledge_base", sleeping(0.2, "store"))
+    graph.add("load_models", sleeping(0.2, "models"))
+    graph.add("diff_fetch", sleeping(0.1, "changes"))
+    graph.add("retrieval", sleeping(0.1), "knowledge_base", "diff_fetch")
+
+    results = graph.run()
+
+    assert results["retrieval"] == ("store", "changes")
+    assert graph.elapsed < 0.45
+    retrieval_start = graph.timings["retrieval"][0]
+    assert retrieval_start >= graph.timings["knowledge_base"][1]
+    assert retrieval_start >= graph.timings["diff_fetch"][1]
+
+    path, seconds = graph.critical_path()
+    assert path == ["knowledge_base", "retrieval"]
+    assert seconds == pytest.approx(0.3, abs=0.05)
+
+
+def test_failing_stage_stops_its_dependents():
+    called = []
+    graph = StageGraph()
+    graph.add("diff_fetch", lambda: 1 / 0)
+    graph.add("retrieval", lambda changes: called.append(changes), "diff_fetch")
+
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+
+    assert called == []
+    assert "retrieval" not in graph.timings
+
+
+def test_stages_must_be_added_after_their_dependencies():
+    graph = StageGraph()
+
+    with pytest.raises(ValueError):
+        graph.add("retrieval", lambda: None, "knowledge_base")
+
+
+def test_stage_spans_are_nested_in_the_caller_span():
+    tracer = Tracer()
+
+    def traced(name):
+        def stage():
+            with tracer.span(name):
+                pass
+
+        return stage
+
+    graph = StageGraph()
+    graph.add("knowledge_base", traced("knowledge_base"))
+    graph.add("diff_fetch", traced("diff_fetch"))
+
+    with tracer.collect() as spans:
+        with tracer.span("review"):
+            graph.run()
+
+    by_name = {span.name: span for span in spans}
+    assert set(by_name) == {"knowledge_base", "diff_fetch", "review"}
+    assert by_name["diff_fetch"].parent_id == by_name["review"].span_id
+    assert by_name["knowledge_base"].parent_id == by_name["review"].span_id
@@ -0,0 +1,92 @@
+import json
+import threading
+
+from langchain_core.runnables import RunnableLambda
+
+from llm_reviewer.tracing import Tracer, summarize
+from tests.benchmark import FakeChatModel
+
+
+def test_spans_are_nested_and_collected_per_review():
+    tracer = Tracer()
+
+    with tracer.collect() as spans:
+        with tracer.span("review"):
+            with tracer.span("retrieval", hunks=3):
+                pass
+            tracer.record("convert_to_markdown", 0.5, file="guide.pdf")
+
+    outside = []
+    with tracer.collect() as other_spans:
+        thread = threading.Thread(target=lambda: tracer.record("other", 0.1))
+        thread.start()
+        thread.join()
+        outside.extend(other_spans)
+
+    by_name = {span.name: span for span in spans}
+    assert [span.name for span in spans] == [
+        "retrieval",
+        "convert_to_markdown",
+        "review",
+    ]
+    assert by_name["retrieval"].parent_id == by_name["review"].span_id
+    assert by_name["convert_to_markdown"].duration == 0.5
+    assert len({span.trace_id for span in spans}) == 1
+    assert outside == []
+    assert summarize(spans)["convert_to_markdown"]["seconds"] == 0.5
+
+
+def test_llm_callback_records_tokens_of_batched_calls():
+    tracer = Tracer()
+    model = FakeChatModel(respond=lambda prompt: "three output tokens")
+    chain = RunnableLambda(lambda inputs: model.batch(inputs))
+
+    with tracer.collect() as spans:
+        chain.invoke(["a", "b"], config={"callbacks": [tracer.callback]})
+
+    llm_spans = [span for span in spans if span.name == "llm"]
+    assert len(llm_spans) == 2
+    assert summarize(spans)["llm"]["completion_tokens"] == 6
+    assert 'type="completion"} 6' in tracer.metrics.to_prometheus()
+
+
+def test_prometheus_histogram_is_cumulative():
+    tracer = Tracer()
+    for duration in (0.003, 0.2, 200):
+        tracer.record("retrieval", duration)
+
+    lines = tracer.metrics.to_prometheus().splitlines()
+
+    assert (
+        'llm_reviewer_stage_duration_seconds_bucket{stage="retrieval",le="0.005"} 1'
+        in lines
+    )
+    assert (
+        'llm_reviewer_stage_duration_seconds_bucket{stage="retrieval",le="0.25"} 2'
+        in lines
+    )
+    assert (
+        'llm_reviewer_stage_duration_seconds_bucket{stage="retrieval",le="+Inf"} 3'
+        in lines
+    )
+    assert 'llm_reviewer_stage_duration_seconds_count{stage="retrieval"} 3' in lines
+
+
+def test_otlp_export_appends_one_line_per_review(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACE_EXPORT", "otlp")
+    monkeypatch.setenv("TRACE_EXPORT_PATH", str(path))
+    tracer = Tracer()
+
+    for _ in range(2):
+        with tracer.collect() as spans:
+            with tracer.span("review", files=2):
+                pass
+        tracer.export(spans)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    span = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert len(lines) == 2
+    assert span["name"] == "review"
+    assert span["attributes"] == [{"key": "files", "value": {"intValue": "2"}}]
+    assert int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
@@ -0,0 +1,131 @@
+import time
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from llm_reviewer.diff import split_hunks
+from llm_reviewer.vector_store import VectorStore
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    embed_query_calls: int = 0
+    embed_documents_calls: int = 0
+    latency: float = 0.0
+
+    def embed_query(self, text: str) -> List[float]:
+        self.embed_query_calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embed_documents_calls += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+
+def load_guidelines(path, embedding, count=8):
+    documents = [
+        Document(page_content=f"guideline number {index}") for index in range(count)
+    ]
+    store = VectorStore().load(
+        path=str(path),
+        collection_name="guidelines",
+        embedding=embedding,
+        documents=documents,
+    )
+    embedding.embed_query_calls = 0
+    embedding.embed_documents_calls = 0
+    return store
+
+
+def build_diff(files: int) -> str:
+    return "\n\n".join(
+        f"File: src/module_{index}.py\n@@ -1,2 +1,2 @@\n-old_{index}()\n+new_{index}()"
+        for index in range(files)
+    )
+
+
+def test_get_retriever_from_similar_embeds_only_the_query(tmp_path):
+    embedding = CountingEmbedding(size=16)
+    store = load_guidelines(tmp_path, embedding)
+
+    retriever = store.get_retriever_from_similar(query="def foo(): pass", k=3)
+    retrieved = retriever.invoke("def foo(): pass")
+
+    assert embedding.embed_query_calls == 1
+    assert embedding.embed_documents_calls == 0
+    assert len(retrieved) == 3
+    assert len(retriever.scores) == 3
+    assert len(retriever.embeddings) == 3
+    assert all(len(vector) == 16 for vector in retriever.embeddings)
+    assert retriever.scores == sorted(retriever.scores)
+
+
+def test_get_retriever_from_hunks_embeds_all_hunks_in_one_batch(tmp_path):
+    embedding = CountingEmbedding(size=16)
+    store = load_guidelines(tmp_path, embedding)
+    hunks = split_hunks(build_diff(files=6))
+
+    retriever = store.get_retriever_from_hunks(hunks, k=3, max_chars=60)
+    retrieved = retriever.invoke("ignored")
+
+    assert len(hunks) == 6
+    assert embedding.embed_documents_calls == 1
+    assert embedding.embed_query_calls == 0
+    assert len({document.id for document in retrieved}) == len(retrieved)
+    assert sum(len(document.page_content) for document in retrieved) <= 60
+    assert len(retriever.scores) == len(retriever.embeddings) == len(retrieved)
+
+
+def test_benchmark_single_queries_against_batched_hunks(tmp_path):
+    embedding = CountingEmbedding(size=16, latency=0.01)
+    store = load_guidelines(tmp_path, embedding, count=64)
+    hunks = split_hunks(build_diff(files=32))
+
+    started = time.perf_counter()
+    for hunk in hunks:
+        store.get_retriever_from_similar(query=hunk, k=4)
+    single_elapsed = time.perf_counter() - started
+    single_calls = embedding.embed_query_calls
+
+    embedding.embed_query_calls = 0
+    started = time.perf_counter()
+    store.get_retriever_from_hunks(hunks, k=4)
+    batched_elapsed = time.perf_counter() - started
+
+    print(
+        f"\n{len(hunks)} hunks: {single_calls} single queries in "
+        f"{single_elapsed * 1000:.1f}ms, {embedding.embed_documents_calls} "
+        f"batched query in {batched_elapsed * 1000:.1f}ms"
+    )
+    assert single_calls == len(hunks)
+    assert embedding.embed_documents_calls == 1
+    assert batched_elapsed < single_elapsed
+
+
+@pytest.mark.parametrize("embeddings", [None, [], [[]]])
+def test_hits_are_kept_when_chroma_returns_no_embeddings(
+    tmp_path, monkeypatch, embeddings
+):
+    embedding = CountingEmbedding(size=16)
+    store = load_guidelines(tmp_path, embedding)
+    collection = store.store._collection
+    query = collection.query
+
+    def query_without_embeddings(**kwargs):
+        results = query(**kwargs)
+        results["embeddings"] = embeddings
+        return results
+
+    monkeypatch.setattr(collection, "query", query_without_embeddings)
+
+    similar = store.get_retriever_from_similar(query="def foo(): pass", k=3)
+    hunks = store.get_retriever_from_hunks(split_hunks(build_diff(files=2)), k=3)
+
+    assert len(similar.invoke("ignored")) == 3
+    assert similar.scores == sorted(similar.scores)
+    assert similar.embeddings == [[], [], []]
+    assert len(hunks.invoke("ignored")) >= 3
+    assert len(hunks.scores) == len(hunks.embeddings)
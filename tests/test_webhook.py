@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from llm_reviewer.webhook import WebhookIntake, create_app
+
+SECRET = "webhook-secret"
+
+
+def merge_request_event(
+    mr_iid: int, head_sha: str, action: str = "update", oldrev: str = "previous"
+):
+    attributes = {
+        "iid": mr_iid,
+        "action": action,
+        "last_commit": {"id": head_sha},
+    }
+    if oldrev:
+        attributes["oldrev"] = oldrev
+    return {
+        "object_kind": "merge_request",
+        "project": {"id": 7},
+        "object_attributes": attributes,
+    }
+
+
+def run_intake(scenario, debounce: float = 0.05):
+    jobs = []
+
+    async def enqueue(job):
+        jobs.append(job)
+
+    intake = WebhookIntake(secret=SECRET, enqueue=enqueue, debounce=debounce)
+
+    async def run():
+        async with TestClient(TestServer(create_app(intake))) as client:
+
+            async def send(payload, token=SECRET):
+                headers = {"X-Gitlab-Token": token} if token is not None else {}
+                response = await client.post("/webhook", json=payload, headers=headers)
+                return response.status
+
+            result = await scenario(send)
+            await asyncio.sleep(min(debounce * 4, 0.2))
+            return result
+
+    return asyncio.run(run()), jobs, intake
+
+
+def test_burst_of_pushes_is_reviewed_once():
+    async def scenario(send):
+        for i in range(10):
+            assert await send(merge_request_event(1, f"sha-{i}")) == 202
+
+    _, jobs, intake = run_intake(scenario)
+
+    assert jobs == [{"project_id": "7", "mr_iid": "1", "head_sha": "sha-9"}]
+    assert intake.received == 10
+    assert intake.enqueued == 1
+
+
+def test_merge_requests_are_coalesced_separately():
+    async def scenario(send):
+        for i in range(3):
+            await send(merge_request_event(1, f"a-{i}"))
+            await send(merge_request_event(2, f"b-{i}"))
+
+    _, jobs, _ = run_intake(scenario)
+
+    assert sorted((job["mr_iid"], job["head_sha"]) for job in jobs) == [
+        ("1", "a-2"),
+        ("2", "b-2"),
+    ]
+
+
+def test_pushes_after_the_window_are_reviewed_again():
+    async def scenario(send):
+        await send(merge_request_event(1, "first"))
+        await asyncio.sleep(0.2)
+        await send(merge_request_event(1, "second"))
+
+    _, jobs, _ = run_intake(scenario)
+
+    assert [job["head_sha"] for job in jobs] == ["first", "second"]
+
+
+def test_invalid_token_is_rejected():
+    async def scenario(send):
+        return await send(merge_request_event(1, "sha"), token="wrong")
+
+    status, jobs, intake = run_intake(scenario)
+
+    assert status == 401
+    assert jobs == []
+    assert intake.received == 0
+
+
+def test_request_without_token_is_rejected_with_an_empty_secret():
+    async def enqueue(job):
+        raise AssertionError("an unauthenticated request was enqueued")
+
+    with pytest.raises(ValueError):
+        WebhookIntake(secret="", enqueue=enqueue)
+
+    intake = WebhookIntake(secret=SECRET, enqueue=enqueue, debounce=0)
+    intake.secret = ""
+
+    async def run():
+        async with TestClient(TestServer(create_app(intake))) as client:
+            response = await client.post("/webhook", json=merge_request_event(1, "sha"))
+            return response.status
+
+    assert asyncio.run(run()) == 401
+    assert intake.received == 0
+
+
+def test_events_without_new_commits_are_ignored():
+    async def scenario(send):
+        await send(merge_request_event(1, "sha", oldrev=""))
+        await send(merge_request_event(1, "sha", action="close"))
+        await send({"object_kind": "push"})
+
+    _, jobs, intake = run_intake(scenario)
+
+    assert jobs == []
+    assert intake.received == 3
+
+
+def test_pending_jobs_are_flushed_on_shutdown():
+    async def scenario(send):
+        await send(merge_request_event(1, "sha", action="open", oldrev=""))
+
+    _, jobs, _ = run_intake(scenario, debounce=60)
+
+    assert jobs == [{"project_id": "7", "mr_iid": "1", "head_sha": "sha"}]